@@ -1,26 +1,51 @@
 
 from flask import Flask, render_template, request, redirect, url_for, jsonify, session, flash, make_response
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from collections import defaultdict
 from datetime import datetime
 from waitress import serve
 import os
+import hmac
 import secrets
-from modules.data_manager import load_financial_data, save_financial_data, get_default_financial_data
+from modules.data_manager import (
+    load_financial_data,
+    load_financial_snapshot,
+    save_financial_data,
+    get_default_financial_data,
+    append_entry,
+    update_entry,
+    remove_entry,
+    remove_entries_by_field,
+    update_settings
+)
 from modules.calculations import (
-    calculate_remaining_capital,
-    calculate_monthly_savings,
-    calculate_total_savings,
-    calculate_total_expenses_from_savings,
     calculate_net_income,
-    calculate_total_daily_net_income
+    calculate_summary
+)
+from modules import vector_calculations
+from modules.aggregates import get_aggregates
+from modules import amortization
+from modules import projection
+from modules.currency import (
+    SUPPORTED_CURRENCIES,
+    DEFAULT_CURRENCY,
+    rate_setting,
+    rate_snapshot,
+    rate_table,
+    rates_version,
+    conversion_table,
+    historical_conversion
 )
 from modules.exchange_rate_api import ExchangeRateAPI
+from modules.rate_history import init_rate_history, start_rate_refresher, record_rates, load_history, history_version
+from modules.cache import get_or_load, get_cached, set_cache
+from modules.metrics import collect_metrics, render_prometheus
 from modules.auth_manager import (
     init_db, 
     create_user, 
     verify_user, 
-    get_user_by_id
+    get_user_by_id,
+    invalidate_user,
+    SERVER_THREADS
 )
 
 app = Flask(__name__)
@@ -48,6 +73,9 @@ init_connection_pool()
 from modules.financial_db import init_financial_tables
 init_financial_tables()
 
+# Exchange rate history (kept current by the refresher the server entry point starts)
+init_rate_history()
+
 @app.context_processor
 def inject_datetime():
     return {'datetime': datetime}
@@ -70,93 +98,171 @@ def get_currency_rate(settings_data):
     """Get the exchange rate for the selected target currency"""
     target_currency = settings_data.get('target_currency', 'AUD')
     
-    # Default rates (will be updated by API)
-    rate_map = {
-        'AUD': settings_data.get('bdt_to_aud_rate', 0.0127),
-        'USD': settings_data.get('bdt_to_usd_rate', 0.0091),
-        'NZD': settings_data.get('bdt_to_nzd_rate', 0.0135),
-        'GBP': settings_data.get('bdt_to_gbp_rate', 0.0072),
-        'CAD': settings_data.get('bdt_to_cad_rate', 0.0124),
-        'EUR': settings_data.get('bdt_to_eur_rate', 0.0085),
-        'SGD': settings_data.get('bdt_to_sgd_rate', 0.0122),
-        'MYR': settings_data.get('bdt_to_myr_rate', 0.0411),
-        'JPY': settings_data.get('bdt_to_jpy_rate', 1.35),
-        'KRW': settings_data.get('bdt_to_krw_rate', 12.10),
-        'CNY': settings_data.get('bdt_to_cny_rate', 0.066),
-        'INR': settings_data.get('bdt_to_inr_rate', 0.76),
-        'THB': settings_data.get('bdt_to_thb_rate', 0.31),
-        'CHF': settings_data.get('bdt_to_chf_rate', 0.0081),
-        'SEK': settings_data.get('bdt_to_sek_rate', 0.095),
-        'NOK': settings_data.get('bdt_to_nok_rate', 0.098),
-        'DKK': settings_data.get('bdt_to_dkk_rate', 0.063),
-        'AED': settings_data.get('bdt_to_aed_rate', 0.033),
-        'SAR': settings_data.get('bdt_to_sar_rate', 0.034)
-    }
+    # Latest refreshed rates (or the user's newer fetched ones, then defaults)
+    rate_map = rate_table(settings_data)
     
-    return rate_map.get(target_currency, 0.0127), target_currency
+    return rate_map.get(target_currency, SUPPORTED_CURRENCIES['AUD']), target_currency
 
-def get_all_financial_data():
-    """Load financial data based on user authentication status"""
+def entered_currency():
+    """Display currency new and edited daily / cash flow amounts are entered in (stored with them)"""
+    snapshot = load_user_snapshot()
+    settings_data = snapshot.data.get('settings', {}) if snapshot and snapshot.data else {}
+    return settings_data.get('target_currency', DEFAULT_CURRENCY)
+
+# Computed page data is reused until the document changes (keys include its version)
+VIEW_CACHE_TTL = 300
+
+def load_user_snapshot():
+    """Read-only snapshot of the current user's (or guest's) document"""
     # Check if user is logged in
     if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        # Guest user - load from session
-        guest_data = session.get('guest_financial_data')
-        financial_data = load_financial_data(is_guest=True, guest_data=guest_data)
+        return load_financial_snapshot(user_id=current_user.id)
+    # Guest user - load from session
+    guest_data = session.get('guest_financial_data')
+    return load_financial_snapshot(is_guest=True, guest_data=guest_data)
+
+def get_all_financial_data(snapshot=None):
+    """Load financial data based on user authentication status"""
+    if snapshot is None:
+        snapshot = load_user_snapshot()
     
-    if not financial_data:
+    if not snapshot or not snapshot.data:
         return None
+    
+    # Guest data has no version, so it is always recomputed
+    if snapshot.version is None:
+        return build_financial_view(snapshot.data)
+    
+    settings_data = snapshot.data.get('settings', {})
+    base = get_document_base(snapshot)
+    # Rates are refreshed independently of the document, so they are part of the key too
+    rates = rate_snapshot(settings_data)
+    view_key = (f"financial_view:{current_user.id}:{snapshot.version}:"
+                f"{rates_version(rates['rates'])}:{rates['updated_at']}:"
+                f"{settings_data.get('target_currency', 'AUD')}:"
+                f"{settings_data.get('table_sort_order', 'newest_first')}")
+    return get_or_load(view_key, lambda: build_financial_view(snapshot.data, base=base),
+                       ttl=VIEW_CACHE_TTL, user_id=current_user.id)
 
-    profile_data = financial_data.get('profile', {})
+def document_base_key(snapshot):
+    rates = rate_table(snapshot.data.get('settings', {}))
+    return f"financial_base:{current_user.id}:{snapshot.version}:{rates_version(rates)}"
+
+def get_document_base(snapshot):
+    """Currency independent results (summary, all-currency conversion table), once per document and rates version"""
+    return get_or_load(document_base_key(snapshot),
+                       lambda: build_document_base(snapshot.data, get_document_columns(snapshot)),
+                       ttl=VIEW_CACHE_TTL, user_id=current_user.id)
+
+def carry_document_base(before):
+    """
+    After a settings change that leaves totals alone (e.g. switching currency), reuse
+    the previous version's base for the new version instead of recomputing it
+    """
+    after = load_user_snapshot()
+    if before is None or before.version is None or after is None or after.version != before.version + 1:
+        return  # Unversioned, or someone else wrote in between
+    if rate_table(before.data.get('settings', {})) != rate_table(after.data.get('settings', {})):
+        return  # Conversions changed
+    base = get_cached(document_base_key(before))
+    if base is not None:
+        set_cache(document_base_key(after), base, VIEW_CACHE_TTL, current_user.id)
+
+def get_document_columns(snapshot):
+    """NumPy columns for the vectorized engine, built once per document version (None if it's off)"""
+    if not vector_calculations.USE_VECTOR_ENGINE:
+        return None
+    return get_or_load(f"financial_columns:{current_user.id}:{snapshot.version}",
+                       lambda: vector_calculations.build_columns(snapshot.data),
+                       ttl=VIEW_CACHE_TTL, user_id=current_user.id)
+
+def build_document_base(financial_data, columns=None):
+    """
+    Summary and conversion table for a document; neither depends on the display currency
+    (remaining capital per currency comes from the conversion table)
+    With the vectorized engine on, columns (from get_document_columns) skips rebuilding arrays
+    """
     settings_data = financial_data.get('settings', {})
-    capital_data = financial_data.get('capital', {})
+    tax_rate = settings_data.get('tax_rate_percent', 30.0)
+    
+    # Totals come from the running totals kept on write; savings series and
+    # monthly groups are computed (vectorized engine when enabled)
+    aggregates = financial_data.get('aggregates')
+    if vector_calculations.USE_VECTOR_ENGINE:
+        if columns is None:
+            columns = vector_calculations.build_columns(financial_data)
+        summary = vector_calculations.calculate_summary(columns, 0, tax_rate, aggregates)
+    else:
+        summary = calculate_summary(financial_data, 0, tax_rate, aggregates)
+    
+    return {
+        'summary': summary,
+        'conversions': conversion_table(financial_data, rate_table(settings_data))
+    }
+
+def build_financial_view(financial_data, base=None):
+    """
+    Compute everything the pages render (converted totals, loan stats, savings, monthly groups)
+    The document may be a shared read-only snapshot, so derived values go into new dicts
+    base (from get_document_base) holds the currency independent results, so only the
+    lookups for the display currency happen here
+    """
+    if base is None:
+        base = build_document_base(financial_data)
+    profile_data = financial_data.get('profile', {})
+    settings_data = dict(financial_data.get('settings', {}))
+    capital_data = dict(financial_data.get('capital', {}))
     monthly_cash_flow = financial_data.get('monthly_cash_flow', [])
     expenses_from_savings = financial_data.get('expenses_from_savings', [])
     daily_income_tracker = financial_data.get('daily_income_tracker', [])
-    tax_rate = settings_data.get('tax_rate_percent', 30.0)
 
     # Get rate based on selected currency
     bdt_rate, target_currency = get_currency_rate(settings_data)
     settings_data['current_rate'] = bdt_rate
     settings_data['target_currency'] = target_currency
     
-    # Ensure bdt_to_aud_rate exists for edit page (default if not set)
-    if 'bdt_to_aud_rate' not in settings_data:
-        settings_data['bdt_to_aud_rate'] = 0.0127  # Default AUD rate
+    # Pages show the rates the totals were computed with, and when they were fetched
+    rates = rate_snapshot(financial_data.get('settings', {}))
+    settings_data['bdt_to_aud_rate'] = rates['rates']['AUD']
+    settings_data['exchange_rate_last_updated'] = rates['updated_at']
+    settings_data['exchange_rate_source'] = rates['source']
 
-    # Convert BDT sources to AUD and calculate total capital
-    total_capital_aud = 0
-    loan_data = None
-    for source in capital_data.get('sources', []):
-        source['amount_aud'] = source.get('amount_bdt', 0) * bdt_rate
-        total_capital_aud += source['amount_aud']
-        # Extract loan data separately
-        if source.get('name', '').lower() == 'loan':
-            loan_data = {
-                'amount_bdt': source.get('amount_bdt', 0),
-                'amount_aud': source['amount_aud']
-            }
+    # BDT sources converted to the selected currency (looked up in the conversion table)
+    conversion = base['conversions'].get(target_currency, base['conversions'][DEFAULT_CURRENCY])
+    total_capital_aud = conversion['total_capital']
+    capital_data['sources'] = [
+        dict(source, amount_aud=amount)
+        for source, amount in zip(capital_data.get('sources', []), conversion['source_amounts'])
+    ]
     capital_data['total_capital_aud'] = total_capital_aud
     
-    # Calculate loan statistics
+    # Extract loan data separately
+    loan_data = None
+    if conversion['loan_amount'] is not None:
+        loan_source = [source for source in capital_data['sources'] if source.get('name', '').lower() == 'loan'][-1]
+        loan_data = {
+            'amount_bdt': loan_source.get('amount_bdt', 0),
+            'amount_aud': conversion['loan_amount']
+        }
+    
+    summary = dict(base['summary'], remaining_capital=conversion['remaining_capital'])
+    
+    # Calculate loan statistics from the amortization schedule (recorded repayments
+    # first, then the projected payments; memoized per loan terms and history)
     if loan_data:
-        total_loan_paid = sum(entry.get('loan_repayment', 0) for entry in monthly_cash_flow)
+        total_loan_paid = summary['total_loan_paid']
         loan_payment_count = len(monthly_cash_flow)
-        remaining_loan_balance = max(0, loan_data['amount_aud'] - total_loan_paid)
+        loan_schedule = amortization.loan_schedule(loan_data['amount_aud'], settings_data, monthly_cash_flow)
+        remaining_loan_balance = loan_schedule.balance
         
-        # Calculate progress percentage
+        # Calculate progress percentage (principal repaid, interest excluded)
         if loan_data['amount_aud'] > 0:
-            loan_progress_percent = (total_loan_paid / loan_data['amount_aud']) * 100
+            loan_progress_percent = min(100, (loan_schedule.principal_paid / loan_data['amount_aud']) * 100)
         else:
             loan_progress_percent = 0
         
-        # Calculate months remaining - use total loan period from settings minus months already paid
-        loan_period_total = settings_data.get('loan_period_months', 60)
-        if remaining_loan_balance > 0 and loan_payment_count < loan_period_total:
-            months_remaining = loan_period_total - loan_payment_count
-        else:
-            months_remaining = 0 if remaining_loan_balance == 0 else loan_period_total
+        # Months left at the scheduled payment (None if it doesn't cover the interest)
+        months_remaining = loan_schedule.months_remaining
     else:
         # Default values if no loan found
         loan_data = {'amount_bdt': 0, 'amount_aud': 0}
@@ -165,26 +271,17 @@ def get_all_financial_data():
         remaining_loan_balance = 0
         loan_progress_percent = 0
         months_remaining = 0
+        loan_schedule = None
 
     # Perform calculations with the newly calculated total capital
-    remaining_capital = calculate_remaining_capital(total_capital_aud, capital_data.get('expenses_from_capital', []))
-    monthly_savings = calculate_monthly_savings(monthly_cash_flow)
-    total_savings = calculate_total_savings(monthly_savings)
-    total_expenses_from_savings = calculate_total_expenses_from_savings(expenses_from_savings)
+    remaining_capital = summary['remaining_capital']
+    monthly_savings = summary['monthly_savings']
+    total_savings = summary['total_savings']
+    total_expenses_from_savings = summary['total_expenses_from_savings']
     # New logic: Net savings now includes remaining capital
     net_savings = (total_savings - total_expenses_from_savings) + remaining_capital
-    total_net_daily_income = calculate_total_daily_net_income(daily_income_tracker, tax_rate)
-
-    # New: Group daily income by month
-    daily_income_by_month = defaultdict(lambda: {'entries': [], 'total_net': 0})
-    for entry in daily_income_tracker:
-        try:
-            month_key = datetime.strptime(entry['date'], '%Y-%m-%d').strftime('%Y-%m')
-            net_income = calculate_net_income(entry['gross_income'], tax_rate)
-            daily_income_by_month[month_key]['entries'].append(entry)
-            daily_income_by_month[month_key]['total_net'] += net_income
-        except ValueError:
-            continue # Skip entries with invalid date format
+    total_net_daily_income = summary['total_net_daily_income']
+    daily_income_by_month = summary['daily_income_by_month']
 
     # Sort months chronologically based on user preference
     sort_order = settings_data.get('table_sort_order', 'newest_first')
@@ -210,7 +307,8 @@ def get_all_financial_data():
         "loan_payment_count": loan_payment_count,
         "remaining_loan_balance": remaining_loan_balance,
         "loan_progress_percent": loan_progress_percent,
-        "months_remaining": months_remaining
+        "months_remaining": months_remaining,
+        "loan_schedule": loan_schedule
     }
 
 def save_user_financial_data(financial_data):
@@ -223,6 +321,17 @@ def save_user_financial_data(financial_data):
         session['guest_financial_data'] = financial_data
         save_financial_data(financial_data, is_guest=True)
 
+def apply_user_change(change, *args):
+    """Apply a single patch (entry append/update/remove, settings merge) without rewriting the whole document"""
+    if current_user.is_authenticated:
+        return change(*args, user_id=current_user.id)
+    # Guest user - change the session copy
+    guest_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
+    success = change(*args, is_guest=True, guest_data=guest_data)
+    if success:
+        save_user_financial_data(guest_data)
+    return success
+
 # --- Authentication Routes ---
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -281,18 +390,17 @@ def signup():
         
         if success:
             # Log the user in automatically
-            user_success, user = verify_user(username, password)
-            if user_success:
-                login_user(user)
-                
-                # Migrate guest data if exists
-                guest_data = session.get('guest_financial_data')
-                if guest_data:
-                    save_financial_data(guest_data, user_id=user.id)
-                    session.pop('guest_financial_data', None)
-                
-                flash('Account created successfully! Welcome aboard!', 'success')
-                return redirect(url_for('sources_page'))
+            user = result
+            login_user(user)
+            
+            # Migrate guest data if exists
+            guest_data = session.get('guest_financial_data')
+            if guest_data:
+                save_financial_data(guest_data, user_id=user.id)
+                session.pop('guest_financial_data', None)
+            
+            flash('Account created successfully! Welcome aboard!', 'success')
+            return redirect(url_for('sources_page'))
         else:
             return render_template('signup.html', error=result)
     
@@ -301,6 +409,7 @@ def signup():
 @app.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
     logout_user()
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('login'))
@@ -309,7 +418,7 @@ def logout():
 def guest_mode():
     """Initialize guest mode with empty data"""
     if 'guest_financial_data' not in session:
-        session['guest_financial_data'] = get_default_financial_data()
+        session['guest_financial_data'] = get_default_financial_data(is_guest=True)
     return redirect(url_for('sources_page'))
 
 # --- Main Page Routes ---
@@ -368,7 +477,7 @@ def edit_sources_page():
 def update_sources():
     # Get financial data based on user type
     if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
+        financial_data = load_financial_data(user_id=current_user.id, for_update=True)
     else:
         financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     
@@ -417,24 +526,14 @@ def update_sources():
 # --- Add Routes ---
 @app.route('/capital/add', methods=['POST'])
 def add_capital_expense():
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     new_expense = {"name": request.form['name'], "amount": float(request.form['amount'])}
-    financial_data['capital']['expenses_from_capital'].append(new_expense)
-    save_user_financial_data(financial_data)
+    apply_user_change(append_entry, 'expenses_from_capital', new_expense)
     return redirect(url_for('capital_page'))
 
 @app.route('/savings/add_monthly', methods=['POST'])
 def add_monthly_entry():
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
-    new_entry = {"month": request.form['month'], "income": float(request.form['income']), "loan_repayment": float(request.form['loan_repayment'])}
-    financial_data['monthly_cash_flow'].append(new_entry)
-    save_user_financial_data(financial_data)
+    new_entry = {"month": request.form['month'], "income": float(request.form['income']), "loan_repayment": float(request.form['loan_repayment']), "currency": entered_currency()}
+    apply_user_change(append_entry, 'monthly_cash_flow', new_entry)
     return redirect(url_for('savings_page'))
 
 @app.route('/savings/add_lump_sum', methods=['POST'])
@@ -458,34 +557,24 @@ def add_lump_sum_monthly_income():
     new_entry = {
         "month": month_key,
         "income": net_income_after_tax,
-        "loan_repayment": loan_repayment
+        "loan_repayment": loan_repayment,
+        "currency": entered_currency()
     }
     
-    financial_data['monthly_cash_flow'].append(new_entry)
-    save_user_financial_data(financial_data)
+    apply_user_change(append_entry, 'monthly_cash_flow', new_entry)
     
     return redirect(url_for('savings_page'))
 
 @app.route('/savings/add_expense', methods=['POST'])
 def add_saving_expense():
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     new_expense = {"name": request.form['name'], "amount": float(request.form['amount'])}
-    financial_data['expenses_from_savings'].append(new_expense)
-    save_user_financial_data(financial_data)
+    apply_user_change(append_entry, 'expenses_from_savings', new_expense)
     return redirect(url_for('savings_page'))
 
 @app.route('/daily_tracker/add', methods=['POST'])
 def add_daily_entry():
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
-    new_entry = {"date": request.form['date'], "hours_worked": float(request.form['hours_worked']), "gross_income": float(request.form['gross_income'])}
-    financial_data['daily_income_tracker'].append(new_entry)
-    save_user_financial_data(financial_data)
+    new_entry = {"date": request.form['date'], "hours_worked": float(request.form['hours_worked']), "gross_income": float(request.form['gross_income']), "currency": entered_currency()}
+    apply_user_change(append_entry, 'daily_income_tracker', new_entry)
     return redirect(url_for('daily_tracker_page'))
 
 # --- Action Routes ---
@@ -496,30 +585,21 @@ def process_month(month_key):
     else:
         financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     
-    # Recalculate the total net for the specific month to ensure accuracy
-    daily_income_by_month = defaultdict(lambda: {'entries': [], 'total_net': 0})
+    # The month's gross total is kept up to date on every write, so this is a lookup
     tax_rate = financial_data.get('settings', {}).get('tax_rate_percent', 30.0)
-    for entry in financial_data.get('daily_income_tracker', []):
-        try:
-            current_month_key = datetime.strptime(entry['date'], '%Y-%m-%d').strftime('%Y-%m')
-            if current_month_key == month_key:
-                net_income = calculate_net_income(entry['gross_income'], tax_rate)
-                daily_income_by_month[month_key]['total_net'] += net_income
-        except ValueError:
-            continue
-
-    total_net_income_for_month = daily_income_by_month[month_key]['total_net']
+    month_totals = get_aggregates(financial_data)['months'].get(month_key)
+    total_net_income_for_month = calculate_net_income(month_totals['gross_total'], tax_rate) if month_totals else 0
     loan_repayment = financial_data.get('settings', {}).get('default_loan_repayment', 0)
 
     # Create a new entry for the monthly cash flow
     new_savings_entry = {
         "month": month_key,
         "income": total_net_income_for_month,
-        "loan_repayment": loan_repayment
+        "loan_repayment": loan_repayment,
+        "currency": entered_currency()
     }
 
-    financial_data['monthly_cash_flow'].append(new_savings_entry)
-    save_user_financial_data(financial_data)
+    apply_user_change(append_entry, 'monthly_cash_flow', new_savings_entry)
     
     return redirect(url_for('monthly_summary_page'))
 
@@ -531,9 +611,10 @@ def edit_capital_expense(index):
     else:
         financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     if request.method == 'POST':
-        financial_data['capital']['expenses_from_capital'][index]['name'] = request.form['name']
-        financial_data['capital']['expenses_from_capital'][index]['amount'] = float(request.form['amount'])
-        save_user_financial_data(financial_data)
+        apply_user_change(update_entry, 'expenses_from_capital', index, {
+            'name': request.form['name'],
+            'amount': float(request.form['amount'])
+        })
         return redirect(url_for('capital_page'))
     item = financial_data['capital']['expenses_from_capital'][index]
     return render_template('edit_capital_expense.html', expense=item, index=index)
@@ -549,10 +630,12 @@ def edit_monthly_entry(index):
     if request.method == 'POST':
         year = request.form['year']
         month_num = request.form['month']
-        financial_data['monthly_cash_flow'][index]['month'] = f"{year}-{month_num}"
-        financial_data['monthly_cash_flow'][index]['income'] = float(request.form['income'])
-        financial_data['monthly_cash_flow'][index]['loan_repayment'] = float(request.form['loan_repayment'])
-        save_user_financial_data(financial_data)
+        apply_user_change(update_entry, 'monthly_cash_flow', index, {
+            'month': f"{year}-{month_num}",
+            'income': float(request.form['income']),
+            'loan_repayment': float(request.form['loan_repayment']),
+            'currency': entered_currency()
+        })
         return redirect(url_for('savings_page'))
 
     entry_year, entry_month = item['month'].split('-')
@@ -584,10 +667,12 @@ def edit_monthly_entry_by_month(month):
     if request.method == 'POST':
         year = request.form['year']
         month_num = request.form['month']
-        financial_data['monthly_cash_flow'][entry_index]['month'] = f"{year}-{month_num}"
-        financial_data['monthly_cash_flow'][entry_index]['income'] = float(request.form['income'])
-        financial_data['monthly_cash_flow'][entry_index]['loan_repayment'] = float(request.form['loan_repayment'])
-        save_user_financial_data(financial_data)
+        apply_user_change(update_entry, 'monthly_cash_flow', entry_index, {
+            'month': f"{year}-{month_num}",
+            'income': float(request.form['income']),
+            'loan_repayment': float(request.form['loan_repayment']),
+            'currency': entered_currency()
+        })
         flash(f'Monthly entry updated successfully!', 'success')
         return redirect(url_for('savings_page'))
 
@@ -601,9 +686,10 @@ def edit_savings_expense(index):
     else:
         financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     if request.method == 'POST':
-        financial_data['expenses_from_savings'][index]['name'] = request.form['name']
-        financial_data['expenses_from_savings'][index]['amount'] = float(request.form['amount'])
-        save_user_financial_data(financial_data)
+        apply_user_change(update_entry, 'expenses_from_savings', index, {
+            'name': request.form['name'],
+            'amount': float(request.form['amount'])
+        })
         return redirect(url_for('savings_page'))
     item = financial_data['expenses_from_savings'][index]
     return render_template('edit_savings_expense.html', expense=item, index=index)
@@ -615,10 +701,12 @@ def edit_daily_entry(index):
     else:
         financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     if request.method == 'POST':
-        financial_data['daily_income_tracker'][index]['date'] = request.form['date']
-        financial_data['daily_income_tracker'][index]['hours_worked'] = float(request.form['hours_worked'])
-        financial_data['daily_income_tracker'][index]['gross_income'] = float(request.form['gross_income'])
-        save_user_financial_data(financial_data)
+        apply_user_change(update_entry, 'daily_income_tracker', index, {
+            'date': request.form['date'],
+            'hours_worked': float(request.form['hours_worked']),
+            'gross_income': float(request.form['gross_income']),
+            'currency': entered_currency()
+        })
         return redirect(url_for('daily_tracker_page'))
     item = financial_data['daily_income_tracker'][index]
     return render_template('edit_daily_entry.html', entry=item, index=index)
@@ -626,30 +714,18 @@ def edit_daily_entry(index):
 # --- Delete Route ---
 @app.route('/delete/<string:list_name>/<int:index>')
 def delete_item(list_name, index):
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
-    
-    target_list = None
-    redirect_page = None
-    if list_name == 'capital_expenses':
-        target_list = financial_data['capital']['expenses_from_capital']
-        redirect_page = 'capital_page'
-    elif list_name == 'monthly_cash_flow':
-        target_list = financial_data['monthly_cash_flow']
-        redirect_page = 'savings_page'
-    elif list_name == 'expenses_from_savings':
-        target_list = financial_data['expenses_from_savings']
-        redirect_page = 'savings_page'
-    elif list_name == 'daily_income_tracker':
-        target_list = financial_data['daily_income_tracker']
-        redirect_page = 'daily_tracker_page'
-
-    if target_list is not None and 0 <= index < len(target_list):
-        target_list.pop(index)
-        save_user_financial_data(financial_data)
-        return redirect(url_for(redirect_page))
+    # URL list name -> (storage section, page to return to)
+    list_targets = {
+        'capital_expenses': ('expenses_from_capital', 'capital_page'),
+        'monthly_cash_flow': ('monthly_cash_flow', 'savings_page'),
+        'expenses_from_savings': ('expenses_from_savings', 'savings_page'),
+        'daily_income_tracker': ('daily_income_tracker', 'daily_tracker_page')
+    }
+
+    if list_name in list_targets:
+        section, redirect_page = list_targets[list_name]
+        if apply_user_change(remove_entry, section, index):
+            return redirect(url_for(redirect_page))
     
     return "Error: List not found or index out of bounds", 404
 
@@ -657,20 +733,7 @@ def delete_item(list_name, index):
 @app.route('/delete_by_month/<string:month>')
 def delete_by_month(month):
     """Delete monthly cash flow entry by month identifier"""
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
-    
-    # Find and remove the entry with matching month
-    monthly_cash_flow = financial_data['monthly_cash_flow']
-    original_length = len(monthly_cash_flow)
-    
-    # Remove entry with matching month
-    financial_data['monthly_cash_flow'] = [entry for entry in monthly_cash_flow if entry['month'] != month]
-    
-    if len(financial_data['monthly_cash_flow']) < original_length:
-        save_user_financial_data(financial_data)
+    if apply_user_change(remove_entries_by_field, 'monthly_cash_flow', 'month', month):
         flash(f'Monthly entry for {month} deleted successfully!', 'success')
     else:
         flash(f'Entry not found for {month}', 'error')
@@ -681,7 +744,22 @@ def delete_by_month(month):
 @app.route('/loan')
 def loan_page():
     data = get_all_financial_data()
-    return render_template('loan_management.html', **data) if data else make_response("Error loading financial data", 500)
+    if not data:
+        return make_response("Error loading financial data", 500)
+    
+    # Optional what-if: ?extra=<amount> added to every remaining payment
+    extra_payment = request.args.get('extra', type=float)
+    what_if = None
+    if extra_payment and 0 < extra_payment < float('inf') and data['loan_schedule']:
+        what_if_schedule = amortization.loan_schedule(
+            data['loan_data']['amount_aud'], data['settings'], data['monthly_cash_flow'], extra_payment
+        )
+        what_if = dict(
+            amortization.compare_schedules(data['loan_schedule'], what_if_schedule),
+            extra_payment=extra_payment,
+            schedule=what_if_schedule
+        )
+    return render_template('loan_management.html', what_if=what_if, **data)
 
 @app.route('/loan/edit')
 def edit_loan_page():
@@ -691,7 +769,7 @@ def edit_loan_page():
 @app.route('/loan/update', methods=['POST'])
 def update_loan():
     if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
+        financial_data = load_financial_data(user_id=current_user.id, for_update=True)
     else:
         financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     
@@ -729,59 +807,110 @@ def update_loan():
 @app.route('/set_currency/<string:currency>', methods=['POST'])
 def set_currency(currency):
     """Change target currency"""
-    valid_currencies = ['AUD', 'USD', 'NZD', 'GBP', 'CAD', 'EUR', 'SGD', 'MYR', 
-                       'JPY', 'KRW', 'CNY', 'INR', 'THB', 'CHF', 'SEK', 'NOK', 
-                       'DKK', 'AED', 'SAR']
-    
-    if currency not in valid_currencies:
+    if currency not in SUPPORTED_CURRENCIES:
         return jsonify({'success': False, 'error': 'Invalid currency'}), 400
     
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
+    snapshot = load_user_snapshot()
+    settings_data = snapshot.data.get('settings', {}) if snapshot and snapshot.data else {}
     
-    financial_data['settings']['target_currency'] = currency
+    changes = {'target_currency': currency}
     
-    # Update current_rate if we have the rate for this currency
-    rate_key = f'bdt_to_{currency.lower()}_rate'
-    if rate_key in financial_data['settings']:
-        financial_data['settings']['current_rate'] = financial_data['settings'][rate_key]
+    # Same rate the pages compute with
+    changes['current_rate'] = rate_table(settings_data)[currency]
     
-    save_user_financial_data(financial_data)
+    apply_user_change(update_settings, changes)
+    # The totals don't depend on the currency, so the new version reuses them
+    if current_user.is_authenticated:
+        carry_document_base(snapshot)
     
     flash(f'Currency changed to {currency} successfully!', 'success')
     return jsonify({'success': True, 'currency': currency})
 
+@app.route('/api/currency_comparison')
+def currency_comparison():
+    """Capital totals in every supported currency (read from the conversion table)"""
+    snapshot = load_user_snapshot()
+    if not snapshot or not snapshot.data:
+        return jsonify({'success': False, 'error': 'Error loading financial data'}), 500
+    if snapshot.version is None:
+        base = build_document_base(snapshot.data)
+    else:
+        base = get_document_base(snapshot)
+    
+    currencies = {
+        code: {
+            'rate': conversion['rate'],
+            'total_capital': conversion['total_capital'],
+            'remaining_capital': conversion['remaining_capital'],
+            'loan_amount': conversion['loan_amount'] or 0
+        }
+        for code, conversion in base['conversions'].items()
+    }
+    return jsonify({
+        'success': True,
+        'current_currency': snapshot.data.get('settings', {}).get('target_currency', 'AUD'),
+        'currencies': currencies
+    })
+
+@app.route('/api/historical_conversion')
+def historical_conversion_api():
+    """
+    Daily income and cash flow converted at the rate of each entry's date: ?to=BDT
+    (API only; entries are converted from the currency they were entered in)
+    """
+    snapshot = load_user_snapshot()
+    if not snapshot or not snapshot.data:
+        return jsonify({'success': False, 'error': 'Error loading financial data'}), 500
+    
+    settings_data = snapshot.data.get('settings', {})
+    # Currency assumed for entries written before entries recorded theirs
+    from_currency = settings_data.get('target_currency', DEFAULT_CURRENCY)
+    to_currency = request.args.get('to', 'BDT')
+    if to_currency != 'BDT' and to_currency not in SUPPORTED_CURRENCIES:
+        return jsonify({'success': False, 'error': 'Invalid currency'}), 400
+    
+    def convert():
+        return historical_conversion(snapshot.data, load_history('BDT'), to_currency,
+                                     rate_table(settings_data), from_currency)
+    
+    # Guest data has no version, so it is always recomputed
+    if snapshot.version is None:
+        result = convert()
+    else:
+        result = get_or_load(f"historical_conversion:{current_user.id}:{snapshot.version}:"
+                             f"{history_version('BDT')}:{rates_version(rate_table(settings_data))}:"
+                             f"{from_currency}:{to_currency}",
+                             convert, ttl=VIEW_CACHE_TTL, user_id=current_user.id)
+    return jsonify(dict(result, success=True))
+
 # --- Exchange Rate API Routes ---
 @app.route('/api/fetch_exchange_rate', methods=['POST'])
 def fetch_exchange_rate():
     """API endpoint to fetch current exchange rate for selected currency"""
     # Get current financial data to know target currency
     if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
+        financial_data = load_financial_data(user_id=current_user.id, for_update=True)
     else:
         financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
     
     target_currency = financial_data['settings'].get('target_currency', 'AUD')
     
-    # Fetch all three rates
-    currencies = ['AUD', 'USD', 'NZD']
-    results = {}
+    # Every supported rate, from the rate cache shared by all users (one upstream
+    # request per EXCHANGE_RATE_TTL however many users refresh)
+    result = ExchangeRateAPI.get_rates(base='BDT', targets=SUPPORTED_CURRENCIES)
+    results = result.get('rates', {}) if result.get('success') else {}
+    if results and not result.get('stale'):
+        record_rates('BDT', results, result['timestamp'])
     
-    for currency in currencies:
-        result = ExchangeRateAPI.fetch_rate(from_currency='BDT', to_currency=currency)
-        if result.get('success'):
-            rate_key = f'bdt_to_{currency.lower()}_rate'
-            financial_data['settings'][rate_key] = result['rate']
-            results[currency] = result['rate']
+    for currency, rate in results.items():
+        financial_data['settings'][rate_setting(currency)] = rate
     
     # Update the current_rate based on target currency
     if target_currency in results:
         financial_data['settings']['current_rate'] = results[target_currency]
     
-    # Update timestamp
-    financial_data['settings']['exchange_rate_last_updated'] = datetime.now().isoformat()
+    # Update timestamp (when the rates were fetched upstream)
+    financial_data['settings']['exchange_rate_last_updated'] = result.get('timestamp', datetime.now().isoformat())
     financial_data['settings']['exchange_rate_source'] = 'ExchangeRate-API'
     save_user_financial_data(financial_data)
     
@@ -800,28 +929,86 @@ def fetch_exchange_rate():
             'error': 'Failed to fetch exchange rates'
         }), 400
 
+# --- Admin ---
+# Comma-separated usernames allowed to see operational data such as cache metrics
+ADMIN_USERS = {name.strip() for name in os.environ.get('ADMIN_USERS', '').split(',') if name.strip()}
+# Optional bearer token so a Prometheus scraper can read /admin/metrics without logging in
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+def is_metrics_request_allowed():
+    """Admins (by username) or requests carrying METRICS_TOKEN"""
+    if current_user.is_authenticated and current_user.username in ADMIN_USERS:
+        return True
+    auth_header = request.headers.get('Authorization', '')
+    if METRICS_TOKEN and auth_header.startswith('Bearer '):
+        return hmac.compare_digest(auth_header[len('Bearer '):], METRICS_TOKEN)
+    return False
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Cache metrics as JSON, or Prometheus text with ?format=prometheus"""
+    if not is_metrics_request_allowed():
+        return make_response("Not found", 404)
+    
+    if request.args.get('format') == 'prometheus':
+        response = make_response(render_prometheus())
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+        return response
+    return jsonify(collect_metrics())
+
+# --- Projection ---
+# Percentile bands are reused until the document changes
+PROJECTION_CACHE_TTL = 600
+
+@app.route('/api/projection')
+def savings_projection():
+    """Monte Carlo projection of net savings: ?months=24&paths=10000"""
+    snapshot = load_user_snapshot()
+    data = get_all_financial_data(snapshot)
+    if not data:
+        return jsonify({'success': False, 'error': 'Error loading financial data'}), 500
+    
+    # Guest results are recomputed on every call, so guests get lower limits
+    if snapshot.version is None:
+        max_months, max_paths = projection.GUEST_MAX_MONTHS, projection.GUEST_MAX_PATHS
+    else:
+        max_months, max_paths = projection.MAX_MONTHS, projection.MAX_PATHS
+    months = max(1, min(request.args.get('months', projection.DEFAULT_MONTHS, type=int), max_months))
+    paths = max(1, min(request.args.get('paths', projection.DEFAULT_PATHS, type=int), max_paths))
+    inputs = projection.projection_inputs(
+        dict(data['daily_income_by_month']),
+        data['monthly_cash_flow'],
+        data['net_savings'],
+        data['remaining_capital'],
+        data['loan_schedule'],
+        data['settings'],
+        months
+    )
+    
+    # Guest data has no version, so it is always recomputed
+    if snapshot.version is not None:
+        # Inputs include converted capital, so changed rates must miss too
+        rates = rate_snapshot(snapshot.data.get('settings', {}))
+        result = get_or_load(f"projection:{current_user.id}:{snapshot.version}:"
+                             f"{rates_version(rates['rates'])}:"
+                             f"{data['settings']['target_currency']}:{months}:{paths}",
+                             lambda: projection.run_projection(inputs, paths),
+                             ttl=PROJECTION_CACHE_TTL, user_id=current_user.id)
+    else:
+        result = projection.run_projection(inputs, paths)
+    return jsonify(dict(result, success=True))
+
 # --- Settings Update ---
 @app.route('/settings/update_tax', methods=['POST'])
 def update_tax_rate():
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
-    financial_data['settings']['tax_rate_percent'] = float(request.form['tax_rate'])
-    save_user_financial_data(financial_data)
+    apply_user_change(update_settings, {'tax_rate_percent': float(request.form['tax_rate'])})
     return redirect(url_for('daily_tracker_page'))
 
 @app.route('/settings/update_sort_order', methods=['POST'])
 def update_sort_order():
     """Update table sort order preference"""
-    if current_user.is_authenticated:
-        financial_data = load_financial_data(user_id=current_user.id)
-    else:
-        financial_data = load_financial_data(is_guest=True, guest_data=session.get('guest_financial_data'))
-    
     sort_order = request.form.get('sort_order', 'newest_first')
-    financial_data['settings']['table_sort_order'] = sort_order
-    save_user_financial_data(financial_data)
+    apply_user_change(update_settings, {'table_sort_order': sort_order})
     
     flash(f'Table sort order updated to {"newest first" if sort_order == "newest_first" else "oldest first"}!', 'success')
     
@@ -829,4 +1016,9 @@ def update_sort_order():
     return redirect(request.referrer or url_for('dashboard'))
 
 if __name__ == '__main__':
-    serve(app, host='0.0.0.0', port=5000)
+    # Background work only runs in the server process, not wherever main is imported
+    # (scripts, tests, the serverless entry point). Projection workers are forked
+    # first, before the refresher and waitress start their threads
+    projection.init_projection_pool()
+    start_rate_refresher('BDT', SUPPORTED_CURRENCIES)
+    serve(app, host='0.0.0.0', port=5000, threads=SERVER_THREADS)
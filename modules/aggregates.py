@@ -0,0 +1,131 @@
+"""
+Running totals for financial data documents
+Kept in the document's 'aggregates' key and updated by every entry patch
+(add/edit/delete), so pages read totals in O(1) instead of re-summing lists.
+Totals are tax independent (gross amounts); net values are derived on read.
+
+Check or repair drift: python -m modules.aggregates verify|rebuild
+"""
+import sys
+
+from modules.calculations import build_month_index, entry_month, patch_month_index
+
+# Totals kept per document: section -> ((name, value of one entry), ...)
+AGGREGATES = {
+    'monthly_cash_flow': (
+        ('cash_flow_count', lambda entry: 1),
+        ('loan_paid', lambda entry: entry.get('loan_repayment', 0) or 0),
+        ('savings_total', lambda entry: round(entry['income'] - entry['loan_repayment'], 2)),
+    ),
+    'expenses_from_savings': (
+        ('expenses_from_savings_total', lambda entry: entry['amount']),
+    ),
+    'expenses_from_capital': (
+        ('expenses_from_capital_total', lambda entry: entry['amount']),
+    ),
+    'daily_income_tracker': (
+        ('daily_count', lambda entry: 1),
+        ('daily_gross_total', lambda entry: entry['gross_income']),
+    ),
+}
+
+TOTAL_FIELDS = tuple(name for fields in AGGREGATES.values() for name, _ in fields)
+
+# Drift below this is float rounding from incremental updates, not an error
+TOLERANCE = 1e-6
+
+def empty_aggregates():
+    """Aggregates of a document without entries
+    month_index (month -> daily entry positions) is kept in memory and in JSON files;
+    PostgreSQL builds it when a document is loaded"""
+    return {'totals': {name: 0 for name in TOTAL_FIELDS}, 'months': {}, 'month_index': {}}
+
+def entry_delta(section, removed=(), added=()):
+    """Change in the totals when entries are removed from and added to a section"""
+    delta = {'totals': {}, 'months': {}}
+    fields = AGGREGATES.get(section, ())
+    for sign, entries in ((-1, removed), (1, added)):
+        for entry in entries:
+            for name, value in fields:
+                delta['totals'][name] = delta['totals'].get(name, 0) + sign * value(entry)
+            if section == 'daily_income_tracker':
+                month = entry_month(entry)
+                if month is not None:
+                    change = delta['months'].setdefault(month, {'gross_total': 0, 'count': 0})
+                    change['gross_total'] += sign * entry['gross_income']
+                    change['count'] += sign
+    return delta
+
+def apply_delta(aggregates, delta):
+    """Add a delta (from entry_delta) to aggregates in place"""
+    totals = aggregates['totals']
+    for name, change in delta['totals'].items():
+        totals[name] = totals.get(name, 0) + change
+    months = aggregates['months']
+    for month, change in delta['months'].items():
+        current = months.get(month, {'gross_total': 0, 'count': 0})
+        # Replaced rather than changed, so copies can share the month dicts
+        updated = {
+            'gross_total': current['gross_total'] + change['gross_total'],
+            'count': current['count'] + change['count']
+        }
+        if updated['count'] > 0:
+            months[month] = updated
+        else:
+            months.pop(month, None)
+
+def calculate_aggregates(data):
+    """Aggregates of a document computed from scratch (O(n); used to initialize and to repair)"""
+    aggregates = empty_aggregates()
+    for section in AGGREGATES:
+        if section == 'expenses_from_capital':
+            entries = data.get('capital', {}).get('expenses_from_capital', [])
+        else:
+            entries = data.get(section, [])
+        apply_delta(aggregates, entry_delta(section, added=entries))
+    aggregates['month_index'] = build_month_index(data.get('daily_income_tracker', []))
+    return aggregates
+
+def get_aggregates(data):
+    """Stored aggregates of a document, computed if it has none yet"""
+    aggregates = data.get('aggregates')
+    if aggregates is None:
+        return calculate_aggregates(data)
+    return aggregates
+
+def update_month_index(aggregates, op, positions, removed, added):
+    """Bring the month index in aggregates up to date after a daily entry patch (if it has one)"""
+    if aggregates.get('month_index') is not None:
+        aggregates['month_index'] = patch_month_index(aggregates['month_index'], op, positions, removed, added)
+
+def copy_aggregates(aggregates):
+    """Copy that apply_delta can change without touching the original
+    (month dicts and the month index are shared: they are replaced, never changed)"""
+    copied = {'totals': dict(aggregates['totals']), 'months': dict(aggregates['months'])}
+    if aggregates.get('month_index') is not None:
+        copied['month_index'] = aggregates['month_index']
+    return copied
+
+def find_drift(stored, expected):
+    """Names of totals and months whose stored value is off by more than TOLERANCE"""
+    drift = [
+        name for name in TOTAL_FIELDS
+        if abs(stored['totals'].get(name, 0) - expected['totals'][name]) > TOLERANCE
+    ]
+    for month in set(stored['months']) | set(expected['months']):
+        have = stored['months'].get(month, {'gross_total': 0, 'count': 0})
+        want = expected['months'].get(month, {'gross_total': 0, 'count': 0})
+        if have['count'] != want['count'] or abs(have['gross_total'] - want['gross_total']) > TOLERANCE:
+            drift.append(f"month {month}")
+    if stored.get('month_index') is not None:
+        stored_index = {month: list(positions) for month, positions in stored['month_index'].items()}
+        if stored_index != expected['month_index']:
+            drift.append("month index")
+    return drift
+
+if __name__ == '__main__':
+    from modules.financial_db import verify_aggregates
+    if len(sys.argv) != 2 or sys.argv[1] not in ('verify', 'rebuild'):
+        sys.exit("Usage: python -m modules.aggregates verify|rebuild")
+    drifted = verify_aggregates(repair=sys.argv[1] == 'rebuild')
+    sys.exit(1 if drifted and sys.argv[1] == 'verify' else 0)
@@ -0,0 +1,211 @@
+"""
+Loan amortization: payment schedule, interest/principal split, payoff date
+Repayments already recorded in the monthly cash flow are applied first (one per
+entry, oldest month first); the rest of the loan is projected with the scheduled
+payment plus any extra payment. Balances are computed with array ops when NumPy
+is installed, and schedules are memoized per (principal, rate, period, first
+projected month, repayment history, payment, extra) so pages and what-ifs reuse them.
+"""
+import math
+import os
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# Projections stop here when the payment never clears the interest
+MAX_SCHEDULE_MONTHS = 600
+
+# Schedules kept in memory (each is a few KB)
+AMORTIZATION_CACHE_SIZE = int(os.environ.get('AMORTIZATION_CACHE_SIZE', 256))
+
+# Balances below this (half a cent) count as paid off
+PAID_OFF_BALANCE = 0.005
+
+LoanRow = namedtuple('LoanRow', [
+    'number',     # 1-based payment number
+    'month',      # YYYY-MM
+    'payment',
+    'interest',
+    'principal',
+    'balance',    # after the payment
+    'recorded'    # True for repayments from the cash flow, False for projected ones
+])
+
+LoanSchedule = namedtuple('LoanSchedule', [
+    'principal',
+    'annual_rate',
+    'period_months',
+    'payment',           # projected monthly payment (scheduled + extra)
+    'rows',              # tuple of LoanRow
+    'balance',           # balance after the recorded repayments
+    'interest_paid',     # by the recorded repayments
+    'principal_paid',    # by the recorded repayments
+    'total_interest',    # over the whole schedule
+    'months_remaining',  # projected payments left
+    'payoff_month',      # YYYY-MM of the last payment, None if it never pays off
+    'paid_off'           # False when the payment doesn't cover the interest
+])
+
+def monthly_rate(annual_rate_percent):
+    return annual_rate_percent / 100 / 12
+
+def scheduled_payment(principal, annual_rate_percent, period_months):
+    """Fixed monthly payment repaying the principal over the period (standard annuity formula)"""
+    if principal <= 0:
+        return 0.0
+    period_months = max(int(period_months), 1)
+    rate = monthly_rate(annual_rate_percent)
+    if rate == 0:
+        return principal / period_months
+    factor = (1 + rate) ** period_months
+    return principal * rate * factor / (factor - 1)
+
+def months_to_payoff(balance, annual_rate_percent, payment):
+    """Payments of a fixed amount needed to clear a balance, None if it never clears"""
+    if balance <= PAID_OFF_BALANCE:
+        return 0
+    if payment <= 0:
+        return None
+    rate = monthly_rate(annual_rate_percent)
+    if rate == 0:
+        return math.ceil(balance / payment - 1e-9)
+    if payment <= balance * rate:
+        return None
+    months = -math.log(1 - rate * balance / payment) / math.log(1 + rate)
+    return math.ceil(months - 1e-9)
+
+def _balances_numpy(opening, rate, payments):
+    # B_k = g^k * (B_0 - sum_{j<=k} p_j * g^-j), with g = 1 + rate
+    payments = np.asarray(payments, dtype=np.float64)
+    if rate == 0:
+        return (opening - np.cumsum(payments)).tolist()
+    growth = (1 + rate) ** np.arange(1, len(payments) + 1)
+    return (growth * (opening - np.cumsum(payments / growth))).tolist()
+
+def _balances_python(opening, rate, payments):
+    balances = []
+    balance = opening
+    for payment in payments:
+        balance = balance * (1 + rate) - payment
+        balances.append(balance)
+    return balances
+
+def _balances(opening, rate, payments):
+    """Balance after each payment (not yet clipped at zero)"""
+    if not payments:
+        return []
+    if HAS_NUMPY:
+        return _balances_numpy(opening, rate, payments)
+    return _balances_python(opening, rate, payments)
+
+def _add_months(month, count):
+    year, month_number = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + count, 12)
+    return f"{year:04d}-{month_number + 1:02d}"
+
+def _rows(opening, rate, payments, first_number, months, recorded):
+    """Schedule rows for a run of payments (months: label of each); stops at the payment that clears the balance"""
+    rows = []
+    previous = opening
+    for offset, (payment, balance) in enumerate(zip(payments, _balances(opening, rate, payments))):
+        interest = previous * rate
+        principal = payment - interest
+        if balance <= PAID_OFF_BALANCE:
+            # The final projected payment only needs to clear what's left
+            # (a recorded overpayment is shown as paid)
+            if not recorded:
+                payment = previous + interest
+            principal = previous
+            balance = 0.0
+        rows.append(LoanRow(
+            number=first_number + offset,
+            month=months[offset],
+            payment=payment,
+            interest=interest,
+            principal=principal,
+            balance=balance,
+            recorded=recorded
+        ))
+        if balance == 0.0:
+            break
+        previous = balance
+    return rows
+
+@lru_cache(maxsize=AMORTIZATION_CACHE_SIZE)
+def build_schedule(principal, annual_rate_percent, period_months, first_projected_month, repayments=(),
+                   payment=None, extra_payment=0.0):
+    """
+    Amortization schedule of a loan (memoized; arguments must be hashable, so repayments is a tuple)
+    repayments: (YYYY-MM, amount) of the payments already made, oldest first
+    first_projected_month: YYYY-MM of the first projected payment
+    payment: projected monthly payment (default: the scheduled payment for the period)
+    """
+    rate = monthly_rate(annual_rate_percent)
+    if payment is None or payment <= 0:
+        payment = scheduled_payment(principal, annual_rate_percent, period_months)
+    payment += extra_payment
+
+    rows = []
+    if principal > 0 and repayments:
+        months, amounts = zip(*repayments)
+        rows = _rows(principal, rate, list(amounts), 1, months, recorded=True)
+    balance = rows[-1].balance if rows else max(principal, 0.0)
+    interest_paid = sum(row.interest for row in rows)
+    principal_paid = sum(row.principal for row in rows)
+
+    months_remaining = months_to_payoff(balance, annual_rate_percent, payment)
+    paid_off = months_remaining is not None
+    projected = months_remaining if paid_off else MAX_SCHEDULE_MONTHS
+    if projected:
+        rows += _rows(balance, rate, [payment] * projected, len(rows) + 1,
+                      [_add_months(first_projected_month, offset) for offset in range(projected)],
+                      recorded=False)
+
+    return LoanSchedule(
+        principal=principal,
+        annual_rate=annual_rate_percent,
+        period_months=period_months,
+        payment=payment,
+        rows=tuple(rows),
+        balance=balance,
+        interest_paid=interest_paid,
+        principal_paid=principal_paid,
+        total_interest=sum(row.interest for row in rows),
+        months_remaining=sum(1 for row in rows if not row.recorded) if paid_off else None,
+        payoff_month=rows[-1].month if paid_off and rows else None,
+        paid_off=paid_off
+    )
+
+def loan_schedule(principal, settings_data, monthly_cash_flow, extra_payment=0.0):
+    """Schedule for a document's loan (principal in the display currency) and its recorded repayments"""
+    history = sorted(monthly_cash_flow, key=lambda entry: entry['month'])
+    # Projected payments follow the last recorded one (or start this month), resolved
+    # here so the month is part of the memoized arguments
+    if history:
+        first_projected_month = _add_months(history[-1]['month'], 1)
+    else:
+        first_projected_month = datetime.now().strftime('%Y-%m')
+    return build_schedule(
+        float(principal),
+        float(settings_data.get('loan_interest_rate', 0) or 0),
+        int(settings_data.get('loan_period_months', 60) or 60),
+        first_projected_month,
+        tuple((entry['month'], float(entry.get('loan_repayment', 0) or 0)) for entry in history),
+        float(settings_data.get('default_loan_repayment', 0) or 0) or None,
+        float(extra_payment)
+    )
+
+def compare_schedules(base, what_if):
+    """Months and interest an alternative schedule (e.g. with an extra payment) saves"""
+    if not (base.paid_off and what_if.paid_off):
+        return {'months_saved': None, 'interest_saved': base.total_interest - what_if.total_interest}
+    return {
+        'months_saved': base.months_remaining - what_if.months_remaining,
+        'interest_saved': base.total_interest - what_if.total_interest
+    }
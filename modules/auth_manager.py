@@ -1,8 +1,12 @@
 import bcrypt
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask_login import UserMixin
 from datetime import datetime
 from modules.db_config import DB_TYPE, DATABASE_URL
+from modules.cache import CACHE_BACKEND, create_cache_backend
+from modules.metrics import get_metrics
 
 # Import appropriate database driver
 if DB_TYPE == 'postgres':
@@ -12,6 +16,41 @@ if DB_TYPE == 'postgres':
 else:
     import sqlite3
 
+# Seconds a loaded user is reused by Flask-Login before the users table is read again
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+
+# Users by id (own namespace, so saving financial data doesn't evict them)
+_user_cache = create_cache_backend(CACHE_BACKEND, namespace='users')
+
+# bcrypt work factor for new hashes; existing hashes are upgraded (or downgraded) at login
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+# Request threads waitress serves with (main.py passes this to serve)
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+
+# Threads hashing passwords (bcrypt releases the GIL, so this caps the CPU logins take
+# from page views), and hash jobs allowed to run or wait before logins are turned away.
+# Each waiting login holds a request thread, so the queue is kept below SERVER_THREADS
+# (half of them by default) and a burst of logins leaves the rest for page views
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', max(1, SERVER_THREADS // 2)))
+
+if PASSWORD_HASH_QUEUE_LIMIT >= SERVER_THREADS:
+    print(f"⚠ PASSWORD_HASH_QUEUE_LIMIT={PASSWORD_HASH_QUEUE_LIMIT} would let logins hold every one of "
+          f"{SERVER_THREADS} server threads, using {max(1, SERVER_THREADS - 1)}")
+    PASSWORD_HASH_QUEUE_LIMIT = max(1, SERVER_THREADS - 1)
+
+_hash_executor = None
+_hash_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_QUEUE_LIMIT)
+_hash_pending = 0
+_rehashing = set()  # user ids with a rehash queued
+_hash_metrics = get_metrics('auth', 'bcrypt')
+_hash_metrics.gauge('queue_depth', lambda: _hash_pending)
+
+class PasswordHashBusy(Exception):
+    """Too many password hashes are already queued"""
+
 class User(UserMixin):
     """User model for Flask-Login"""
     def __init__(self, id, username, email, created_at):
@@ -34,6 +73,99 @@ def close_db_connection(conn):
     else:
         conn.close()  # Close SQLite connection
 
+def _get_hash_executor():
+    global _hash_executor
+    if _hash_executor is None:
+        with _hash_lock:
+            if _hash_executor is None:
+                _hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                                    thread_name_prefix='password-hash')
+    return _hash_executor
+
+def _run_hash_job(histogram, func, *args):
+    global _hash_pending
+    try:
+        with _hash_metrics.timer(histogram):
+            return func(*args)
+    finally:
+        with _hash_lock:
+            _hash_pending -= 1
+        _hash_slots.release()
+
+def _submit_hash_job(histogram, func, *args):
+    """Queue a job on the hashing threads (raises PasswordHashBusy when the queue is full)"""
+    global _hash_pending
+    if not _hash_slots.acquire(blocking=False):
+        _hash_metrics.incr('rejected')
+        raise PasswordHashBusy("Too many login attempts right now, please try again in a moment")
+    with _hash_lock:
+        _hash_pending += 1
+    try:
+        return _get_hash_executor().submit(_run_hash_job, histogram, func, *args)
+    except Exception:
+        with _hash_lock:
+            _hash_pending -= 1
+        _hash_slots.release()
+        raise
+
+def _new_hash(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS))
+
+def hash_password(password):
+    """bcrypt hash of a password at BCRYPT_ROUNDS (bytes), computed on the hashing threads"""
+    future = _submit_hash_job('hash_seconds', _new_hash, password)
+    # Includes the time spent queued behind other hashes
+    with _hash_metrics.timer('hash_wait_seconds'):
+        return future.result()
+
+def check_password(password, password_hash):
+    """Whether a password matches a bcrypt hash (bytes), checked on the hashing threads"""
+    future = _submit_hash_job('verify_seconds', bcrypt.checkpw, password.encode('utf-8'), password_hash)
+    with _hash_metrics.timer('verify_wait_seconds'):
+        return future.result()
+
+def _hash_rounds(password_hash):
+    # $2b$12$... -> 12
+    try:
+        return int(password_hash.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def _stored_hash(password_hash):
+    # PostgreSQL stores the hash as text, SQLite as the bytes bcrypt returns
+    return password_hash.decode('utf-8') if DB_TYPE == 'postgres' else password_hash
+
+def _rehash_password(user_id, password):
+    """Store a new hash at BCRYPT_ROUNDS (runs on a hashing thread after a login)"""
+    password_hash = _new_hash(password)
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        param = '%s' if DB_TYPE == 'postgres' else '?'
+        cursor.execute(f'UPDATE users SET password_hash = {param} WHERE id = {param}',
+                       (_stored_hash(password_hash), user_id))
+        conn.commit()
+        close_db_connection(conn)
+        _hash_metrics.incr('rehashed')
+    except Exception as e:
+        print(f"⚠ Could not update password hash for user {user_id}: {e}")
+    finally:
+        with _hash_lock:
+            _rehashing.discard(user_id)
+
+def _schedule_rehash(user_id, password):
+    """Queue a rehash unless one is already queued for the user (skipped when the queue is full)"""
+    with _hash_lock:
+        if user_id in _rehashing:
+            return
+        _rehashing.add(user_id)
+    try:
+        _submit_hash_job('hash_seconds', _rehash_password, user_id, password)
+    except PasswordHashBusy:
+        # Retried at the next login
+        with _hash_lock:
+            _rehashing.discard(user_id)
+
 def init_db():
     """Initialize the user database"""
     try:
@@ -83,13 +215,15 @@ def init_db():
         raise
 
 def create_user(username, email, password):
-    """Create a new user with hashed password"""
+    """Create a new user with hashed password; returns (True, User) or (False, error message)"""
+    try:
+        password_hash = hash_password(password)
+    except PasswordHashBusy as e:
+        return False, str(e)
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        # Hash the password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
         created_at = datetime.now()
         
         if DB_TYPE == 'postgres':
@@ -97,19 +231,22 @@ def create_user(username, email, password):
                 INSERT INTO users (username, email, password_hash, created_at)
                 VALUES (%s, %s, %s, %s)
                 RETURNING id
-            ''', (username, email, password_hash.decode('utf-8'), created_at))
+            ''', (username, email, _stored_hash(password_hash), created_at))
             user_id = cursor.fetchone()[0]
         else:
             cursor.execute('''
                 INSERT INTO users (username, email, password_hash, created_at)
                 VALUES (?, ?, ?, ?)
-            ''', (username, email, password_hash, created_at.isoformat()))
+            ''', (username, email, _stored_hash(password_hash), created_at.isoformat()))
             user_id = cursor.lastrowid
         
         conn.commit()
         close_db_connection(conn)
         
-        return True, user_id
+        # The new user is logged in without checking the password again
+        user = User(user_id, username, email, created_at.isoformat())
+        cache_user(user)
+        return True, user
     except Exception as e:
         error_msg = str(e).lower()
         if 'username' in error_msg or 'unique' in error_msg and 'username' in error_msg:
@@ -148,7 +285,11 @@ def verify_user(username, password):
             password_hash = password_hash.encode('utf-8')
         
         # Verify password
-        if bcrypt.checkpw(password.encode('utf-8'), password_hash):
+        if check_password(password, password_hash):
+            # Bring the hash to the configured work factor while the password is known
+            if _hash_rounds(password_hash) != BCRYPT_ROUNDS:
+                _schedule_rehash(user_id, password)
+            
             # Format created_at
             if isinstance(created_at, str):
                 created_at_str = created_at
@@ -156,16 +297,31 @@ def verify_user(username, password):
                 created_at_str = created_at.isoformat()
             
             user = User(user_id, username, email, created_at_str)
+            cache_user(user)
             return True, user
         else:
             return False, "Invalid username or password"
             
+    except PasswordHashBusy as e:
+        return False, str(e)
     except Exception as e:
         print(f"Error verifying user: {e}")
         return False, str(e)
 
+def cache_user(user):
+    """Remember a loaded user, so the next requests don't read the users table"""
+    _user_cache.set(f"user:{user.id}", user, USER_CACHE_TTL)
+
+def invalidate_user(user_id):
+    """Drop a cached user (call whenever a user row changes or the user logs out)"""
+    _user_cache.delete(f"user:{user_id}")
+
 def get_user_by_id(user_id):
-    """Get user by ID for Flask-Login"""
+    """Get user by ID for Flask-Login (cached for USER_CACHE_TTL seconds)"""
+    # Missing users and failed reads are not cached, so they are retried on the next request
+    return _user_cache.get_or_load(f"user:{user_id}", lambda: _query_user_by_id(user_id), ttl=USER_CACHE_TTL)
+
+def _query_user_by_id(user_id):
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
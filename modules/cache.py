@@ -1,67 +1,590 @@
 """
 Simple in-memory cache to reduce database queries
+Bounded LRU with expiry, safe to share between waitress worker threads,
+plus an optional SQLite store shared by every process on the host
 """
+import inspect
+import os
+import pickle
+import sqlite3
+import sys
+import threading
 import time
+from collections import OrderedDict, namedtuple
 from functools import wraps
-
-# Cache storage: {key: {"data": value, "expires": timestamp}}
-_cache = {}
+from modules.change_tracking import FrozenDict, FrozenList
+from modules.metrics import get_metrics
+from modules.records import Record
 
 # Cache TTL (Time To Live) in seconds
 CACHE_TTL = 30  # Cache for 30 seconds
 
+# Cache bounds (least recently used entries are evicted first)
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Items of a long list measured when estimating its size (the rest are assumed alike)
+CACHE_SIZE_SAMPLE = 16
+
+# Seconds between sweeps that drop expired entries nobody reads again
+CACHE_SWEEP_INTERVAL = 15
+
+# Backend for shared data such as financial documents: 'memory' (per process)
+# or 'sqlite' (shared by all worker processes on the same host)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH', 'data/cache.db')
+
+# How often a process replays invalidations broadcast by the others (seconds)
+CACHE_SYNC_INTERVAL = float(os.environ.get('CACHE_SYNC_INTERVAL', 0.25))
+
+# Seconds an expired entry may still be served while one thread reloads it (0 = off)
+CACHE_STALE_TTL = float(os.environ.get('CACHE_STALE_TTL', 0))
+
+class _NegativeResult:
+    """Stored in place of a None result, so "cached None" and "not cached" differ"""
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        # Unpickles to the module-level singleton (the SQLite store pickles values)
+        return 'NEGATIVE_RESULT'
+
+    def __repr__(self):
+        return 'NEGATIVE_RESULT'
+
+NEGATIVE_RESULT = _NegativeResult()
+
+# Value stored by get_or_load when a stale window is used; the entry itself
+# lives for ttl + stale_ttl, fresh_until (wall clock) marks when it goes stale
+StaleableValue = namedtuple('StaleableValue', ['value', 'fresh_until'])
+
+class _Call:
+    """One in-flight load shared by every caller asking for the same key"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesce concurrent loads of the same key so only one of them runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """Run func, or wait for the call already running for key and share its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        self._run(key, call, func)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do_in_background(self, key, func):
+        """Start func on a daemon thread unless a call for key is already running"""
+        with self._lock:
+            if key in self._calls:
+                return False
+            call = self._calls[key] = _Call()
+        threading.Thread(target=self._run, args=(key, call, func, True), daemon=True).start()
+        return True
+
+    def _run(self, key, call, func, background=False):
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            if background:
+                print(f"⚠ Background cache refresh failed for {key}: {e}")
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+def estimate_size(value, count_frozen=False):
+    """
+    Approximate memory used by a value and everything it contains (bytes)
+    Lists longer than CACHE_SIZE_SAMPLE are sized from their first items times
+    their length, so the cost grows with the number of sections, not entries.
+    Frozen document data (records, frozen containers) is owned by the document
+    cache and only counted there (count_frozen=True); other values referencing
+    it are charged for the references alone.
+    """
+    size = 0
+    seen = set()
+    stack = [(value, 1.0)]
+    while stack:
+        item, weight = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if not count_frozen and isinstance(item, (FrozenDict, FrozenList, Record)):
+            continue  # Counted by the document cache entry holding it
+        size += sys.getsizeof(item) * weight
+        if isinstance(item, (dict, Record)):
+            stack.extend((child, weight) for child in item.keys())
+            stack.extend((child, weight) for child in item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            items = item if isinstance(item, (list, tuple)) else list(item)
+            if len(items) > CACHE_SIZE_SAMPLE:
+                scale = weight * len(items) / CACHE_SIZE_SAMPLE
+                stack.extend((child, scale) for child in items[:CACHE_SIZE_SAMPLE])
+            else:
+                stack.extend((child, weight) for child in items)
+    return int(size)
+
+class CacheBackend:
+    """Interface every cache store implements"""
+
+    def __init__(self, namespace=None):
+        # Loads in progress in this process (see get_or_load)
+        self._flights = SingleFlight()
+        # Hit/miss/eviction counters and latencies (None = not recorded)
+        self._metrics = get_metrics('cache', namespace) if namespace else None
+        if self._metrics is not None:
+            self._metrics.gauge('entries', lambda: len(self))
+            self._metrics.gauge('bytes', lambda: self.size_bytes)
+
+    def __len__(self):
+        return 0
+
+    @property
+    def size_bytes(self):
+        return 0
+
+    def _record(self, counter, amount=1):
+        if self._metrics is not None and amount:
+            self._metrics.incr(counter, amount)
+
+    def get(self, key):
+        """Get value if present and not expired, otherwise None"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=CACHE_TTL, user_id=None):
+        """Store value with expiration, tagged with its owning user"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Remove a key if present"""
+        raise NotImplementedError
+
+    def invalidate_user(self, user_id):
+        """Remove every key stored for a user"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove everything"""
+        raise NotImplementedError
+
+    def peek(self, key):
+        """Get the stored value even if it is past its stale point (None if absent or a cached None)"""
+        stored = self.get(key)
+        if isinstance(stored, StaleableValue):
+            stored = stored.value
+        return None if stored is NEGATIVE_RESULT else stored
+
+    def get_or_load(self, key, loader, ttl=CACHE_TTL, user_id=None, stale_ttl=0,
+                    negative_ttl=0, allow_stale=True):
+        """
+        Get a cached value or load it, with one loader per key running at a time
+
+        stale_ttl keeps entries a while past ttl: callers get the stale value
+        immediately while a single background thread reloads it.
+        negative_ttl > 0 caches None results too (0 = retry the loader every time).
+        """
+        stored = self.get(key)
+        if stored is not None:
+            value, fresh_until = stored if isinstance(stored, StaleableValue) else (stored, None)
+            if fresh_until is None or time.time() < fresh_until:
+                return None if value is NEGATIVE_RESULT else value
+            self._record('stale_hits')
+            if allow_stale:
+                self._flights.do_in_background(
+                    key, lambda: self._load(key, loader, ttl, user_id, stale_ttl, negative_ttl)
+                )
+                return None if value is NEGATIVE_RESULT else value
+        return self._flights.do(
+            key, lambda: self._load(key, loader, ttl, user_id, stale_ttl, negative_ttl)
+        )
+
+    def _load(self, key, loader, ttl, user_id, stale_ttl, negative_ttl):
+        start = time.perf_counter()
+        try:
+            value = loader()
+        except Exception:
+            self._record('load_errors')
+            raise
+        if self._metrics is not None:
+            self._metrics.observe('load_seconds', time.perf_counter() - start)
+        if value is None:
+            if negative_ttl > 0:
+                self.set(key, NEGATIVE_RESULT, negative_ttl, user_id)
+            return None
+        if stale_ttl > 0:
+            self.set(key, StaleableValue(value, time.time() + ttl), ttl + stale_ttl, user_id)
+        else:
+            self.set(key, value, ttl, user_id)
+        return value
+
+class LRUCache(CacheBackend):
+    """Thread-safe LRU cache with per-entry expiry and entry/byte limits"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 sweep_interval=CACHE_SWEEP_INTERVAL, namespace=None, count_frozen=False):
+        super().__init__(namespace)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # True for the cache holding frozen documents (see estimate_size)
+        self.count_frozen = count_frozen
+        self.sweep_interval = sweep_interval
+        # key -> (value, expires, size, user_id), least recently used first
+        self._entries = OrderedDict()
+        # user_id -> keys owned by that user, so invalidation never scans other users
+        self._user_keys = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def get(self, key):
+        """Get value if present and not expired, otherwise None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now >= entry[1]:
+                self._remove(key)
+                self._record('expirations')
+                entry = None
+            elif entry is not None:
+                self._entries.move_to_end(key)
+        self._record('misses' if entry is None else 'hits')
+        return None if entry is None else entry[0]
+
+    def set(self, key, value, ttl=CACHE_TTL, user_id=None):
+        """Store value with expiration, evicting least recently used entries if over the limits"""
+        now = time.monotonic()
+        size = estimate_size(value, self.count_frozen)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                self._record('rejected')
+                return  # Would evict everything else and still not fit
+            self._entries[key] = (value, now + ttl, size, user_id)
+            self._bytes += size
+            if user_id is not None:
+                self._user_keys.setdefault(user_id, set()).add(key)
+            if now >= self._next_sweep:
+                self._sweep(now)
+            evicted = 0
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        self._record('sets')
+        self._record('evictions', evicted)
+
+    def delete(self, key):
+        """Remove a key if present"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_user(self, user_id):
+        """Remove every key stored for a user (cost proportional to that user's keys only)"""
+        with self._lock:
+            keys = self._user_keys.pop(user_id, ())
+            for key in keys:
+                self._remove(key, unindex=False)
+        self._record('invalidations', len(keys))
+
+    def clear(self):
+        """Remove everything"""
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def _remove(self, key, unindex=True):
+        # Caller holds the lock
+        _, _, size, user_id = self._entries.pop(key)
+        self._bytes -= size
+        if unindex and user_id is not None:
+            keys = self._user_keys.get(user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._user_keys[user_id]
+
+    def _sweep(self, now):
+        # Caller holds the lock; amortized so each set does O(1) extra work on average
+        expired = [k for k, entry in self._entries.items() if now >= entry[1]]
+        for key in expired:
+            self._remove(key)
+        self._record('expirations', len(expired))
+        self._next_sweep = now + self.sweep_interval
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache shared by all processes on the host, stored in a SQLite database in WAL mode
+
+    Each process keeps a small in-memory LRU in front of the database. Every
+    write is also appended to an invalidation log, which the other processes
+    replay at most CACHE_SYNC_INTERVAL seconds later to drop their stale copies.
+    """
+
+    # Invalidation log rows older than this are pruned; a process that falls
+    # further behind clears its local copies instead of replaying
+    LOG_RETENTION = 300
+
+    def __init__(self, path=CACHE_SQLITE_PATH, namespace='default',
+                 sync_interval=CACHE_SYNC_INTERVAL, local_max_entries=CACHE_MAX_ENTRIES, count_frozen=False):
+        super().__init__(namespace)
+        self.path = path
+        self.namespace = namespace
+        self.sync_interval = sync_interval
+        self._local = LRUCache(max_entries=local_max_entries, count_frozen=count_frozen)
+        self._connections = threading.local()
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0.0
+        self._next_sweep = time.time() + CACHE_SWEEP_INTERVAL
+        self._pid = os.getpid()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires REAL NOT NULL,
+                user_id TEXT,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_user ON cache_entries(namespace, user_id)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_invalidations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace TEXT NOT NULL,
+                key TEXT,
+                user_id TEXT,
+                pid INTEGER NOT NULL,
+                created REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        self._last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations').fetchone()[0]
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._connections, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._connections.conn = conn
+        return conn
+
+    def _broadcast(self, conn, key=None, user_id=None):
+        # key=None and user_id=None means "clear the namespace"
+        conn.execute(
+            'INSERT INTO cache_invalidations (namespace, key, user_id, pid, created) VALUES (?, ?, ?, ?, ?)',
+            (self.namespace, key, None if user_id is None else str(user_id), self._pid, time.time())
+        )
+
+    def _sync(self):
+        """Replay invalidations written by other processes since the last sync"""
+        now = time.monotonic()
+        if now - self._last_sync < self.sync_interval:
+            return
+        with self._sync_lock:
+            if now - self._last_sync < self.sync_interval:
+                return
+            self._last_sync = now
+            rows = self._connection().execute(
+                'SELECT seq, namespace, key, user_id, pid FROM cache_invalidations WHERE seq > ? ORDER BY seq',
+                (self._last_seq,)
+            ).fetchall()
+            if rows and rows[0][0] > self._last_seq + 1:
+                # Missed pruned log rows: local copies can't be trusted
+                self._local.clear()
+                self._record('sync_resets')
+            for seq, namespace, key, user_id, pid in rows:
+                self._last_seq = seq
+                if namespace != self.namespace or pid == self._pid:
+                    continue
+                self._record('remote_invalidations')
+                if key is not None:
+                    self._local.delete(key)
+                elif user_id is not None:
+                    self._local.invalidate_user(user_id)
+                else:
+                    self._local.clear()
+
+    def _sweep(self, conn):
+        now = time.time()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + CACHE_SWEEP_INTERVAL
+        conn.execute('DELETE FROM cache_entries WHERE expires <= ?', (now,))
+        conn.execute('DELETE FROM cache_invalidations WHERE created < ?', (now - self.LOG_RETENTION,))
+
+    def __len__(self):
+        # Entries held by this process (the shared file isn't counted)
+        return len(self._local)
+
+    @property
+    def size_bytes(self):
+        return self._local.size_bytes
+
+    def get(self, key):
+        self._sync()
+        value = self._local.get(key)
+        if value is not None:
+            self._record('hits')
+            return value
+        start = time.perf_counter()
+        row = self._connection().execute(
+            'SELECT value, expires, user_id FROM cache_entries WHERE namespace = ? AND key = ?',
+            (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            self._record('misses')
+            return None
+        blob, expires, user_id = row
+        remaining = expires - time.time()
+        if remaining <= 0:
+            self._record('expirations')
+            self._record('misses')
+            return None
+        value = pickle.loads(blob)
+        self._local.set(key, value, remaining, user_id)
+        if self._metrics is not None:
+            self._metrics.observe('shared_get_seconds', time.perf_counter() - start)
+        self._record('hits')
+        self._record('shared_hits')
+        return value
+
+    def set(self, key, value, ttl=CACHE_TTL, user_id=None):
+        user_id = None if user_id is None else str(user_id)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires, user_id) VALUES (?, ?, ?, ?, ?)',
+                (self.namespace, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl, user_id)
+            )
+            self._broadcast(conn, key=key)
+            self._sweep(conn)
+        self._local.set(key, value, ttl, user_id)
+        self._record('sets')
+
+    def delete(self, key):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?', (self.namespace, key))
+            self._broadcast(conn, key=key)
+        self._local.delete(key)
+
+    def invalidate_user(self, user_id):
+        user_id = str(user_id)
+        conn = self._connection()
+        with conn:
+            removed = conn.execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND user_id = ?', (self.namespace, user_id)
+            ).rowcount
+            self._broadcast(conn, user_id=user_id)
+        self._local.invalidate_user(user_id)
+        self._record('invalidations', removed)
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+            self._broadcast(conn)
+        self._local.clear()
+
+def create_cache_backend(name=CACHE_BACKEND, namespace='default', count_frozen=False):
+    """Create the cache backend selected by name ('memory' or 'sqlite')
+    (count_frozen=True for the cache that owns frozen documents, see estimate_size)"""
+    if name == 'sqlite':
+        return SQLiteCache(namespace=namespace, count_frozen=count_frozen)
+    if name == 'memory':
+        return LRUCache(namespace=namespace, count_frozen=count_frozen)
+    raise ValueError(f"Unknown cache backend: {name}")
+
+# Shared cache for the whole process
+_cache = LRUCache(namespace='default')
+
 def get_cached(key):
     """Get value from cache if not expired"""
-    if key in _cache:
-        entry = _cache[key]
-        if time.time() < entry["expires"]:
-            return entry["data"]
-        else:
-            # Expired, remove it
-            del _cache[key]
-    return None
+    return _cache.get(key)
 
-def set_cache(key, value, ttl=CACHE_TTL):
-    """Store value in cache with expiration"""
-    _cache[key] = {
-        "data": value,
-        "expires": time.time() + ttl
-    }
+def set_cache(key, value, ttl=CACHE_TTL, user_id=None):
+    """Store value in cache with expiration (tag with user_id so invalidate_user_cache finds it)"""
+    _cache.set(key, value, ttl, user_id)
+
+def get_or_load(key, loader, ttl=CACHE_TTL, user_id=None, stale_ttl=0, negative_ttl=0):
+    """Get value from cache, or load and store it (concurrent misses share one load)"""
+    return _cache.get_or_load(key, loader, ttl, user_id, stale_ttl, negative_ttl)
 
 def invalidate_cache(key):
     """Remove a specific key from cache"""
-    if key in _cache:
-        del _cache[key]
+    _cache.delete(key)
 
 def invalidate_user_cache(user_id):
     """Invalidate all cache entries for a specific user"""
-    keys_to_delete = [k for k in _cache.keys() if str(user_id) in k]
-    for key in keys_to_delete:
-        del _cache[key]
+    _cache.invalidate_user(user_id)
 
 def clear_cache():
     """Clear entire cache"""
-    global _cache
-    _cache = {}
+    _cache.clear()
+
+def cached(ttl=CACHE_TTL, user_id_arg=None, stale_ttl=CACHE_STALE_TTL, negative_ttl=None):
+    """
+    Decorator to cache function results
+    user_id_arg names the parameter holding the user id, so invalidate_user_cache drops the result
+    Concurrent callers with the same arguments share one call; None results are
+    cached for negative_ttl seconds (defaults to ttl, 0 disables)
+    """
+    if negative_ttl is None:
+        negative_ttl = ttl
 
-def cached(ttl=CACHE_TTL):
-    """Decorator to cache function results"""
     def decorator(func):
+        signature = inspect.signature(func) if user_id_arg else None
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Create cache key from function name and arguments
             cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
-            
-            # Try to get from cache
-            cached_result = get_cached(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Call function and cache result
-            result = func(*args, **kwargs)
-            set_cache(cache_key, result, ttl)
-            return result
-        
+            user_id = None
+            if signature is not None:
+                user_id = signature.bind(*args, **kwargs).arguments.get(user_id_arg)
+
+            # Served from cache, or one caller runs the function while the rest wait
+            return _cache.get_or_load(
+                cache_key, lambda: func(*args, **kwargs), ttl, user_id,
+                stale_ttl=stale_ttl, negative_ttl=negative_ttl
+            )
+
         return wrapper
     return decorator
-
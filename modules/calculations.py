@@ -1,3 +1,6 @@
+from bisect import bisect_left, insort
+from datetime import datetime
+
 def calculate_net_income(gross_income, tax_rate_percent):
     """Calculates net income after applying tax."""
     tax_amount = (gross_income * tax_rate_percent) / 100
@@ -33,3 +36,126 @@ def calculate_total_savings(monthly_savings):
 def calculate_total_expenses_from_savings(expenses):
     """Calculates the total amount of expenses to be deducted from savings."""
     return sum(expense['amount'] for expense in expenses)
+
+def month_key_of(date):
+    """Month (YYYY-MM) of a YYYY-MM-DD date, or None if the date is invalid."""
+    try:
+        return datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m')
+    except ValueError:
+        return None
+
+def entry_month(entry):
+    """Month of a daily entry, using the month_key stored when it was written if present."""
+    if 'month_key' in entry:
+        return entry['month_key'] or None  # '' marks an invalid date
+    return month_key_of(entry['date'])
+
+def build_month_index(daily_entries):
+    """Maps each month (YYYY-MM) to the positions of its daily entries, in order."""
+    index = {}
+    for position, entry in enumerate(daily_entries):
+        month_key = entry_month(entry)
+        if month_key is not None:  # Skip entries with invalid date format
+            index.setdefault(month_key, []).append(position)
+    return index
+
+def _by_first_position(index):
+    # Months in order of their first entry, like build_month_index
+    return dict(sorted(index.items(), key=lambda item: item[1][0]))
+
+def _with_position(index, month_key, position):
+    if month_key is None:
+        return index
+    index = dict(index)
+    positions = list(index.get(month_key, ()))
+    insort(positions, position)
+    index[month_key] = positions
+    return _by_first_position(index)
+
+def patch_month_index(index, op, positions, removed, added):
+    """Month index after a patch (see financial_db.apply_patch) changed the daily entries at positions;
+    returns a new index, the one passed in is left as is."""
+    if op == 'append':
+        return _with_position(index, entry_month(added[0]), positions[0])
+    if op == 'update':
+        old_month, new_month = entry_month(removed[0]), entry_month(added[0])
+        if old_month == new_month:
+            return index
+        index = dict(index)
+        if old_month is not None:
+            index[old_month] = [p for p in index[old_month] if p != positions[0]]
+            if not index[old_month]:
+                del index[old_month]
+        return _with_position(index, new_month, positions[0])
+    # Removed entries: drop their positions and move later ones down
+    gone = sorted(positions)
+    gone_set = set(gone)
+    result = {}
+    for month_key, month_positions in index.items():
+        kept = [p - bisect_left(gone, p) for p in month_positions if p not in gone_set]
+        if kept:
+            result[month_key] = kept
+    return _by_first_position(result)
+
+def calculate_daily_income_by_month(daily_entries, tax_rate_percent, month_totals=None, month_index=None):
+    """Groups daily entries by month (YYYY-MM) with each month's total net income.
+    month_totals (month -> net total, from running totals) replaces summing the entries,
+    and month_index (kept with the running totals) replaces reading every entry's month."""
+    if month_index is None:
+        month_index = build_month_index(daily_entries)
+    by_month = {}
+    for month_key, positions in month_index.items():
+        entries = [daily_entries[position] for position in positions]
+        if month_totals is not None and month_key in month_totals:
+            total_net = month_totals[month_key]
+        else:
+            total_net = 0
+            for entry in entries:
+                total_net += calculate_net_income(entry['gross_income'], tax_rate_percent)
+        by_month[month_key] = {'entries': entries, 'total_net': total_net}
+    return by_month
+
+def calculate_totals_from_aggregates(aggregates, total_capital, tax_rate_percent):
+    """Calculates the page totals from a document's running totals without reading any entry."""
+    totals = aggregates['totals']
+    return {
+        'remaining_capital': total_capital - totals['expenses_from_capital_total'],
+        'total_savings': totals['savings_total'],
+        'total_expenses_from_savings': totals['expenses_from_savings_total'],
+        'total_net_daily_income': calculate_net_income(totals['daily_gross_total'], tax_rate_percent),
+        'total_loan_paid': totals['loan_paid'],
+        'month_net_totals': {
+            month: calculate_net_income(month_totals['gross_total'], tax_rate_percent)
+            for month, month_totals in aggregates['months'].items()
+        }
+    }
+
+def calculate_summary(financial_data, total_capital, tax_rate_percent, aggregates=None):
+    """Calculates every total and series the pages show for a document (pure Python engine).
+    With aggregates (the document's running totals) the totals are read instead of summed."""
+    monthly_cash_flow = financial_data.get('monthly_cash_flow', [])
+    daily_entries = financial_data.get('daily_income_tracker', [])
+    monthly_savings = calculate_monthly_savings(monthly_cash_flow)
+    if aggregates is not None:
+        totals = calculate_totals_from_aggregates(aggregates, total_capital, tax_rate_percent)
+        month_net_totals = totals.pop('month_net_totals')
+        return dict(
+            totals,
+            monthly_savings=monthly_savings,
+            daily_income_by_month=calculate_daily_income_by_month(
+                daily_entries, tax_rate_percent, month_net_totals, aggregates.get('month_index')
+            )
+        )
+    return {
+        'remaining_capital': calculate_remaining_capital(
+            total_capital, financial_data.get('capital', {}).get('expenses_from_capital', [])
+        ),
+        'monthly_savings': monthly_savings,
+        'total_savings': calculate_total_savings(monthly_savings),
+        'total_expenses_from_savings': calculate_total_expenses_from_savings(
+            financial_data.get('expenses_from_savings', [])
+        ),
+        'total_net_daily_income': calculate_total_daily_net_income(daily_entries, tax_rate_percent),
+        'total_loan_paid': sum(entry.get('loan_repayment', 0) for entry in monthly_cash_flow),
+        'daily_income_by_month': calculate_daily_income_by_month(daily_entries, tax_rate_percent)
+    }
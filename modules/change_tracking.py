@@ -0,0 +1,248 @@
+"""
+Change tracking and read-only snapshots for financial data documents
+Cached documents are frozen so requests can share them without copying;
+write routes check out a TrackedDocument, which copies only what it touches
+and records which top-level sections were mutated so saves only write those
+"""
+from modules.records import Record, to_record
+
+# Nested lists stored separately from their parent section
+NESTED_SECTIONS = {('capital', 'expenses_from_capital'): 'expenses_from_capital'}
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("Cached financial data is read-only; load it with for_update=True to change it")
+
+
+class FrozenDict(dict):
+    """Read-only dict used in cached documents"""
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = _read_only
+    pop = popitem = setdefault = update = clear = __ior__ = _read_only
+
+    def __reduce__(self):
+        # Default dict pickling restores items through __setitem__
+        return (FrozenDict, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class FrozenList(tuple):
+    """Read-only list used in cached documents"""
+
+    __slots__ = ()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(value):
+    """
+    Read-only version of a document (frozen containers inside are reused, not copied)
+    Entries with a known shape become compact records (see modules/records.py)
+    """
+    if isinstance(value, (FrozenDict, FrozenList, Record)):
+        return value
+    if isinstance(value, dict):
+        record = to_record(value)
+        if record is not None:
+            return record
+        return FrozenDict((key, freeze(item)) for key, item in dict.items(value))
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in list.__iter__(value))
+    return value
+
+
+class _TrackedDict(dict):
+    """Dict that reports every mutation (including of nested containers) to a callback"""
+
+    def __init__(self, data, mark, key_marks=None):
+        super().__init__(data)
+        self._mark = mark
+        self._key_marks = key_marks or {}
+
+    def _mark_key(self, key):
+        self._key_marks.get(key, self._mark)()
+
+    def _mark_all(self):
+        self._mark()
+        for mark in self._key_marks.values():
+            mark()
+
+    def _wrap(self, key, value):
+        if isinstance(value, (_TrackedDict, _TrackedList)):
+            return value
+        if isinstance(value, (dict, list, FrozenList, Record)):
+            value = _track(value, self._key_marks.get(key, self._mark))
+            dict.__setitem__(self, key, value)
+        return value
+
+    def __getitem__(self, key):
+        return self._wrap(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._mark_key(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._mark_key(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._mark_key(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self._mark_all()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        self._mark_all()
+        dict.clear(self)
+
+
+class _TrackedList(list):
+    """List that reports every mutation (including of nested containers) to a callback"""
+
+    def __init__(self, data, mark):
+        super().__init__(data)
+        self._mark = mark
+
+    def _wrap(self, index, value):
+        if isinstance(value, (_TrackedDict, _TrackedList)):
+            return value
+        if isinstance(value, (dict, list, FrozenList, Record)):
+            value = _track(value, self._mark)
+            list.__setitem__(self, index, value)
+        return value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list.__getitem__(self, index)
+        return self._wrap(index, list.__getitem__(self, index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __reversed__(self):
+        for index in range(len(self) - 1, -1, -1):
+            yield self[index]
+
+    def _mutator(name):
+        method = getattr(list, name)
+
+        def wrapper(self, *args, **kwargs):
+            self._mark()
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = name
+        return wrapper
+
+    append = _mutator('append')
+    extend = _mutator('extend')
+    insert = _mutator('insert')
+    pop = _mutator('pop')
+    remove = _mutator('remove')
+    clear = _mutator('clear')
+    sort = _mutator('sort')
+    reverse = _mutator('reverse')
+    __setitem__ = _mutator('__setitem__')
+    __delitem__ = _mutator('__delitem__')
+    __iadd__ = _mutator('__iadd__')
+    __imul__ = _mutator('__imul__')
+    del _mutator
+
+
+def to_plain(value):
+    """Plain dict/list version of a tracked container (containers never accessed are shared, not copied)"""
+    if isinstance(value, _TrackedDict):
+        return {key: to_plain(item) for key, item in dict.items(value)}
+    if isinstance(value, _TrackedList):
+        return [to_plain(item) for item in list.__iter__(value)]
+    return value
+
+
+def _track(value, mark, key_marks=None):
+    """Wrap a container in its tracked counterpart (a shallow copy; nested values wrap lazily)"""
+    if isinstance(value, Record):
+        return _TrackedDict(dict(value), mark, key_marks)
+    if isinstance(value, dict):
+        return _TrackedDict(value, mark, key_marks)
+    return _TrackedList(value, mark)
+
+
+class TrackedDocument(_TrackedDict):
+    """
+    Financial data document that records which sections were changed
+
+    Containers are copied lazily on first access (copy-on-write), so the
+    loaded, possibly cached and frozen, document is never modified.
+    """
+
+    def __init__(self, data, base_version=None):
+        self.dirty_sections = set()
+        self.base_version = base_version
+        super().__init__(data, self._mark_everything)
+
+    def _section_mark(self, section):
+        return lambda: self.dirty_sections.add(section)
+
+    def _mark_everything(self):
+        self.dirty_sections.update(self.keys())
+        self.dirty_sections.update(NESTED_SECTIONS.values())
+
+    def _mark_key(self, key):
+        self.dirty_sections.add(key)
+        for (parent, child), section in NESTED_SECTIONS.items():
+            if parent == key:
+                self.dirty_sections.add(section)
+
+    def _wrap(self, key, value):
+        if isinstance(value, (_TrackedDict, _TrackedList)):
+            return value
+        if isinstance(value, (dict, list, FrozenList, Record)):
+            key_marks = {
+                child: self._section_mark(section)
+                for (parent, child), section in NESTED_SECTIONS.items() if parent == key
+            }
+            value = _track(value, self._section_mark(key), key_marks)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def mark_clean(self):
+        """Forget recorded changes (call after a successful save)"""
+        self.dirty_sections.clear()
@@ -0,0 +1,227 @@
+"""
+Currency conversion table
+Capital sources are stored in BDT; this converts them (and the capital totals
+derived from them) to every supported currency in one pass, so switching the
+display currency or comparing currencies is a dictionary lookup.
+"""
+import calendar
+import hashlib
+import json
+
+from modules.aggregates import get_aggregates
+from modules.calculations import entry_month
+from modules.rate_history import latest_rates, rates_on
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# Currency code -> default BDT rate (used until a rate is fetched into settings)
+SUPPORTED_CURRENCIES = {
+    'AUD': 0.0127,
+    'USD': 0.0091,
+    'NZD': 0.0135,
+    'GBP': 0.0072,
+    'CAD': 0.0124,
+    'EUR': 0.0085,
+    'SGD': 0.0122,
+    'MYR': 0.0411,
+    'JPY': 1.35,
+    'KRW': 12.10,
+    'CNY': 0.066,
+    'INR': 0.76,
+    'THB': 0.31,
+    'CHF': 0.0081,
+    'SEK': 0.095,
+    'NOK': 0.098,
+    'DKK': 0.063,
+    'AED': 0.033,
+    'SAR': 0.034
+}
+
+DEFAULT_CURRENCY = 'AUD'
+
+def rate_setting(currency):
+    """Settings key holding the BDT rate of a currency (e.g. bdt_to_aud_rate)"""
+    return f'bdt_to_{currency.lower()}_rate'
+
+def rate_snapshot(settings_data):
+    """
+    The rate table in use, with when it was fetched: {'rates', 'updated_at', 'source'}
+    The newer of the latest stored snapshot (kept current by the background refresher)
+    and the rates last fetched into the user's settings is used as a whole, so the
+    rates and the timestamp shown always belong together; currencies missing from
+    it use the defaults
+    """
+    latest = latest_rates('BDT')
+    own_updated = settings_data.get('exchange_rate_last_updated')
+    if latest and (not own_updated or latest['fetched_at'] >= own_updated):
+        stored, updated_at, source = latest['rates'], latest['fetched_at'], 'ExchangeRate-API'
+    else:
+        stored = {
+            currency: settings_data[rate_setting(currency)]
+            for currency in SUPPORTED_CURRENCIES if rate_setting(currency) in settings_data
+        }
+        updated_at = own_updated
+        source = settings_data.get('exchange_rate_source', 'ExchangeRate-API') if own_updated else None
+    return {
+        'rates': {currency: stored.get(currency, default) for currency, default in SUPPORTED_CURRENCIES.items()},
+        'updated_at': updated_at,
+        'source': source
+    }
+
+def rate_table(settings_data):
+    """BDT rate of every supported currency (the rates of rate_snapshot)"""
+    return rate_snapshot(settings_data)['rates']
+
+def rates_version(rates):
+    """Short stable digest of a rate table (part of cache keys, so changed rates miss)"""
+    encoded = json.dumps(sorted(rates.items())).encode()
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+def _convert_numpy(amounts, rates):
+    # sources x currencies; cumsum adds sources in order like the pure Python loop
+    converted = np.outer(np.asarray(amounts, dtype=np.float64), np.asarray(rates, dtype=np.float64))
+    totals = np.cumsum(converted, axis=0)[-1] if len(amounts) else np.zeros(len(rates))
+    return converted.T.tolist(), totals.tolist()
+
+def _convert_python(amounts, rates):
+    converted = [[amount * rate for amount in amounts] for rate in rates]
+    totals = []
+    for row in converted:
+        total = 0
+        for value in row:
+            total += value
+        totals.append(total)
+    return converted, totals
+
+def conversion_table(financial_data, rates):
+    """
+    Capital converted to every currency in the rate table:
+    currency -> {'rate', 'source_amounts' (per source, in order), 'total_capital',
+                 'remaining_capital', 'loan_amount'}
+    Capital expenses are recorded in the display currency and are not converted
+    """
+    sources = financial_data.get('capital', {}).get('sources', [])
+    amounts = [source.get('amount_bdt', 0) for source in sources]
+    # The last source named 'loan' is the loan (as on the loan page)
+    loan_indices = [index for index, source in enumerate(sources) if source.get('name', '').lower() == 'loan']
+    loan_index = loan_indices[-1] if loan_indices else None
+    expenses_total = get_aggregates(financial_data)['totals']['expenses_from_capital_total']
+
+    currencies = list(rates)
+    rate_values = [rates[currency] for currency in currencies]
+    if HAS_NUMPY:
+        converted, totals = _convert_numpy(amounts, rate_values)
+    else:
+        converted, totals = _convert_python(amounts, rate_values)
+
+    return {
+        currency: {
+            'rate': rate,
+            'source_amounts': tuple(source_amounts),
+            'total_capital': total,
+            'remaining_capital': total - expenses_total,
+            'loan_amount': source_amounts[loan_index] if loan_index is not None else None
+        }
+        for currency, rate, source_amounts, total in zip(currencies, rate_values, converted, totals)
+    }
+
+def _month_end(month):
+    """Last day (YYYY-MM-DD) of a YYYY-MM month, '' if it isn't one"""
+    try:
+        year, month_number = int(month[:4]), int(month[5:7])
+        return f"{month}-{calendar.monthrange(year, month_number)[1]:02d}"
+    except ValueError:
+        return ''
+
+def _rates_by_entry(history, currencies, days, current_rates):
+    """Rate of each entry's currency on its day (one sorted lookup per currency)"""
+    rates = [None] * len(days)
+    positions_by_currency = {}
+    for position, currency in enumerate(currencies):
+        positions_by_currency.setdefault(currency, []).append(position)
+    for currency, positions in positions_by_currency.items():
+        found = rates_on(history.get(currency), [days[p] for p in positions], current_rates[currency])
+        for position, rate in zip(positions, found):
+            rates[position] = rate
+    return rates
+
+def _cross_rates(history, from_currencies, to_currency, days, current_rates):
+    # Rates are quoted per BDT, so an amount in from converts to amount * to / from
+    to_rates = rates_on(history.get(to_currency), days, current_rates[to_currency])
+    from_rates = _rates_by_entry(history, from_currencies, days, current_rates)
+    return [to / source for to, source in zip(to_rates, from_rates)]
+
+def _convert_amounts(amounts, factors):
+    if HAS_NUMPY:
+        return (np.asarray(amounts, dtype=np.float64) * np.asarray(factors, dtype=np.float64)).tolist()
+    return [amount * factor for amount, factor in zip(amounts, factors)]
+
+def _sum_by_month(months, values):
+    totals = {}
+    for month, value in zip(months, values):
+        if month is not None:
+            totals[month] = totals.get(month, 0) + value
+    return totals
+
+def _entry_currencies(entries, default_currency):
+    # Entries written before the currency was recorded use default_currency
+    return [entry.get('currency') or default_currency for entry in entries]
+
+def historical_conversion(financial_data, history, to_currency, current_rates, default_currency):
+    """
+    Daily income and monthly cash flow converted at the rate in effect on each entry's date
+    (cash flow rows at their month end); each entry is converted from the currency it was
+    entered in (its 'currency', or default_currency for entries from before it was recorded)
+    history: {currency: RateSeries} from rate_history.load_history; dates before the
+    history starts, and currencies without one, use current_rates
+    """
+    current_rates = dict(current_rates, BDT=1.0)
+    daily = financial_data.get('daily_income_tracker', [])
+    cash_flow = financial_data.get('monthly_cash_flow', [])
+    daily_currencies = _entry_currencies(daily, default_currency)
+    cash_flow_currencies = _entry_currencies(cash_flow, default_currency)
+
+    daily_months = [entry_month(entry) for entry in daily]
+    daily_days = [entry['date'] if month else '' for entry, month in zip(daily, daily_months)]
+    daily_gross = _convert_amounts(
+        [entry['gross_income'] for entry in daily],
+        _cross_rates(history, daily_currencies, to_currency, daily_days, current_rates)
+    )
+
+    cash_flow_factors = _cross_rates(
+        history, cash_flow_currencies, to_currency, [_month_end(entry['month']) for entry in cash_flow],
+        current_rates
+    )
+    income = _convert_amounts([entry['income'] for entry in cash_flow], cash_flow_factors)
+    loan_repayment = _convert_amounts(
+        [entry.get('loan_repayment', 0) or 0 for entry in cash_flow], cash_flow_factors
+    )
+
+    def at_current_rate(amounts, currencies):
+        return sum(amount * current_rates[to_currency] / current_rates[currency]
+                   for amount, currency in zip(amounts, currencies))
+
+    return {
+        'to_currency': to_currency,
+        'default_currency': default_currency,
+        # Entries whose currency wasn't recorded (converted from default_currency)
+        'entries_without_currency': sum(1 for entry in list(daily) + list(cash_flow) if not entry.get('currency')),
+        'daily_gross': daily_gross,
+        'daily_gross_by_month': _sum_by_month(daily_months, daily_gross),
+        'daily_gross_total': sum(daily_gross),
+        'cash_flow_income': income,
+        'cash_flow_loan_repayment': loan_repayment,
+        'cash_flow_income_total': sum(income),
+        'cash_flow_loan_repayment_total': sum(loan_repayment),
+        # The same totals at today's rates, to show what the rate changes were worth
+        'at_current_rate': {
+            'daily_gross_total': at_current_rate([entry['gross_income'] for entry in daily], daily_currencies),
+            'cash_flow_income_total': at_current_rate([entry['income'] for entry in cash_flow],
+                                                      cash_flow_currencies)
+        }
+    }
@@ -3,31 +3,126 @@ Data Manager - Unified interface for financial data storage
 Automatically routes to PostgreSQL or JSON based on configuration
 """
 from modules.db_config import DB_TYPE
+from modules.change_tracking import TrackedDocument
+from modules.aggregates import AGGREGATES, calculate_aggregates
+from modules import financial_db
 from modules.financial_db import (
     get_default_financial_data,
+    get_entry_list,
+    apply_patch,
+    prepare_patch,
+    DocumentSnapshot,
+    load_financial_snapshot_postgres,
     load_financial_data_postgres,
     save_financial_data_postgres,
     load_financial_data_json,
+    load_financial_snapshot_json,
     save_financial_data_json
 )
 
-def load_financial_data(user_id=None, is_guest=False, guest_data=None):
+def load_financial_data(user_id=None, is_guest=False, guest_data=None, for_update=False):
     """
     Load financial data - automatically uses correct storage backend
+    With for_update=True the document records changed sections so the save only writes those
     """
     if DB_TYPE == 'postgres' and not is_guest:
+        if for_update:
+            snapshot = load_financial_snapshot_postgres(user_id, allow_stale=False)
+            return TrackedDocument(snapshot.data, snapshot.version) if snapshot else None
         return load_financial_data_postgres(user_id)
-    else:
-        return load_financial_data_json(user_id, is_guest, guest_data)
+    
+    data = load_financial_data_json(user_id, is_guest, guest_data)
+    if for_update and data is not None and not is_guest:
+        return TrackedDocument(data)
+    return data
+
+def load_financial_snapshot(user_id=None, is_guest=False, guest_data=None):
+    """
+    Load financial data together with its version (None for guests, whose data isn't versioned)
+    """
+    if is_guest:
+        return DocumentSnapshot(load_financial_data_json(user_id, is_guest, guest_data), None)
+    if DB_TYPE == 'postgres':
+        return load_financial_snapshot_postgres(user_id)
+    return load_financial_snapshot_json(user_id)
 
 def save_financial_data(data, user_id=None, is_guest=False):
     """
     Save financial data - automatically uses correct storage backend
     """
+    sections = None
+    base_version = None
+    if isinstance(data, TrackedDocument):
+        sections = set(data.dirty_sections)
+        base_version = data.base_version
+        if not sections:
+            return True  # Nothing changed
+    
     if DB_TYPE == 'postgres' and not is_guest:
-        return save_financial_data_postgres(user_id, data)
+        saved = save_financial_data_postgres(user_id, data, sections, base_version)
+    elif is_guest:
+        # Guest totals are recomputed on read rather than stored in the session cookie
+        data.pop('aggregates', None)
+        saved = save_financial_data_json(user_id, data, is_guest)
     else:
-        return save_financial_data_json(user_id, data, is_guest)
+        # Entry lists may have been edited directly, so running totals are recomputed
+        if sections is None or sections & set(AGGREGATES):
+            data['aggregates'] = calculate_aggregates(data)
+        saved = save_financial_data_json(user_id, data, is_guest)
+    
+    if saved and sections is not None:
+        data.mark_clean()
+    return saved
+
+def _patch_guest(guest_data, op, section, *args):
+    """Apply a patch to guest data in place (the caller stores it back in the session)"""
+    if guest_data is None:
+        return False
+    return apply_patch(guest_data, op, section, *prepare_patch(op, section, args))
+
+def append_entry(section, entry, user_id=None, is_guest=False, guest_data=None):
+    """
+    Append one entry to a list section without rewriting the whole document
+    """
+    if is_guest:
+        return _patch_guest(guest_data, 'append', section, entry)
+    return financial_db.append_entry(user_id, section, entry)
+
+def update_entry(section, index, fields, user_id=None, is_guest=False, guest_data=None):
+    """
+    Update fields of the entry at a list position
+    """
+    if is_guest:
+        return _patch_guest(guest_data, 'update', section, index, fields)
+    return financial_db.update_entry(user_id, section, index, fields)
+
+def remove_entry(section, index, user_id=None, is_guest=False, guest_data=None):
+    """
+    Remove the entry at a list position
+    """
+    if is_guest:
+        return _patch_guest(guest_data, 'remove', section, index)
+    return financial_db.remove_entry(user_id, section, index)
+
+def remove_entries_by_field(section, key, value, user_id=None, is_guest=False, guest_data=None):
+    """
+    Remove every entry of a section whose field equals value
+    """
+    if is_guest:
+        return _patch_guest(guest_data, 'remove_by_field', section, key, value)
+    return financial_db.remove_entries_by_field(user_id, section, key, value)
+
+def update_settings(fields, user_id=None, is_guest=False, guest_data=None):
+    """
+    Merge fields into the settings section
+    """
+    if is_guest:
+        return _patch_guest(guest_data, 'merge', 'settings', fields)
+    return financial_db.merge_section(user_id, 'settings', fields)
 
 # Re-export for compatibility
-__all__ = ['load_financial_data', 'save_financial_data', 'get_default_financial_data']
+__all__ = [
+    'load_financial_data', 'load_financial_snapshot', 'save_financial_data', 'get_default_financial_data',
+    'get_entry_list', 'append_entry', 'update_entry', 'remove_entry', 'remove_entries_by_field',
+    'update_settings'
+]
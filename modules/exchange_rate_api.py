@@ -3,9 +3,109 @@ Exchange Rate API Integration Module
 Fetches real-time currency exchange rates from ExchangeRate-API.com
 """
 
+import os
+import random
+import threading
+import time
 import requests
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterable
+from requests.adapters import HTTPAdapter
+from modules.cache import CACHE_BACKEND, StaleableValue, create_cache_backend
+
+# Seconds fetched rates are served to everyone before they are refetched
+EXCHANGE_RATE_TTL = int(os.environ.get('EXCHANGE_RATE_TTL', 3600))
+
+# Seconds past the TTL rates may still be served while one background fetch refreshes them
+EXCHANGE_RATE_STALE_TTL = int(os.environ.get('EXCHANGE_RATE_STALE_TTL', 24 * 3600))
+
+# After a failed fetch, last-known-good rates are served this long before retrying upstream
+EXCHANGE_RATE_RETRY_INTERVAL = int(os.environ.get('EXCHANGE_RATE_RETRY_INTERVAL', 60))
+
+# How long last-known-good rates are kept for fallback (seconds)
+LAST_KNOWN_GOOD_TTL = 30 * 24 * 3600
+
+# Upstream API (point it at a local stub server for testing)
+EXCHANGE_RATE_API_URL = os.environ.get('EXCHANGE_RATE_API_URL', 'https://api.exchangerate-api.com/v4/latest')
+
+# Seconds to wait for a connection and for the response; a slow upstream
+# holds a request thread at most (connect + read) * (retries + 1) plus backoff
+EXCHANGE_RATE_CONNECT_TIMEOUT = float(os.environ.get('EXCHANGE_RATE_CONNECT_TIMEOUT', 3))
+EXCHANGE_RATE_READ_TIMEOUT = float(os.environ.get('EXCHANGE_RATE_READ_TIMEOUT', 5))
+
+# Retries after a timeout, connection error, 429 or 5xx (exponential backoff with full jitter)
+EXCHANGE_RATE_RETRIES = int(os.environ.get('EXCHANGE_RATE_RETRIES', 2))
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 4.0
+
+# Consecutive failed fetches that open the circuit, and seconds it stays open
+# (fetches fail fast to cached rates) before one trial request is let through
+EXCHANGE_RATE_BREAKER_THRESHOLD = int(os.environ.get('EXCHANGE_RATE_BREAKER_THRESHOLD', 5))
+EXCHANGE_RATE_BREAKER_COOLDOWN = int(os.environ.get('EXCHANGE_RATE_BREAKER_COOLDOWN', 60))
+
+# Connections kept open to the API (requests from several threads at once)
+EXCHANGE_RATE_POOL_SIZE = int(os.environ.get('EXCHANGE_RATE_POOL_SIZE', 4))
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# Rate tables shared by every user (per process, or per host with CACHE_BACKEND=sqlite)
+_rate_cache = create_cache_backend(CACHE_BACKEND, namespace='exchange_rates')
+
+
+class RateFetchError(Exception):
+    """The upstream API could not provide a rate table"""
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated upstream failures
+    closed: requests go through; open: requests are refused until the cooldown
+    passes; half-open: one trial request decides whether it closes or reopens
+    """
+    
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at < self.cooldown:
+            return "open"
+        return "half-open"
+    
+    def allow(self) -> bool:
+        """Whether a request may go upstream now"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            # A failed trial reopens the circuit; requests already in flight when it
+            # opened don't extend it
+            if self.trial_running or (self.opened_at is None and self.failures >= self.threshold):
+                if self.opened_at is None:
+                    print(f"⚠ Exchange rate API circuit opened after {self.failures} failures")
+                self.opened_at = time.time()
+            self.trial_running = False
 
 
 class ExchangeRateAPI:
@@ -14,44 +114,92 @@ class ExchangeRateAPI:
     Free tier: 1,500 requests/month, no API key required
     """
     
-    BASE_URL = "https://api.exchangerate-api.com/v4/latest"
+    BASE_URL = EXCHANGE_RATE_API_URL
+    
+    # Shared session: keeps HTTPS connections alive between fetches
+    _session = None
+    _session_lock = threading.Lock()
+    
+    # Shared by all fetches, since they all go to the same upstream
+    _breaker = CircuitBreaker(EXCHANGE_RATE_BREAKER_THRESHOLD, EXCHANGE_RATE_BREAKER_COOLDOWN)
     
     @staticmethod
-    def fetch_rate(from_currency: str = "BDT", to_currency: str = "AUD") -> Optional[Dict]:
+    def _get_session() -> requests.Session:
+        if ExchangeRateAPI._session is None:
+            with ExchangeRateAPI._session_lock:
+                if ExchangeRateAPI._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=EXCHANGE_RATE_POOL_SIZE)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    ExchangeRateAPI._session = session
+        return ExchangeRateAPI._session
+    
+    @staticmethod
+    def _request(url: str) -> requests.Response:
+        """GET with bounded retries; raises the last error once the retries are used up"""
+        for attempt in range(EXCHANGE_RATE_RETRIES + 1):
+            try:
+                response = ExchangeRateAPI._get_session().get(
+                    url, timeout=(EXCHANGE_RATE_CONNECT_TIMEOUT, EXCHANGE_RATE_READ_TIMEOUT)
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response
+                response.raise_for_status()
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                    requests.exceptions.HTTPError):
+                if attempt == EXCHANGE_RATE_RETRIES:
+                    raise
+            # Full jitter, so workers retrying after the same outage don't arrive together
+            time.sleep(random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt)))
+    
+    @staticmethod
+    def fetch_rates(base: str = "BDT", targets: Optional[Iterable[str]] = None) -> Dict:
         """
-        Fetch the exchange rate from from_currency to to_currency
+        Fetch the exchange rates from base to several currencies with one request
+        (the API returns the whole rate table for a base currency)
         
         Args:
-            from_currency: Source currency code (default: BDT)
-            to_currency: Target currency code (default: AUD)
+            base: Source currency code (default: BDT)
+            targets: Target currency codes (default: every currency in the response)
             
         Returns:
-            Dictionary with rate, timestamp, and source info, or None if failed
+            Dictionary with success, rates (code -> rate), missing codes, timestamp and source
         """
+        breaker = ExchangeRateAPI._breaker
+        if not breaker.allow():
+            return {
+                "success": False,
+                "error": "Exchange rate API is unavailable (circuit open), try again later"
+            }
         try:
-            # Fetch rates with BDT as base currency
-            response = requests.get(f"{ExchangeRateAPI.BASE_URL}/{from_currency}", timeout=10)
+            try:
+                response = ExchangeRateAPI._request(f"{ExchangeRateAPI.BASE_URL}/{base}")
+            except requests.exceptions.RequestException:
+                breaker.record_failure()
+                raise
+            # Any other answer means the upstream is up (e.g. 404 for an unknown base)
+            breaker.record_success()
             response.raise_for_status()
             
-            data = response.json()
+            all_rates = response.json().get("rates", {})
+            if targets is None:
+                targets = list(all_rates)
+            rates = {code: all_rates[code] for code in targets if code in all_rates}
             
-            # Extract the rate for target currency
-            if to_currency in data.get("rates", {}):
-                rate = data["rates"][to_currency]
-                
-                return {
-                    "rate": rate,
-                    "from_currency": from_currency,
-                    "to_currency": to_currency,
-                    "timestamp": datetime.now().isoformat(),
-                    "source": "ExchangeRate-API",
-                    "success": True
-                }
-            else:
+            if not rates:
                 return {
                     "success": False,
-                    "error": f"Currency {to_currency} not found in rates"
+                    "error": f"None of the requested currencies were found in the {base} rates"
                 }
+            return {
+                "rates": rates,
+                "missing": [code for code in targets if code not in all_rates],
+                "from_currency": base,
+                "timestamp": datetime.now().isoformat(),
+                "source": "ExchangeRate-API",
+                "success": True
+            }
                 
         except requests.exceptions.Timeout:
             return {
@@ -69,6 +217,103 @@ class ExchangeRateAPI:
                 "error": f"Unexpected error: {str(e)}"
             }
     
+    @staticmethod
+    def _fetch_table(base: str) -> Dict:
+        """Fetch a base currency's full rate table and remember it as last-known-good"""
+        result = ExchangeRateAPI.fetch_rates(base)
+        if result.get("success"):
+            _rate_cache.set(f"rates_last_good:{base}", result, LAST_KNOWN_GOOD_TTL)
+            return result
+        
+        error = result.get("error", "Failed to fetch exchange rates")
+        last_good = _rate_cache.get(f"rates_last_good:{base}")
+        if last_good is not None:
+            print(f"⚠ Exchange rate fetch failed, serving last-known-good {base} rates: {error}")
+            # Served as if fresh until the retry interval passes, so an outage costs
+            # one upstream call per interval (also when this runs as a background refresh)
+            _rate_cache.set(
+                f"rates:{base}",
+                StaleableValue(dict(last_good, stale=True), time.time() + EXCHANGE_RATE_RETRY_INTERVAL),
+                EXCHANGE_RATE_RETRY_INTERVAL + EXCHANGE_RATE_STALE_TTL
+            )
+        raise RateFetchError(error)
+    
+    @staticmethod
+    def refresh_rates(base: str = "BDT") -> Dict:
+        """
+        Fetch a base currency's rates now and make them the shared cached table
+        (used by the background refresher; falls back like get_rates on failure)
+        """
+        try:
+            table = ExchangeRateAPI._fetch_table(base)
+        except RateFetchError:
+            return ExchangeRateAPI.get_rates(base)
+        _rate_cache.set(
+            f"rates:{base}", StaleableValue(table, time.time() + EXCHANGE_RATE_TTL),
+            EXCHANGE_RATE_TTL + EXCHANGE_RATE_STALE_TTL
+        )
+        return dict(table, stale=False)
+    
+    @staticmethod
+    def get_rates(base: str = "BDT", targets: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Exchange rates from base, from the rate cache shared by all users
+        
+        Within EXCHANGE_RATE_TTL the cached table is returned; after it, the stale table
+        is returned while one background fetch refreshes it. If fetching fails the
+        last-known-good table is served (marked stale) and upstream is retried at most
+        every EXCHANGE_RATE_RETRY_INTERVAL seconds.
+        
+        Returns:
+            Same shape as fetch_rates (timestamp is when the table was fetched),
+            plus stale (True when serving last-known-good rates after a failed fetch)
+        """
+        key = f"rates:{base}"
+        try:
+            table = _rate_cache.get_or_load(
+                key, lambda: ExchangeRateAPI._fetch_table(base),
+                ttl=EXCHANGE_RATE_TTL, stale_ttl=EXCHANGE_RATE_STALE_TTL
+            )
+        except RateFetchError as e:
+            table = _rate_cache.get(f"rates_last_good:{base}")
+            if table is None:
+                return {"success": False, "error": str(e)}
+            table = dict(table, stale=True)
+        
+        all_rates = table["rates"]
+        if targets is None:
+            targets = list(all_rates)
+        return dict(
+            table,
+            rates={code: all_rates[code] for code in targets if code in all_rates},
+            missing=[code for code in targets if code not in all_rates],
+            stale=table.get("stale", False)
+        )
+    
+    @staticmethod
+    def fetch_rate(from_currency: str = "BDT", to_currency: str = "AUD") -> Optional[Dict]:
+        """
+        Fetch the exchange rate from from_currency to to_currency
+        
+        Args:
+            from_currency: Source currency code (default: BDT)
+            to_currency: Target currency code (default: AUD)
+            
+        Returns:
+            Dictionary with rate, timestamp, and source info, or None if failed
+        """
+        result = ExchangeRateAPI.fetch_rates(from_currency, [to_currency])
+        if not result.get("success"):
+            return result
+        return {
+            "rate": result["rates"][to_currency],
+            "from_currency": from_currency,
+            "to_currency": to_currency,
+            "timestamp": result["timestamp"],
+            "source": result["source"],
+            "success": True
+        }
+    
     @staticmethod
     def format_timestamp(iso_timestamp: str) -> str:
         """
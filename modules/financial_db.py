@@ -4,15 +4,24 @@ WITH CONNECTION POOLING AND CACHING for better performance
 """
 import json
 import os
+import threading
+from collections import namedtuple
 from modules.db_config import DB_TYPE, DATABASE_URL
-from modules.cache import get_cached, set_cache, invalidate_user_cache
+from modules.cache import CACHE_BACKEND, CACHE_STALE_TTL, create_cache_backend, invalidate_user_cache
+from modules.change_tracking import freeze
+from modules.records import json_default
+from modules.calculations import build_month_index, month_key_of
+from modules.aggregates import (
+    AGGREGATES, TOTAL_FIELDS, empty_aggregates, entry_delta, apply_delta, calculate_aggregates,
+    copy_aggregates, find_drift, update_month_index
+)
 
 # Import appropriate database driver
 USE_POOL = False  # Default: no pool
 
 if DB_TYPE == 'postgres':
     import psycopg2
-    from psycopg2.extras import RealDictCursor, Json
+    from psycopg2.extras import RealDictCursor, Json, execute_values
     try:
         from modules.db_pool import get_connection, return_connection
         USE_POOL = True
@@ -22,6 +31,77 @@ if DB_TYPE == 'postgres':
         print("  Using direct connections (slower but works)")
         USE_POOL = False
 
+# List sections stored one row per entry instead of inside the JSONB document
+# section -> (table, legacy JSONB source, ((json_key, column, sql_type), ...))
+ENTRY_TABLES = {
+    'daily_income_tracker': ('daily_income_entries', 'daily_income_tracker', (
+        ('date', 'entry_date', 'TEXT'),
+        ('hours_worked', 'hours_worked', 'DOUBLE PRECISION'),
+        ('gross_income', 'gross_income', 'DOUBLE PRECISION'),
+        ('month_key', 'month_key', 'TEXT'),
+        ('currency', 'currency', 'TEXT'),
+    )),
+    'monthly_cash_flow': ('monthly_cash_flow_entries', 'monthly_cash_flow', (
+        ('month', 'month', 'TEXT'),
+        ('income', 'income', 'DOUBLE PRECISION'),
+        ('loan_repayment', 'loan_repayment', 'DOUBLE PRECISION'),
+        ('currency', 'currency', 'TEXT'),
+    )),
+    'expenses_from_savings': ('expenses_from_savings_entries', 'expenses_from_savings', (
+        ('name', 'name', 'TEXT'),
+        ('amount', 'amount', 'DOUBLE PRECISION'),
+    )),
+    'expenses_from_capital': ('expenses_from_capital_entries', "capital->'expenses_from_capital'", (
+        ('name', 'name', 'TEXT'),
+        ('amount', 'amount', 'DOUBLE PRECISION'),
+    )),
+}
+
+# Advisory lock key serializing table setup and migration across workers
+MIGRATION_LOCK_ID = 7214530981
+
+# JSONB columns of financial_data, and every section a save can write
+DOCUMENT_COLUMNS = ('profile', 'settings', 'capital')
+ALL_SECTIONS = DOCUMENT_COLUMNS + tuple(ENTRY_TABLES)
+
+def _open_connection():
+    """Get a PostgreSQL connection (pooled if available)"""
+    if USE_POOL:
+        return get_connection()
+    return psycopg2.connect(DATABASE_URL, sslmode='require')
+
+def _close_connection(conn):
+    """Return a PostgreSQL connection to the pool or close it"""
+    if USE_POOL:
+        return_connection(conn)
+    else:
+        conn.close()
+
+# Financial documents live in the configured cache backend
+# (CACHE_BACKEND=sqlite shares them, and their invalidations, between worker processes)
+_document_cache = create_cache_backend(CACHE_BACKEND, namespace='financial_data', count_frozen=True)
+
+# A financial data document with the version it was read or written at
+# (documents from the cache are frozen; load with for_update=True to change them)
+DocumentSnapshot = namedtuple('DocumentSnapshot', ['data', 'version'])
+
+# Lists kept inside a JSONB column: section -> (column, key)
+JSONB_LIST_SECTIONS = {
+    'sources': ('capital', 'sources'),
+}
+
+# Object sections that can be patched with a shallow merge
+MERGE_SECTIONS = ('profile', 'settings')
+
+def get_entry_list(data, section):
+    """Return the list holding a section's entries inside a financial data document"""
+    if section == 'expenses_from_capital':
+        return data['capital']['expenses_from_capital']
+    if section in JSONB_LIST_SECTIONS:
+        column, key = JSONB_LIST_SECTIONS[section]
+        return data[column][key]
+    return data[section]
+
 def init_financial_tables():
     """Initialize financial data tables in PostgreSQL"""
     if DB_TYPE != 'postgres':
@@ -31,6 +111,10 @@ def init_financial_tables():
         conn = psycopg2.connect(DATABASE_URL, sslmode='require')
         cursor = conn.cursor()
         
+        # Workers starting together wait here, so one of them creates and migrates
+        # the tables and the rest find the work done (released at the commit below)
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+        
         # Create financial_data table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS financial_data (
@@ -45,9 +129,68 @@ def init_financial_tables():
             )
         ''')
         
+        # Bumped on every write so cached copies can be checked for staleness
+        cursor.execute('ALTER TABLE financial_data ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0')
+        
         # Create index for faster lookups
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_financial_user_id ON financial_data(user_id)')
         
+        # Create one table per list section (one row per entry)
+        for table, _, columns in ENTRY_TABLES.values():
+            column_defs = ',\n'.join(f'{column} {sql_type}' for _, column, sql_type in columns)
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    {column_defs}
+                )
+            ''')
+            # (user_id, id) gives ordered per-user scans and index lookups by position
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table}(user_id, id)')
+        
+        # Month of each daily entry, set on write so reads never parse dates
+        cursor.execute('ALTER TABLE daily_income_entries ADD COLUMN IF NOT EXISTS month_key TEXT')
+        
+        # Display currency an entry's amounts were entered in (NULL for older entries)
+        cursor.execute('ALTER TABLE daily_income_entries ADD COLUMN IF NOT EXISTS currency TEXT')
+        cursor.execute('ALTER TABLE monthly_cash_flow_entries ADD COLUMN IF NOT EXISTS currency TEXT')
+        
+        migrate_jsonb_entries_to_rows(cursor)
+        backfill_month_keys(cursor)
+        
+        # Running totals per user, updated with each entry write (see modules/aggregates.py)
+        total_defs = ',\n'.join(f'{name} DOUBLE PRECISION NOT NULL DEFAULT 0' for name in TOTAL_FIELDS)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS financial_aggregates (
+                user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                {total_defs}
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS daily_income_month_totals (
+                user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                month TEXT NOT NULL,
+                gross_total DOUBLE PRECISION NOT NULL DEFAULT 0,
+                entry_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, month)
+            )
+        ''')
+        
+        # Users from before the aggregate tables existed; built while the lock is held,
+        # so workers starting together don't store the same users' totals twice
+        cursor.execute('''
+            SELECT user_id FROM financial_data
+            WHERE user_id NOT IN (SELECT user_id FROM financial_aggregates)
+        ''')
+        missing = [row[0] for row in cursor.fetchall()]
+        document_cursor = conn.cursor(cursor_factory=RealDictCursor)
+        for user_id in missing:
+            data = {'capital': {}}
+            _set_entry_lists(data, _select_document(document_cursor, user_id))
+            _store_aggregates(cursor, user_id, calculate_aggregates(data))
+        if missing:
+            print(f"✓ Built running totals for {len(missing)} users")
+        
         conn.commit()
         conn.close()
         print("✓ Financial tables initialized (PostgreSQL)")
@@ -55,9 +198,99 @@ def init_financial_tables():
         print(f"✗ ERROR initializing financial tables: {e}")
         raise
 
-def get_default_financial_data():
-    """Returns default financial data structure for new users"""
-    return {
+def _unknown_entry_keys(cursor, source, keys):
+    """(user_id, key) pairs of JSONB entries with keys the entry table has no column for"""
+    cursor.execute(f'''
+        SELECT DISTINCT f.user_id, k.key
+        FROM financial_data f,
+             jsonb_array_elements(f.{source}) AS e(value),
+             jsonb_object_keys(CASE WHEN jsonb_typeof(e.value) = 'object' THEN e.value ELSE '{{}}' END) AS k(key)
+        WHERE jsonb_typeof(f.{source}) = 'array' AND NOT (k.key = ANY(%s))
+        ORDER BY f.user_id, k.key
+    ''', (list(keys),))
+    return cursor.fetchall()
+
+def migrate_jsonb_entries_to_rows(cursor):
+    """
+    Move entries still stored in the JSONB document into the entry tables (idempotent)
+    Runs inside init_financial_tables' transaction, after it takes the migration lock
+    """
+    for section, (table, source, columns) in ENTRY_TABLES.items():
+        # Entry tables only have columns for the known keys; stop rather than drop data
+        unknown = _unknown_entry_keys(cursor, source, [key for key, _, _ in columns])
+        if unknown:
+            listed = ', '.join(f"user {user_id}: {key}" for user_id, key in unknown[:10])
+            raise RuntimeError(
+                f"{section} entries have keys with no column in {table} ({listed}); "
+                f"add the columns to ENTRY_TABLES before migrating"
+            )
+        
+        # Documents that already have rows are left alone (their rows are the source of truth)
+        cursor.execute(f'''
+            SELECT f.user_id FROM financial_data f
+            WHERE jsonb_typeof(f.{source}) = 'array' AND f.{source} <> '[]'
+              AND EXISTS (SELECT 1 FROM {table} t WHERE t.user_id = f.user_id)
+        ''')
+        skipped = [row[0] for row in cursor.fetchall()]
+        if skipped:
+            print(f"⚠ Not migrating {section} for users {skipped}: they already have rows in {table}, "
+                  f"and their JSONB entries are kept for manual review")
+        
+        column_names = ', '.join(column for _, column, _ in columns)
+        values = ', '.join(
+            f"e.value->>'{key}'" if sql_type == 'TEXT'
+            else f"COALESCE((e.value->>'{key}')::{sql_type}, 0)"
+            for key, _, sql_type in columns
+        )
+        # ORDER BY keeps the original list order in the SERIAL ids
+        cursor.execute(f'''
+            INSERT INTO {table} (user_id, {column_names})
+            SELECT f.user_id, {values}
+            FROM financial_data f,
+                 jsonb_array_elements(f.{source}) WITH ORDINALITY AS e(value, position)
+            WHERE jsonb_typeof(f.{source}) = 'array'
+              AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.user_id = f.user_id)
+            ORDER BY f.user_id, e.position
+        ''')
+        moved = cursor.rowcount
+        
+        # Clear the migrated JSONB copy so the rows become the only source of truth
+        if section == 'expenses_from_capital':
+            cursor.execute('''
+                UPDATE financial_data SET capital = capital - 'expenses_from_capital'
+                WHERE capital ? 'expenses_from_capital' AND NOT (user_id = ANY(%s))
+            ''', (skipped,))
+        else:
+            cursor.execute(f'''
+                UPDATE financial_data SET {section} = '[]'
+                WHERE {section} IS NOT NULL AND {section} <> '[]' AND NOT (user_id = ANY(%s))
+            ''', (skipped,))
+        
+        if moved > 0:
+            print(f"✓ Migrated {moved} {section} entries to {table}")
+
+def backfill_month_keys(cursor):
+    """Set month_key on daily entries written before it existed ('' marks an invalid date)"""
+    cursor.execute('SELECT id, entry_date FROM daily_income_entries WHERE month_key IS NULL')
+    rows = [(entry_id, month_key_of(date) or '') for entry_id, date in cursor.fetchall()]
+    if rows:
+        execute_values(
+            cursor,
+            'UPDATE daily_income_entries e SET month_key = v.month_key FROM (VALUES %s) AS v(id, month_key) WHERE e.id = v.id',
+            rows
+        )
+        print(f"✓ Set month keys on {len(rows)} daily entries")
+
+def prepare_entry(section, fields):
+    """Entry (or update fields) with derived values added: the month of a daily entry's date"""
+    if section == 'daily_income_tracker' and 'date' in fields:
+        return dict(fields, month_key=month_key_of(fields['date']) or '')
+    return fields
+
+def get_default_financial_data(is_guest=False):
+    """Returns default financial data structure for new users
+    (guests get no running totals: they are recomputed on read instead of stored in the session cookie)"""
+    data = {
         "profile": {
             "name": "Your Name",
             "goal": "Financial Planning"
@@ -83,102 +316,248 @@ def get_default_financial_data():
         },
         "monthly_cash_flow": [],
         "expenses_from_savings": [],
-        "daily_income_tracker": []
+        "daily_income_tracker": [],
+        "aggregates": empty_aggregates()
     }
+    if is_guest:
+        del data['aggregates']
+    return data
 
-def load_financial_data_postgres(user_id):
-    """Load financial data from PostgreSQL with caching"""
-    # Try cache first
-    cache_key = f"financial_data:{user_id}"
-    cached_data = get_cached(cache_key)
-    if cached_data is not None:
-        return cached_data
-    
-    # If not in cache, load from database
+def _entry_rows_sql(section):
+    """SQL sub-select returning a section's rows as a JSON array in insertion order"""
+    table, _, columns = ENTRY_TABLES[section]
+    fields = ', '.join(f"'{key}', {column}" for key, column, _ in columns)
+    return f'''COALESCE((SELECT json_agg(json_build_object({fields}) ORDER BY id)
+                         FROM {table} WHERE user_id = u.user_id), '[]')'''
+
+def _document_columns(data):
+    """Values for the JSONB columns of financial_data (entry sections live in their own tables)"""
+    capital = {k: v for k, v in data.get('capital', {}).items() if k != 'expenses_from_capital'}
+    return (
+        Json(data.get('profile', {}), dumps=_dumps),
+        Json(data.get('settings', {}), dumps=_dumps),
+        Json(capital, dumps=_dumps)
+    )
+
+def _dumps(value):
+    # Documents checked out from the cache can still hold compact records
+    return json.dumps(value, default=json_default)
+
+def _replace_entry_rows(cursor, user_id, section, entries):
+    """Replace every row of one section for a user"""
+    table, _, columns = ENTRY_TABLES[section]
+    cursor.execute(f'DELETE FROM {table} WHERE user_id = %s', (user_id,))
+    entries = [prepare_entry(section, entry) for entry in entries]
+    if entries:
+        column_names = ', '.join(column for _, column, _ in columns)
+        execute_values(
+            cursor,
+            f'INSERT INTO {table} (user_id, {column_names}) VALUES %s',
+            [(user_id, *(entry.get(key) for key, _, _ in columns)) for entry in entries]
+        )
+
+def _store_aggregates(cursor, user_id, aggregates):
+    """Overwrite a user's stored running totals"""
+    names = ', '.join(TOTAL_FIELDS)
+    updates = ', '.join(f'{name} = EXCLUDED.{name}' for name in TOTAL_FIELDS)
+    cursor.execute(f'''
+        INSERT INTO financial_aggregates (user_id, {names})
+        VALUES (%s, {', '.join(['%s'] * len(TOTAL_FIELDS))})
+        ON CONFLICT (user_id) DO UPDATE SET {updates}
+    ''', (user_id, *(aggregates['totals'].get(name, 0) for name in TOTAL_FIELDS)))
+    cursor.execute('DELETE FROM daily_income_month_totals WHERE user_id = %s', (user_id,))
+    if aggregates['months']:
+        execute_values(
+            cursor,
+            '''
+                INSERT INTO daily_income_month_totals (user_id, month, gross_total, entry_count) VALUES %s
+                ON CONFLICT (user_id, month) DO UPDATE SET
+                    gross_total = EXCLUDED.gross_total, entry_count = EXCLUDED.entry_count
+            ''',
+            [(user_id, month, totals['gross_total'], totals['count'])
+             for month, totals in aggregates['months'].items()]
+        )
+
+def _add_aggregates(cursor, user_id, delta):
+    """Add a change in running totals (from entry_delta) to a user's stored totals"""
+    names = [name for name in TOTAL_FIELDS if delta['totals'].get(name)]
+    if names:
+        updates = ', '.join(f'{name} = financial_aggregates.{name} + EXCLUDED.{name}' for name in names)
+        cursor.execute(f'''
+            INSERT INTO financial_aggregates (user_id, {', '.join(names)})
+            VALUES (%s, {', '.join(['%s'] * len(names))})
+            ON CONFLICT (user_id) DO UPDATE SET {updates}
+        ''', (user_id, *(delta['totals'][name] for name in names)))
+    months = [(user_id, month, change['gross_total'], change['count'])
+              for month, change in delta['months'].items() if change['count'] or change['gross_total']]
+    if months:
+        execute_values(
+            cursor,
+            '''
+                INSERT INTO daily_income_month_totals AS t (user_id, month, gross_total, entry_count) VALUES %s
+                ON CONFLICT (user_id, month) DO UPDATE SET
+                    gross_total = t.gross_total + EXCLUDED.gross_total,
+                    entry_count = t.entry_count + EXCLUDED.entry_count
+            ''',
+            months
+        )
+
+def load_financial_snapshot_postgres(user_id, allow_stale=True):
+    """
+    Load financial data and its version from PostgreSQL with caching
+    Concurrent misses for the same user share a single query; with CACHE_STALE_TTL
+    set, an expired copy is served while one background thread reloads it
+    (allow_stale=False waits for the fresh copy, for read-modify-write callers)
+    """
+    # Read-only copy cached for 30 seconds (requests share it without copying);
+    # failed loads return None and are not cached
+    return _document_cache.get_or_load(
+        f"financial_data:{user_id}", lambda: _query_financial_snapshot(user_id),
+        ttl=30, user_id=user_id, stale_ttl=CACHE_STALE_TTL, allow_stale=allow_stale
+    )
+
+def _select_document(cursor, user_id):
+    """Document columns, entry rows and stored totals of a user in a single round trip
+    (cursor is a RealDictCursor; profile is None when the user has no document yet)"""
+    cursor.execute(f'''
+        SELECT f.profile, f.settings, f.capital, f.version,
+               {_entry_rows_sql('monthly_cash_flow')} AS monthly_cash_flow,
+               {_entry_rows_sql('expenses_from_savings')} AS expenses_from_savings,
+               {_entry_rows_sql('daily_income_tracker')} AS daily_income_tracker,
+               {_entry_rows_sql('expenses_from_capital')} AS expenses_from_capital,
+               (SELECT row_to_json(a) FROM financial_aggregates a
+                WHERE a.user_id = u.user_id) AS aggregate_totals,
+               (SELECT json_object_agg(m.month, json_build_object('gross_total', m.gross_total,
+                                                                  'count', m.entry_count))
+                FROM daily_income_month_totals m
+                WHERE m.user_id = u.user_id AND m.entry_count > 0) AS aggregate_months
+        FROM (SELECT %s AS user_id) u
+        LEFT JOIN financial_data f ON f.user_id = u.user_id
+    ''', (user_id,))
+    return cursor.fetchone()
+
+def _set_entry_lists(data, result):
+    """Put the entry rows selected by _select_document into a document"""
+    data['capital']['expenses_from_capital'] = result['expenses_from_capital']
+    data['monthly_cash_flow'] = result['monthly_cash_flow']
+    data['expenses_from_savings'] = result['expenses_from_savings']
+    data['daily_income_tracker'] = result['daily_income_tracker']
+
+def _query_financial_snapshot(user_id):
+    """Load financial data and its version from the database"""
     conn = None
     try:
-        # Use pool if available, otherwise direct connection
-        if USE_POOL:
-            conn = get_connection()
-        else:
-            conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+        conn = _open_connection()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
+        result = _select_document(cursor, user_id)
         
-        cursor.execute('''
-            SELECT profile, settings, capital, monthly_cash_flow, 
-                   expenses_from_savings, daily_income_tracker
-            FROM financial_data WHERE user_id = %s
-        ''', (user_id,))
-        
-        result = cursor.fetchone()
-        
-        if result:
+        if result['profile'] is None:
+            # Create default data for new user (keeping any rows already written)
+            data = get_default_financial_data()
+            cursor.execute('''
+                INSERT INTO financial_data (user_id, profile, settings, capital, updated_at)
+                VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO NOTHING
+            ''', (user_id, *_document_columns(data)))
+            conn.commit()
+            version = 0
+        else:
             data = {
                 "profile": result['profile'] or {},
                 "settings": result['settings'] or {},
-                "capital": result['capital'] or {"sources": [], "expenses_from_capital": []},
-                "monthly_cash_flow": result['monthly_cash_flow'] or [],
-                "expenses_from_savings": result['expenses_from_savings'] or [],
-                "daily_income_tracker": result['daily_income_tracker'] or []
+                "capital": result['capital'] or {"sources": []}
+            }
+            version = result['version']
+        
+        _set_entry_lists(data, result)
+        
+        if result['aggregate_totals'] is not None:
+            data['aggregates'] = {
+                'totals': {name: result['aggregate_totals'][name] for name in TOTAL_FIELDS},
+                'months': result['aggregate_months'] or {},
+                # Not stored in a table: built from the rows read here, then patched on write
+                'month_index': build_month_index(data['daily_income_tracker'])
             }
-            # Cache the result for 30 seconds
-            set_cache(cache_key, data, ttl=30)
-            return data
         else:
-            # Create default data for new user
-            default_data = get_default_financial_data()
-            save_financial_data_postgres(user_id, default_data)
-            return default_data
+            data['aggregates'] = calculate_aggregates(data)
+        
+        return DocumentSnapshot(freeze(data), version)
             
     except Exception as e:
         print(f"Error loading financial data from PostgreSQL: {e}")
         return None
     finally:
         if conn:
-            if USE_POOL:
-                return_connection(conn)
-            else:
-                conn.close()
+            _close_connection(conn)
+
+def load_financial_data_postgres(user_id):
+    """Load financial data from PostgreSQL with caching"""
+    snapshot = load_financial_snapshot_postgres(user_id)
+    return snapshot.data if snapshot is not None else None
 
-def save_financial_data_postgres(user_id, data):
-    """Save financial data to PostgreSQL and invalidate cache"""
+def save_financial_data_postgres(user_id, data, sections=None, base_version=None):
+    """
+    Save financial data to PostgreSQL (optionally only some sections) and cache what was written
+    base_version is the version the document was loaded at (needed to cache a partial save)
+    """
+    if sections is None:
+        sections = ALL_SECTIONS
+    
     conn = None
     try:
-        # Use pool if available, otherwise direct connection
-        if USE_POOL:
-            conn = get_connection()
-        else:
-            conn = psycopg2.connect(DATABASE_URL, sslmode='require')
+        conn = _open_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO financial_data 
-            (user_id, profile, settings, capital, monthly_cash_flow, 
-             expenses_from_savings, daily_income_tracker, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-            ON CONFLICT (user_id) 
-            DO UPDATE SET
-                profile = EXCLUDED.profile,
-                settings = EXCLUDED.settings,
-                capital = EXCLUDED.capital,
-                monthly_cash_flow = EXCLUDED.monthly_cash_flow,
-                expenses_from_savings = EXCLUDED.expenses_from_savings,
-                daily_income_tracker = EXCLUDED.daily_income_tracker,
-                updated_at = CURRENT_TIMESTAMP
-        ''', (
-            user_id,
-            Json(data.get('profile', {})),
-            Json(data.get('settings', {})),
-            Json(data.get('capital', {})),
-            Json(data.get('monthly_cash_flow', [])),
-            Json(data.get('expenses_from_savings', [])),
-            Json(data.get('daily_income_tracker', []))
-        ))
+        # Only touch the JSONB columns that changed; always bump the version
+        values = dict(zip(DOCUMENT_COLUMNS, _document_columns(data)))
+        columns = [column for column in DOCUMENT_COLUMNS if column in sections]
+        set_sql = ''.join(f'{column} = %s, ' for column in columns)
+        cursor.execute(f'''
+            UPDATE financial_data
+            SET {set_sql}version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = %s
+            RETURNING version
+        ''', (*(values[column] for column in columns), user_id))
+        row = cursor.fetchone()
+        
+        if row is None:
+            cursor.execute('''
+                INSERT INTO financial_data 
+                (user_id, profile, settings, capital, version, updated_at)
+                VALUES (%s, %s, %s, %s, 1, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) 
+                DO UPDATE SET
+                    profile = EXCLUDED.profile,
+                    settings = EXCLUDED.settings,
+                    capital = EXCLUDED.capital,
+                    version = financial_data.version + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                RETURNING version
+            ''', (user_id, *_document_columns(data)))
+            row = cursor.fetchone()
+        version = row[0]
+        
+        document = data
+        entry_sections = [section for section in ENTRY_TABLES if section in sections]
+        for section in entry_sections:
+            if section == 'expenses_from_capital':
+                entries = data.get('capital', {}).get('expenses_from_capital', [])
+            else:
+                entries = data.get(section, [])
+            _replace_entry_rows(cursor, user_id, section, entries)
+        if entry_sections:
+            # Rows were replaced wholesale, so recompute the running totals too
+            document = dict(data, aggregates=calculate_aggregates(data))
+            _store_aggregates(cursor, user_id, document['aggregates'])
         
         conn.commit()
         
-        # Invalidate cache for this user
-        invalidate_user_cache(user_id)
+        # The saved document is current if every section was written, or if
+        # nothing else was written since it was loaded
+        if set(sections) >= set(ALL_SECTIONS) or base_version == version - 1:
+            _write_through(user_id, version, document=freeze(document))
+        else:
+            _write_through(user_id, None)
         
         return True
         
@@ -189,17 +568,195 @@ def save_financial_data_postgres(user_id, data):
         return False
     finally:
         if conn:
-            if USE_POOL:
-                return_connection(conn)
-            else:
-                conn.close()
+            _close_connection(conn)
+
+# Serializes cache write-through so a slower writer can't overwrite a newer document
+_write_through_lock = threading.Lock()
+
+def _set_entry_list(data, section, entries):
+    if section == 'expenses_from_capital':
+        data['capital']['expenses_from_capital'] = entries
+    elif section in JSONB_LIST_SECTIONS:
+        column, key = JSONB_LIST_SECTIONS[section]
+        data[column][key] = entries
+    else:
+        data[section] = entries
+
+def _patched_copy(data, op, section, *args):
+    """Copy of a document with a patch applied, sharing every container the patch doesn't touch"""
+    document = dict(data)
+    if op == 'merge':
+        document[section] = dict(document.get(section) or {})
+    else:
+        if document.get('aggregates') is not None:
+            document['aggregates'] = copy_aggregates(document['aggregates'])
+        if section == 'expenses_from_capital' or section in JSONB_LIST_SECTIONS:
+            document['capital'] = dict(document['capital'])
+        entries = list(get_entry_list(document, section))
+        if op == 'update' and 0 <= args[0] < len(entries):
+            entries[args[0]] = dict(entries[args[0]])
+        _set_entry_list(document, section, entries)
+    apply_patch(document, op, section, *args)
+    return freeze(document)
+
+def _write_through(user_id, version, document=None, patch=None):
+    """
+    Cache the document as it is after a write at the new version, so the
+    post-redirect GET is served from memory. Falls back to invalidation when
+    the cached copy can't be brought up to date (e.g. another write in between).
+    """
+    cache_key = f"financial_data:{user_id}"
+    with _write_through_lock:
+        cached_snapshot = _document_cache.peek(cache_key)
+        if version is not None and document is None and patch is not None:
+            if cached_snapshot is not None and cached_snapshot.version == version - 1:
+                document = _patched_copy(cached_snapshot.data, *patch)
+        
+        # Other entries for this user (derived results) are now stale
+        invalidate_user_cache(user_id)
+        
+        is_newer = version is None or cached_snapshot is None or cached_snapshot.version < version
+        if version is not None and document is not None and is_newer:
+            _document_cache.set(cache_key, DocumentSnapshot(document, version), ttl=30, user_id=user_id)
+        elif cached_snapshot is not None and is_newer:
+            _document_cache.delete(cache_key)
+
+def _entry_id_sql(table):
+    """SQL sub-select resolving a list position (0-based) to a row id"""
+    return f'(SELECT id FROM {table} WHERE user_id = %s ORDER BY id OFFSET %s LIMIT 1)'
+
+def _execute_write_postgres(user_id, action, sql, params, patch, apply_rows=None):
+    """
+    Run a write statement returning (changed rows, new version), commit and
+    write the change through to the cached document
+    With apply_rows the statement returns (new version, ...) per changed row
+    instead, and apply_rows(cursor, rows) runs in the same transaction
+    """
+    conn = None
+    try:
+        conn = _open_connection()
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        if apply_rows is None:
+            row = cursor.fetchone()
+            changed, version = row if row is not None else (0, None)
+        else:
+            rows = cursor.fetchall()
+            changed, version = len(rows), (rows[0][0] if rows else None)
+            if rows:
+                apply_rows(cursor, [row[1:] for row in rows])
+        conn.commit()
+        
+        if changed:
+            _write_through(user_id, version, patch=patch)
+        
+        return bool(changed)
+        
+    except Exception as e:
+        print(f"Error {action} entry in PostgreSQL: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn:
+            _close_connection(conn)
+
+def _write_entry_postgres(user_id, action, section, sql, params, patch, returning, signs):
+    """
+    Run a single-row entry statement and bump the document version in the same round trip,
+    then add the changed rows to the running totals before committing
+    returning lists entry columns once per sign: -1 for values removed, 1 for values added
+    """
+    keys = [key for key, _, _ in ENTRY_TABLES[section][2]]
+    
+    def update_aggregates(cursor, rows):
+        removed, added = [], []
+        for row in rows:
+            for position, sign in enumerate(signs):
+                entry = dict(zip(keys, row[position * len(keys):(position + 1) * len(keys)]))
+                (added if sign > 0 else removed).append(entry)
+        _add_aggregates(cursor, user_id, entry_delta(section, removed, added))
+    
+    return _execute_write_postgres(
+        user_id, action,
+        f'''
+            WITH changed AS ({sql} RETURNING {returning}),
+            bumped AS (
+                UPDATE financial_data SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE user_id = %s AND EXISTS (SELECT 1 FROM changed)
+                RETURNING version
+            )
+            SELECT (SELECT version FROM bumped), changed.* FROM changed
+        ''',
+        (*params, user_id), patch, update_aggregates
+    )
+
+def _returning_sql(section, alias=None):
+    """Entry columns of a section for a RETURNING clause, optionally from (and renamed after) a table alias"""
+    columns = [column for _, column, _ in ENTRY_TABLES[section][2]]
+    if alias is None:
+        return ', '.join(columns)
+    return ', '.join(f'{alias}.{column} AS {alias}_{column}' for column in columns)
+
+def insert_entry_postgres(user_id, section, entry):
+    """Append one entry to a section with a single-row INSERT"""
+    table, _, columns = ENTRY_TABLES[section]
+    column_names = ', '.join(column for _, column, _ in columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    return _write_entry_postgres(
+        user_id, 'inserting', section,
+        f'INSERT INTO {table} (user_id, {column_names}) VALUES (%s, {placeholders})',
+        (user_id, *(entry.get(key) for key, _, _ in columns)),
+        ('append', section, entry),
+        _returning_sql(section), (1,)
+    )
+
+def update_entry_postgres(user_id, section, index, fields):
+    """Update the entry at a list position with a single-row UPDATE"""
+    table, _, columns = ENTRY_TABLES[section]
+    assignments = [(column, fields[key]) for key, column, _ in columns if key in fields]
+    if not assignments:
+        return False
+    set_sql = ', '.join(f'{column} = %s' for column, _ in assignments)
+    # Joining the row to itself returns its values from before the update as well
+    return _write_entry_postgres(
+        user_id, 'updating', section,
+        f'''UPDATE {table} t SET {set_sql} FROM {table} old
+            WHERE t.id = old.id AND t.id = {_entry_id_sql(table)}''',
+        (*(value for _, value in assignments), user_id, index),
+        ('update', section, index, fields),
+        f"{_returning_sql(section, 'old')}, {_returning_sql(section, 't')}", (-1, 1)
+    )
+
+def delete_entry_postgres(user_id, section, index):
+    """Delete the entry at a list position with a single-row DELETE"""
+    table, _, _ = ENTRY_TABLES[section]
+    return _write_entry_postgres(
+        user_id, 'deleting', section,
+        f'DELETE FROM {table} WHERE id = {_entry_id_sql(table)}',
+        (user_id, index),
+        ('remove', section, index),
+        _returning_sql(section), (-1,)
+    )
+
+def delete_entries_by_field_postgres(user_id, section, key, value):
+    """Delete every entry of a section whose field equals value"""
+    table, _, columns = ENTRY_TABLES[section]
+    column = next(column for json_key, column, _ in columns if json_key == key)
+    return _write_entry_postgres(
+        user_id, 'deleting', section,
+        f'DELETE FROM {table} WHERE user_id = %s AND {column} = %s',
+        (user_id, value),
+        ('remove_by_field', section, key, value),
+        _returning_sql(section), (-1,)
+    )
 
 def load_financial_data_json(user_id=None, is_guest=False, guest_data=None):
     """Load financial data from JSON files (fallback for local/SQLite)"""
     if is_guest:
         if guest_data:
             return guest_data
-        return get_default_financial_data()
+        return get_default_financial_data(is_guest=True)
     
     if user_id is None:
         return None
@@ -219,6 +776,19 @@ def load_financial_data_json(user_id=None, is_guest=False, guest_data=None):
         save_financial_data_json(user_id, default_data)
         return default_data
 
+def load_financial_snapshot_json(user_id):
+    """Load financial data from a JSON file with the file's modification time as its version"""
+    filepath = f'data/user_{user_id}.json'
+    try:
+        # Stat before reading: a concurrent write can only make the data newer than the version
+        version = os.stat(filepath).st_mtime_ns
+    except OSError:
+        version = None
+    data = load_financial_data_json(user_id)
+    if data is None:
+        return None
+    return DocumentSnapshot(data, version)
+
 def save_financial_data_json(user_id, data, is_guest=False):
     """Save financial data to JSON files (fallback for local/SQLite)"""
     if is_guest:
@@ -234,9 +804,238 @@ def save_financial_data_json(user_id, data, is_guest=False):
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
         with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
+            json.dump(data, f, indent=2, default=json_default)
+        
+        # Drop derived results computed from the previous version
+        invalidate_user_cache(user_id)
         return True
     except Exception as e:
         print(f"Error saving financial data: {e}")
         return False
 
+
+# --- Patch API: change one entry without loading or rewriting the whole document ---
+
+def apply_patch(data, op, section, *args):
+    """Apply a patch to an in-memory document and its running totals; returns False if nothing matched"""
+    if op == 'merge':
+        fields, = args
+        data.setdefault(section, {}).update(fields)
+        return True
+    
+    entries = get_entry_list(data, section)
+    if op == 'append':
+        entry, = args
+        entries.append(entry)
+        removed, added, positions = [], [entry], [len(entries) - 1]
+    elif op == 'update':
+        index, fields = args
+        if not 0 <= index < len(entries):
+            return False
+        removed = [dict(entries[index])]
+        entries[index].update(fields)
+        added, positions = [entries[index]], [index]
+    elif op == 'remove':
+        index, = args
+        if not 0 <= index < len(entries):
+            return False
+        removed, added, positions = [entries.pop(index)], [], [index]
+    elif op == 'remove_by_field':
+        key, value = args
+        positions = [position for position, entry in enumerate(entries) if entry.get(key) == value]
+        if not positions:
+            return False
+        removed, added = [entries[position] for position in positions], []
+        entries[:] = [entry for entry in entries if entry.get(key) != value]
+    else:
+        raise ValueError(f"Unknown patch operation: {op}")
+    
+    # Documents without stored totals get them computed on read instead
+    if section in AGGREGATES and data.get('aggregates') is not None:
+        apply_delta(data['aggregates'], entry_delta(section, removed, added))
+        if section == 'daily_income_tracker':
+            update_month_index(data['aggregates'], op, positions, removed, added)
+    return True
+
+def _patch_document_postgres(user_id, action, set_sql, params, patch, where_sql='', where_params=()):
+    """Run a single UPDATE on financial_data computed server-side from the stored JSONB"""
+    return _execute_write_postgres(
+        user_id, action,
+        f'''
+            UPDATE financial_data
+            SET {set_sql}, version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = %s {where_sql}
+            RETURNING 1, version
+        ''',
+        (*params, user_id, *where_params), patch
+    )
+
+def _patch_postgres(user_id, op, section, *args):
+    """Patch one section in PostgreSQL with a single statement (no preceding read)"""
+    if section in ENTRY_TABLES:
+        if op == 'append':
+            return insert_entry_postgres(user_id, section, *args)
+        if op == 'update':
+            return update_entry_postgres(user_id, section, *args)
+        if op == 'remove':
+            return delete_entry_postgres(user_id, section, *args)
+        if op == 'remove_by_field':
+            return delete_entries_by_field_postgres(user_id, section, *args)
+    
+    if section in MERGE_SECTIONS and op == 'merge':
+        fields, = args
+        return _patch_document_postgres(
+            user_id, 'merging',
+            f"{section} = COALESCE({section}, '{{}}') || %s", (Json(fields),),
+            (op, section, *args)
+        )
+    
+    if section in JSONB_LIST_SECTIONS:
+        column, key = JSONB_LIST_SECTIONS[section]
+        items = f"COALESCE({column}->'{key}', '[]')"
+        in_bounds = f"AND %s < jsonb_array_length({items})"
+        if op == 'append':
+            entry, = args
+            return _patch_document_postgres(
+                user_id, 'appending',
+                f"{column} = jsonb_set(COALESCE({column}, '{{}}'), '{{{key}}}', {items} || jsonb_build_array(%s::jsonb))",
+                (Json(entry),), (op, section, *args)
+            )
+        if op == 'update':
+            index, fields = args
+            return _patch_document_postgres(
+                user_id, 'updating',
+                f"{column} = jsonb_set({column}, ARRAY['{key}', %s::text], ({items}->%s) || %s)",
+                (index, index, Json(fields)), (op, section, *args), in_bounds, (index,)
+            )
+        if op == 'remove':
+            index, = args
+            return _patch_document_postgres(
+                user_id, 'removing',
+                f"{column} = jsonb_set({column}, '{{{key}}}', {items} - %s)",
+                (index,), (op, section, *args), in_bounds, (index,)
+            )
+    
+    raise ValueError(f"Unsupported patch: {op} on {section}")
+
+# Per-user locks so concurrent JSON patches don't lose each other's updates
+_json_file_locks = {}
+_json_file_locks_guard = threading.Lock()
+
+def _patch_json(user_id, op, section, *args):
+    """Patch a JSON data file in one read-modify-write under a per-user lock"""
+    if user_id is None:
+        return False
+    with _json_file_locks_guard:
+        lock = _json_file_locks.setdefault(user_id, threading.Lock())
+    with lock:
+        data = load_financial_data_json(user_id)
+        if data is None:
+            return False
+        if data.get('aggregates') is None:
+            data['aggregates'] = calculate_aggregates(data)  # File from before running totals
+        elif data['aggregates'].get('month_index') is None:
+            data['aggregates']['month_index'] = build_month_index(data.get('daily_income_tracker', []))
+        if not apply_patch(data, op, section, *args):
+            return False
+        return save_financial_data_json(user_id, data)
+
+def prepare_patch(op, section, args):
+    """Patch arguments with derived entry values filled in (see prepare_entry)"""
+    if op == 'append':
+        entry, = args
+        return (prepare_entry(section, entry),)
+    if op == 'update':
+        index, fields = args
+        return (index, prepare_entry(section, fields))
+    return args
+
+def _patch(user_id, op, section, *args):
+    args = prepare_patch(op, section, args)
+    if DB_TYPE == 'postgres':
+        return _patch_postgres(user_id, op, section, *args)
+    return _patch_json(user_id, op, section, *args)
+
+def append_entry(user_id, section, entry):
+    """Append an entry to a list section"""
+    return _patch(user_id, 'append', section, entry)
+
+def update_entry(user_id, section, index, fields):
+    """Update fields of the entry at a list position"""
+    return _patch(user_id, 'update', section, index, fields)
+
+def remove_entry(user_id, section, index):
+    """Remove the entry at a list position"""
+    return _patch(user_id, 'remove', section, index)
+
+def remove_entries_by_field(user_id, section, key, value):
+    """Remove every entry of a list section whose field equals value"""
+    return _patch(user_id, 'remove_by_field', section, key, value)
+
+def merge_section(user_id, section, fields):
+    """Shallow-merge fields into an object section (profile or settings)"""
+    return _patch(user_id, 'merge', section, fields)
+
+def verify_aggregates(repair=False):
+    """
+    Compare every user's stored running totals with totals recomputed from their entries
+    With repair=True drifted totals are overwritten; returns the ids of users that drifted
+    """
+    drifted = []
+    not_stored = []
+    if DB_TYPE == 'postgres':
+        conn = _open_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT user_id FROM financial_data ORDER BY user_id')
+            for (user_id,) in cursor.fetchall():
+                snapshot = _query_financial_snapshot(user_id)
+                if snapshot is None:
+                    continue
+                expected = calculate_aggregates(snapshot.data)
+                drift = find_drift(snapshot.data['aggregates'], expected)
+                if drift:
+                    drifted.append(user_id)
+                    print(f"⚠ User {user_id}: running totals drifted ({', '.join(drift)})")
+                    if repair:
+                        _store_aggregates(cursor, user_id, expected)
+                        conn.commit()
+                        _write_through(user_id, None)
+        finally:
+            _close_connection(conn)
+    else:
+        for filename in sorted(os.listdir('data')) if os.path.isdir('data') else []:
+            if not (filename.startswith('user_') and filename.endswith('.json')):
+                continue
+            try:
+                # Cache entries are tagged with the integer id
+                user_id = int(filename[len('user_'):-len('.json')])
+            except ValueError:
+                continue
+            data = load_financial_data_json(user_id)
+            if data is None:
+                continue
+            expected = calculate_aggregates(data)
+            if data.get('aggregates') is None:
+                # Older files: totals are computed on read until the next save stores them
+                not_stored.append(user_id)
+                if repair:
+                    data['aggregates'] = expected
+                    save_financial_data_json(user_id, data)
+                continue
+            drift = find_drift(data['aggregates'], expected)
+            if drift:
+                drifted.append(user_id)
+                print(f"⚠ User {user_id}: running totals drifted ({', '.join(drift)})")
+                if repair:
+                    data['aggregates'] = expected
+                    save_financial_data_json(user_id, data)
+    
+    if not_stored:
+        action = "stored them" if repair else "computed on read"
+        print(f"⊘ {len(not_stored)} users have no stored running totals yet ({action})")
+    if repair and drifted:
+        print(f"✓ Rebuilt running totals for {len(drifted)} users")
+    elif not drifted:
+        print("✓ Running totals match the stored entries")
+    return drifted
@@ -0,0 +1,175 @@
+"""
+In-process metrics: counters and latency histograms grouped by namespace
+Rendered as JSON or Prometheus text by the admin metrics endpoint
+"""
+import bisect
+import threading
+import time
+
+# Histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Metric names in the Prometheus output start with this
+METRICS_PREFIX = 'planning'
+
+class Histogram:
+    """Latency histogram with fixed buckets (thread-safe)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def snapshot(self):
+        """Cumulative bucket counts plus sum, count and mean"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = []
+        running = 0
+        # '+Inf' rather than float('inf') keeps the JSON output valid
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return {
+            'buckets': cumulative,
+            'sum': total,
+            'count': count,
+            'mean': total / count if count else 0.0
+        }
+
+class NamespaceMetrics:
+    """Counters, histograms and gauges for one namespace (e.g. one cache)"""
+
+    def __init__(self, name):
+        self.name = name
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def incr(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def observe(self, histogram, seconds):
+        hist = self._histograms.get(histogram)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(histogram, Histogram())
+        hist.observe(seconds)
+
+    def timer(self, histogram):
+        """Context manager observing the time spent inside it"""
+        return _Timer(self, histogram)
+
+    def gauge(self, name, func):
+        """Register a callable read whenever metrics are collected"""
+        with self._lock:
+            self._gauges[name] = func
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict(self._histograms)
+            gauges = dict(self._gauges)
+        gauge_values = {}
+        for name, func in gauges.items():
+            try:
+                gauge_values[name] = func()
+            except Exception as e:
+                print(f"⚠ Could not read gauge {self.name}.{name}: {e}")
+        return {
+            'counters': counters,
+            'gauges': gauge_values,
+            'histograms': {name: hist.snapshot() for name, hist in histograms.items()}
+        }
+
+class _Timer:
+    __slots__ = ('metrics', 'histogram', 'start')
+
+    def __init__(self, metrics, histogram):
+        self.metrics = metrics
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.histogram, time.perf_counter() - self.start)
+        return False
+
+# group -> namespace -> NamespaceMetrics
+_registry = {}
+_registry_lock = threading.Lock()
+
+def get_metrics(group, namespace):
+    """Metrics for a namespace within a group (created on first use)"""
+    with _registry_lock:
+        namespaces = _registry.setdefault(group, {})
+        metrics = namespaces.get(namespace)
+        if metrics is None:
+            metrics = namespaces[namespace] = NamespaceMetrics(namespace)
+        return metrics
+
+def collect_metrics():
+    """Snapshot of every registered metric: {group: {namespace: {...}}}"""
+    with _registry_lock:
+        groups = {group: dict(namespaces) for group, namespaces in _registry.items()}
+    result = {}
+    for group, namespaces in groups.items():
+        result[group] = {name: metrics.snapshot() for name, metrics in namespaces.items()}
+        if group == 'cache':
+            for snapshot in result[group].values():
+                _add_cache_summary(snapshot)
+    return result
+
+def _add_cache_summary(snapshot):
+    """Hit rate and the load time the hits avoided"""
+    counters = snapshot['counters']
+    hits = counters.get('hits', 0)
+    lookups = hits + counters.get('misses', 0)
+    load = snapshot['histograms'].get('load_seconds')
+    snapshot['summary'] = {
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'estimated_seconds_saved': hits * load['mean'] if load else 0.0
+    }
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(snapshot=None):
+    """Metrics in the Prometheus text exposition format"""
+    snapshot = collect_metrics() if snapshot is None else snapshot
+    lines = []
+    for group, namespaces in sorted(snapshot.items()):
+        families = {}
+        for namespace, data in sorted(namespaces.items()):
+            labels = f'namespace="{_label(namespace)}"'
+            for name, value in sorted(data['counters'].items()):
+                families.setdefault((f'{METRICS_PREFIX}_{group}_{name}_total', 'counter'), []).append(
+                    f'{METRICS_PREFIX}_{group}_{name}_total{{{labels}}} {value}')
+            for name, value in sorted(data['gauges'].items()):
+                families.setdefault((f'{METRICS_PREFIX}_{group}_{name}', 'gauge'), []).append(
+                    f'{METRICS_PREFIX}_{group}_{name}{{{labels}}} {value}')
+            for name, hist in sorted(data['histograms'].items()):
+                metric = f'{METRICS_PREFIX}_{group}_{name}'
+                samples = families.setdefault((metric, 'histogram'), [])
+                for bound, count in hist['buckets']:
+                    samples.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                samples.append(f'{metric}_sum{{{labels}}} {hist["sum"]}')
+                samples.append(f'{metric}_count{{{labels}}} {hist["count"]}')
+        for (metric, kind), samples in families.items():
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.extend(samples)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,245 @@
+"""
+Net savings projection (Monte Carlo)
+Each simulated path draws monthly net income around the daily tracker's recent
+trend, lets the BDT exchange rate drift (capital is held in BDT) and pays the
+projected loan repayments. Paths are simulated in batches (one array op per
+batch with NumPy, a plain loop without it) and batches are spread across a
+process pool; the result is percentile bands of net savings per month.
+"""
+import math
+import multiprocessing
+import os
+import random
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# Worker processes for simulation batches (0 or 1 runs them in the request thread)
+PROJECTION_WORKERS = int(os.environ.get('PROJECTION_WORKERS', min(os.cpu_count() or 1, 4)))
+
+# Paths simulated per batch (one task per batch)
+PROJECTION_BATCH_SIZE = int(os.environ.get('PROJECTION_BATCH_SIZE', 2500))
+
+DEFAULT_PATHS = 10000
+DEFAULT_MONTHS = 24
+MAX_PATHS = 50000
+MAX_MONTHS = 120
+
+# Guests' projections aren't cached, so they get a much smaller simulation
+GUEST_MAX_PATHS = 1000
+GUEST_MAX_MONTHS = 36
+
+# Paths simulated without a worker pool, where batches run in the request thread
+# (much lower for the plain loop used without NumPy)
+IN_PROCESS_MAX_PATHS = 10000
+IN_PROCESS_PYTHON_MAX_PATHS = 2000
+
+# Income trend is fitted to this many most recent months
+TREND_MONTHS = 12
+
+# Monthly exchange rate volatility used when settings don't give one (percent)
+DEFAULT_RATE_VOLATILITY_PERCENT = 2.0
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Everything a simulation needs (hashable and picklable, so it can key caches and go to workers)
+ProjectionInputs = namedtuple('ProjectionInputs', [
+    'start_month',        # first projected month (YYYY-MM)
+    'net_savings',        # current net savings (display currency)
+    'remaining_capital',  # part of net savings held in BDT
+    'income_mean',        # tuple: expected monthly net income per projected month
+    'income_std',         # spread of monthly net income around the trend
+    'loan_payments',      # tuple: loan repayment per projected month
+    'rate_drift',         # monthly drift of the BDT rate (fraction)
+    'rate_volatility'     # monthly volatility of the BDT rate (fraction)
+])
+
+def _add_months(month, count):
+    year, month_number = divmod(int(month[:4]) * 12 + int(month[5:7]) - 1 + count, 12)
+    return f"{year:04d}-{month_number + 1:02d}"
+
+def fit_trend(values):
+    """Least-squares line through a monthly series: (intercept, slope, residual std)"""
+    count = len(values)
+    if count == 0:
+        return 0.0, 0.0, 0.0
+    if count == 1:
+        return float(values[0]), 0.0, 0.0
+    mean_x = (count - 1) / 2
+    mean_y = sum(values) / count
+    slope = (
+        sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+        / sum((x - mean_x) ** 2 for x in range(count))
+    )
+    intercept = mean_y - slope * mean_x
+    residuals = [y - (intercept + slope * x) for x, y in enumerate(values)]
+    std = math.sqrt(sum(r * r for r in residuals) / (count - 2)) if count > 2 else 0.0
+    return intercept, slope, std
+
+def projection_inputs(daily_income_by_month, monthly_cash_flow, net_savings, remaining_capital,
+                      loan_schedule, settings_data, months=DEFAULT_MONTHS):
+    """
+    Simulation inputs from a document's computed values
+    daily_income_by_month: month -> {'total_net': ...} (calculations.calculate_daily_income_by_month);
+    months without daily entries fall back to the cash flow income
+    """
+    history = {month: group['total_net'] for month, group in daily_income_by_month.items()}
+    if not history:
+        history = {entry['month']: entry['income'] for entry in monthly_cash_flow}
+    recent = [history[month] for month in sorted(history)][-TREND_MONTHS:]
+    intercept, slope, std = fit_trend(recent)
+
+    known_months = sorted(set(history) | {entry['month'] for entry in monthly_cash_flow})
+    start_month = _add_months(known_months[-1], 1) if known_months else datetime.now().strftime('%Y-%m')
+
+    loan_payments = [0.0] * months
+    if loan_schedule is not None:
+        projected = [row.payment for row in loan_schedule.rows if not row.recorded]
+        loan_payments[:len(projected[:months])] = projected[:months]
+
+    return ProjectionInputs(
+        start_month=start_month,
+        net_savings=float(net_savings),
+        remaining_capital=float(remaining_capital),
+        income_mean=tuple(max(intercept + slope * (len(recent) + step), 0.0) for step in range(months)),
+        income_std=float(std),
+        loan_payments=tuple(loan_payments),
+        rate_drift=float(settings_data.get('projection_rate_drift_percent', 0.0)) / 100,
+        rate_volatility=float(
+            settings_data.get('projection_rate_volatility_percent', DEFAULT_RATE_VOLATILITY_PERCENT)
+        ) / 100
+    )
+
+def _simulate_batch_numpy(inputs, paths, seed):
+    rng = np.random.default_rng(seed)
+    months = len(inputs.income_mean)
+    income = np.maximum(
+        np.asarray(inputs.income_mean) + inputs.income_std * rng.standard_normal((paths, months)), 0.0
+    )
+    # Geometric random walk of the exchange rate relative to today
+    volatility = inputs.rate_volatility
+    rate_factor = np.exp(np.cumsum(
+        inputs.rate_drift - volatility * volatility / 2 + volatility * rng.standard_normal((paths, months)),
+        axis=1
+    ))
+    savings = np.cumsum(income - np.asarray(inputs.loan_payments), axis=1)
+    return (inputs.net_savings - inputs.remaining_capital) + savings + inputs.remaining_capital * rate_factor
+
+def _simulate_batch_python(inputs, paths, seed):
+    rng = random.Random(seed)
+    volatility = inputs.rate_volatility
+    results = []
+    for _ in range(paths):
+        path = []
+        savings = 0.0
+        log_rate = 0.0
+        for mean, loan_payment in zip(inputs.income_mean, inputs.loan_payments):
+            savings += max(mean + inputs.income_std * rng.gauss(0.0, 1.0), 0.0) - loan_payment
+            log_rate += inputs.rate_drift - volatility * volatility / 2 + volatility * rng.gauss(0.0, 1.0)
+            path.append(inputs.net_savings - inputs.remaining_capital + savings
+                        + inputs.remaining_capital * math.exp(log_rate))
+        results.append(path)
+    return results
+
+def simulate_batch(inputs, paths, seed):
+    """Net savings per month for a batch of paths (runs in a worker process)"""
+    if HAS_NUMPY:
+        return _simulate_batch_numpy(inputs, paths, seed)
+    return _simulate_batch_python(inputs, paths, seed)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _noop():
+    return None
+
+def init_projection_pool():
+    """
+    Start the simulation worker processes (called from the server entry point before
+    it starts threads: workers are forked where available, so they must not inherit
+    held locks). Without a pool, simulations run in the request thread
+    """
+    global _executor
+    if PROJECTION_WORKERS <= 1:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            try:
+                if 'fork' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('fork')
+                else:
+                    context = None
+                _executor = ProcessPoolExecutor(max_workers=PROJECTION_WORKERS, mp_context=context)
+                _executor.submit(_noop).result()  # Forks the workers now
+                print(f"✓ Projection worker pool started ({PROJECTION_WORKERS} processes)")
+            except (OSError, NotImplementedError, PermissionError) as e:
+                # Some serverless platforms don't allow child processes
+                print(f"⚠ Could not start projection workers, simulating in-process: {e}")
+                _executor = None
+    return _executor
+
+def _run_on_pool(executor, inputs, batches):
+    """Batch results from the worker pool, or None if the pool failed"""
+    try:
+        futures = [executor.submit(simulate_batch, inputs, paths, seed) for paths, seed in batches]
+        return [future.result() for future in futures]
+    except Exception as e:
+        print(f"⚠ Projection worker pool failed, simulating in-process: {e}")
+        return None
+
+def _batches(paths, seed):
+    """(paths, seed) per batch; independent random streams, so results don't depend on which worker ran what"""
+    batch_sizes = [PROJECTION_BATCH_SIZE] * (paths // PROJECTION_BATCH_SIZE)
+    if paths % PROJECTION_BATCH_SIZE:
+        batch_sizes.append(paths % PROJECTION_BATCH_SIZE)
+    seeds = [random.Random(seed * 1000003 + index).getrandbits(64) for index in range(len(batch_sizes))]
+    return list(zip(batch_sizes, seeds))
+
+def _percentile(sorted_values, percent):
+    # Linear interpolation between closest ranks (numpy's default method)
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def run_projection(inputs, paths=DEFAULT_PATHS, seed=0):
+    """
+    Simulate paths and return percentile bands of net savings per month:
+    {'months': [...], 'percentiles': {'p5': [...], ...}, 'mean': [...], 'paths': n}
+    The same inputs, path count and seed always give the same result; without a
+    worker pool paths are capped at IN_PROCESS_MAX_PATHS (IN_PROCESS_PYTHON_MAX_PATHS
+    without NumPy), since the request thread simulates them
+    """
+    paths = max(1, min(int(paths), MAX_PATHS))
+    executor = _executor
+    results = _run_on_pool(executor, inputs, _batches(paths, seed)) if executor is not None else None
+    if results is None:
+        paths = min(paths, IN_PROCESS_MAX_PATHS if HAS_NUMPY else IN_PROCESS_PYTHON_MAX_PATHS)
+        results = [simulate_batch(inputs, batch_paths, batch_seed)
+                   for batch_paths, batch_seed in _batches(paths, seed)]
+
+    months = [_add_months(inputs.start_month, step) for step in range(len(inputs.income_mean))]
+    if HAS_NUMPY:
+        values = np.concatenate(results)
+        bands = np.percentile(values, PERCENTILES, axis=0)
+        percentiles = {f'p{p}': band.tolist() for p, band in zip(PERCENTILES, bands)}
+        mean = values.mean(axis=0).tolist()
+    else:
+        columns = [sorted(column) for column in zip(*(path for batch in results for path in batch))]
+        percentiles = {f'p{p}': [_percentile(column, p) for column in columns] for p in PERCENTILES}
+        mean = [sum(column) / len(column) for column in columns]
+    return {
+        'months': months,
+        'percentiles': percentiles,
+        'mean': mean,
+        'paths': paths,
+        'start_net_savings': inputs.net_savings
+    }
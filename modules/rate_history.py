@@ -0,0 +1,241 @@
+"""
+Exchange rate history
+Every fetched rate table is stored as a time-indexed snapshot (one row per
+currency), so pages read the latest rates from the database and historical
+conversions look up the rate in effect at a date instead of calling the API.
+A background thread started from main.py keeps the history up to date.
+"""
+import bisect
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from modules.db_config import DB_TYPE, IS_VERCEL
+from modules.auth_manager import get_db_connection, close_db_connection
+from modules.cache import get_or_load, invalidate_cache
+from modules.exchange_rate_api import ExchangeRateAPI
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# Seconds between background refreshes (0 disables the refresher; serverless
+# deployments don't keep threads alive between requests, so it's off there)
+RATE_REFRESH_INTERVAL = int(os.environ.get('RATE_REFRESH_INTERVAL', 0 if IS_VERCEL else 3600))
+
+# Seconds the latest rates are kept in memory before re-reading the table
+LATEST_RATES_CACHE_TTL = 60
+
+# Seconds a loaded history index is kept (it is keyed by the history version, so new snapshots miss)
+HISTORY_CACHE_TTL = 3600
+
+# Query parameter placeholder of the database driver
+PARAM = '%s' if DB_TYPE == 'postgres' else '?'
+
+def init_rate_history():
+    """Create the history table (call once at startup)"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        if DB_TYPE == 'postgres':
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS exchange_rate_history (
+                    id SERIAL PRIMARY KEY,
+                    base VARCHAR(3) NOT NULL,
+                    currency VARCHAR(3) NOT NULL,
+                    rate DOUBLE PRECISION NOT NULL,
+                    fetched_at TIMESTAMP NOT NULL,
+                    UNIQUE (base, currency, fetched_at)
+                )
+            ''')
+        else:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS exchange_rate_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    base TEXT NOT NULL,
+                    currency TEXT NOT NULL,
+                    rate REAL NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    UNIQUE (base, currency, fetched_at)
+                )
+            ''')
+        # Latest snapshot of a base, and the rate in effect at a date
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rate_history_lookup
+            ON exchange_rate_history(base, currency, fetched_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_rate_history_fetched
+            ON exchange_rate_history(base, fetched_at)
+        ''')
+
+        conn.commit()
+        close_db_connection(conn)
+        print(f"✓ Exchange rate history ready ({DB_TYPE})")
+    except Exception as e:
+        print(f"⚠ Could not initialize exchange rate history: {e}")
+
+def _timestamp(value):
+    # PostgreSQL returns datetimes, SQLite the ISO strings that were stored
+    return value if isinstance(value, str) else value.isoformat()
+
+def record_rates(base, rates, fetched_at):
+    """Store a rate snapshot (fetched_at: ISO timestamp); storing the same snapshot twice is a no-op"""
+    if not rates:
+        return False
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.executemany(f'''
+            INSERT INTO exchange_rate_history (base, currency, rate, fetched_at)
+            VALUES ({PARAM}, {PARAM}, {PARAM}, {PARAM})
+            ON CONFLICT DO NOTHING
+        ''', [(base, currency, rate, fetched_at) for currency, rate in rates.items()])
+        conn.commit()
+        close_db_connection(conn)
+    except Exception as e:
+        print(f"⚠ Could not store exchange rates: {e}")
+        return False
+    invalidate_cache(f"rate_history_latest:{base}")
+    invalidate_cache(f"rate_history_version:{base}")
+    return True
+
+def _query_latest_rates(base):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT currency, rate, fetched_at FROM exchange_rate_history
+        WHERE base = {PARAM} AND fetched_at = (
+            SELECT MAX(fetched_at) FROM exchange_rate_history WHERE base = {PARAM}
+        )
+    ''', (base, base))
+    rows = cursor.fetchall()
+    close_db_connection(conn)
+    if not rows:
+        return None
+    return {
+        'rates': {currency: rate for currency, rate, _ in rows},
+        'fetched_at': _timestamp(rows[0][2])
+    }
+
+def latest_rates(base='BDT'):
+    """Latest stored snapshot: {'rates': {currency: rate}, 'fetched_at': ...}, or None if there is none"""
+    try:
+        return get_or_load(f"rate_history_latest:{base}", lambda: _query_latest_rates(base),
+                           ttl=LATEST_RATES_CACHE_TTL, negative_ttl=LATEST_RATES_CACHE_TTL)
+    except Exception as e:
+        print(f"⚠ Could not read exchange rate history: {e}")
+        return None
+
+# Rates of one currency by day: days (YYYY-MM-DD, ascending) and the rate in effect at the end of each
+RateSeries = namedtuple('RateSeries', ['days', 'rates'])
+
+def _query_history_version(base):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT COUNT(*), MAX(fetched_at) FROM exchange_rate_history WHERE base = {PARAM}
+    ''', (base,))
+    count, latest = cursor.fetchone()
+    close_db_connection(conn)
+    return f"{count}:{_timestamp(latest) if latest else ''}"
+
+def history_version(base='BDT'):
+    """Changes whenever a snapshot is added (part of cache keys for results using the history)"""
+    try:
+        return get_or_load(f"rate_history_version:{base}", lambda: _query_history_version(base),
+                           ttl=LATEST_RATES_CACHE_TTL)
+    except Exception as e:
+        print(f"⚠ Could not read exchange rate history: {e}")
+        return 'unavailable'
+
+def _query_history(base):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT currency, fetched_at, rate FROM exchange_rate_history
+        WHERE base = {PARAM} ORDER BY currency, fetched_at
+    ''', (base,))
+    rows = cursor.fetchall()
+    close_db_connection(conn)
+    by_currency = {}
+    for currency, fetched_at, rate in rows:
+        days, rates = by_currency.setdefault(currency, ([], []))
+        day = _timestamp(fetched_at)[:10]
+        if days and days[-1] == day:
+            rates[-1] = rate  # Keep the day's last snapshot
+        else:
+            days.append(day)
+            rates.append(rate)
+    return {currency: RateSeries(tuple(days), tuple(rates)) for currency, (days, rates) in by_currency.items()}
+
+def load_history(base='BDT'):
+    """Sorted per-currency rate series {currency: RateSeries}, loaded once per history version"""
+    version = history_version(base)
+    try:
+        return get_or_load(f"rate_history:{base}:{version}", lambda: _query_history(base),
+                           ttl=HISTORY_CACHE_TTL)
+    except Exception as e:
+        print(f"⚠ Could not read exchange rate history: {e}")
+        return {}
+
+def rates_on(series, days, fallback):
+    """
+    Rate in effect on each day (YYYY-MM-DD; later strings such as YYYY-MM-31 work as month ends)
+    Days before the first snapshot, or without a series, use fallback
+    """
+    if series is None or not series.days:
+        return [fallback] * len(days)
+    if HAS_NUMPY:
+        positions = np.searchsorted(np.array(series.days), np.array(days, dtype=str), side='right') - 1
+        rates = np.array(series.rates, dtype=np.float64)[np.maximum(positions, 0)]
+        return np.where(positions >= 0, rates, fallback).tolist()
+    rates = []
+    for day in days:
+        position = bisect.bisect_right(series.days, day) - 1
+        rates.append(series.rates[position] if position >= 0 else fallback)
+    return rates
+
+def refresh_rates(base, targets):
+    """Fetch the latest rates into the shared rate cache and store them in the history"""
+    result = ExchangeRateAPI.refresh_rates(base)
+    if not result.get('success') or result.get('stale'):
+        print(f"⚠ Exchange rate refresh failed: {result.get('error', 'serving last-known-good rates')}")
+        return False
+    rates = {currency: result['rates'][currency] for currency in targets if currency in result['rates']}
+    return record_rates(base, rates, result['timestamp'])
+
+def _seconds_since(timestamp):
+    try:
+        return (datetime.now() - datetime.fromisoformat(timestamp)).total_seconds()
+    except ValueError:
+        return float('inf')
+
+def _refresh_loop(base, targets, interval):
+    while True:
+        # Skip the fetch when another process stored a recent snapshot
+        latest = latest_rates(base)
+        age = _seconds_since(latest['fetched_at']) if latest else float('inf')
+        if age < interval:
+            time.sleep(interval - age)
+            continue
+        try:
+            if refresh_rates(base, targets):
+                print(f"✓ Exchange rates refreshed ({len(targets)} currencies)")
+        except Exception as e:
+            print(f"⚠ Exchange rate refresh failed: {e}")
+        time.sleep(interval)
+
+def start_rate_refresher(base, targets, interval=RATE_REFRESH_INTERVAL):
+    """Start the background thread refreshing rates every interval seconds (no-op if interval is 0)"""
+    if interval <= 0:
+        return None
+    thread = threading.Thread(target=_refresh_loop, args=(base, tuple(targets), interval),
+                              name='rate-refresher', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,97 @@
+"""
+Compact read-only records for financial entries
+Cached documents hold thousands of entries; a record keeps its fields in
+__slots__ instead of a per-entry dict, which takes roughly a third of the
+memory. Records behave like read-only dicts (entry['amount'], entry.get(...),
+dict(entry)) and templates can use entry.amount as before.
+"""
+from collections.abc import Mapping
+
+class Record(Mapping):
+    """Read-only entry with a fixed set of fields stored in slots"""
+
+    __slots__ = ()
+    FIELDS = ()
+    OPTIONAL = ()  # Fields an entry may leave out (e.g. entries written before they existed)
+
+    def __init__(self, values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass  # Optional field not set
+        raise KeyError(key)
+
+    def __iter__(self):
+        for name in self.FIELDS:
+            if hasattr(self, name):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setattr__(self, name, value):
+        raise TypeError("Cached financial data is read-only; load it with for_update=True to change it")
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        # Slots are restored through __setattr__ by default, which is blocked
+        return (type(self), (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+class DailyIncomeRecord(Record):
+    __slots__ = FIELDS = ('date', 'hours_worked', 'gross_income', 'month_key', 'currency')
+    OPTIONAL = ('month_key', 'currency')
+
+class CashFlowRecord(Record):
+    __slots__ = FIELDS = ('month', 'income', 'loan_repayment', 'currency')
+    OPTIONAL = ('currency',)
+
+class ExpenseRecord(Record):
+    __slots__ = FIELDS = ('name', 'amount')
+
+class SourceRecord(Record):
+    __slots__ = FIELDS = ('name', 'amount_bdt')
+
+def _shapes(record_type):
+    """Every key set an entry of this type can have"""
+    required = frozenset(record_type.FIELDS) - frozenset(record_type.OPTIONAL)
+    shapes = [required]
+    for name in record_type.OPTIONAL:
+        shapes += [shape | {name} for shape in shapes]
+    return shapes
+
+# Key set of an entry -> record type storing it
+RECORD_SHAPES = {
+    shape: record_type
+    for record_type in (DailyIncomeRecord, CashFlowRecord, ExpenseRecord, SourceRecord)
+    for shape in _shapes(record_type)
+}
+
+def to_record(entry):
+    """Compact record for an entry dict, or None if it doesn't match a record type exactly"""
+    record_type = RECORD_SHAPES.get(frozenset(entry))
+    if record_type is None:
+        return None
+    if any(isinstance(value, (dict, list, tuple)) for value in entry.values()):
+        return None
+    return record_type(entry)
+
+def json_default(value):
+    """json.dump default= hook: records are written as plain objects"""
+    if isinstance(value, Record):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
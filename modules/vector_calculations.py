@@ -0,0 +1,152 @@
+"""
+Vectorized calculation engine (NumPy)
+Each list section is turned into columnar arrays once per document version
+(amounts as float64, daily entries keyed by the month stored at write time);
+totals, per-month groups and savings series are then computed with array ops.
+Produces the same results as calculations.calculate_summary, which stays the
+fallback when NumPy isn't installed or CALC_ENGINE isn't 'numpy'.
+"""
+import os
+import sys
+import json
+from collections import namedtuple
+
+from modules.calculations import (
+    calculate_summary as calculate_summary_python,
+    calculate_totals_from_aggregates,
+    entry_month
+)
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# 'python' (default) or 'numpy'
+CALC_ENGINE = os.environ.get('CALC_ENGINE', 'python')
+
+if CALC_ENGINE == 'numpy' and not HAS_NUMPY:
+    print("⚠ CALC_ENGINE=numpy but NumPy is not installed, using the pure Python engine")
+
+USE_VECTOR_ENGINE = CALC_ENGINE == 'numpy' and HAS_NUMPY
+
+# Columnar copy of a document's list sections
+DocumentColumns = namedtuple('DocumentColumns', [
+    'daily_entries',          # original entry dicts (grouped entries are handed to templates)
+    'daily_months',           # YYYY-MM strings, '' for invalid dates
+    'daily_gross',            # float64
+    'cash_flow_months',       # month labels, as stored
+    'cash_flow_income',       # float64
+    'cash_flow_loan',         # float64 (missing loan_repayment counts as 0)
+    'savings_expense_amounts',  # float64
+    'capital_expense_amounts'   # float64
+])
+
+def _floats(values):
+    return np.fromiter(values, dtype=np.float64)
+
+def build_columns(financial_data):
+    """Convert a document's list sections to NumPy columns (do this once per document version)"""
+    daily_entries = tuple(financial_data.get('daily_income_tracker', []))
+    monthly_cash_flow = financial_data.get('monthly_cash_flow', [])
+    return DocumentColumns(
+        daily_entries=daily_entries,
+        daily_months=np.array([entry_month(entry) or '' for entry in daily_entries], dtype='U7'),
+        daily_gross=_floats(entry['gross_income'] for entry in daily_entries),
+        cash_flow_months=tuple(entry['month'] for entry in monthly_cash_flow),
+        cash_flow_income=_floats(entry['income'] for entry in monthly_cash_flow),
+        cash_flow_loan=_floats(entry.get('loan_repayment', 0) for entry in monthly_cash_flow),
+        savings_expense_amounts=_floats(
+            expense['amount'] for expense in financial_data.get('expenses_from_savings', [])
+        ),
+        capital_expense_amounts=_floats(
+            expense['amount'] for expense in financial_data.get('capital', {}).get('expenses_from_capital', [])
+        )
+    )
+
+def _total(values):
+    # cumsum adds left to right like the pure Python loops (np.sum's pairwise
+    # summation could differ in the last bits)
+    return float(np.cumsum(values)[-1]) if len(values) else 0
+
+def _net_income(gross, tax_rate_percent):
+    # Same operation order as calculations.calculate_net_income
+    return gross - (gross * tax_rate_percent) / 100
+
+def calculate_daily_income_by_month(columns, tax_rate_percent, month_totals=None):
+    """Per-month entries and total net income, grouped with array ops
+    (month_totals from running totals takes precedence over the summed values)"""
+    valid = columns.daily_months != ''
+    if not valid.any():
+        return {}
+    indices = np.flatnonzero(valid)
+    unique_months, first_seen, inverse = np.unique(
+        columns.daily_months[valid], return_index=True, return_inverse=True
+    )
+    # bincount accumulates in input order, matching the sequential += per month
+    totals = np.bincount(
+        inverse, weights=_net_income(columns.daily_gross[valid], tax_rate_percent), minlength=len(unique_months)
+    )
+    order = np.argsort(inverse, kind='stable')
+    groups = np.split(indices[order], np.cumsum(np.bincount(inverse))[:-1])
+    labels = unique_months.tolist()
+    month_totals = month_totals or {}
+    # Months in order of their first entry, like the pure Python grouping
+    return {
+        labels[i]: {
+            'entries': [columns.daily_entries[j] for j in groups[i]],
+            'total_net': month_totals.get(labels[i], float(totals[i]))
+        }
+        for i in np.argsort(first_seen, kind='stable')
+    }
+
+def calculate_summary(columns, total_capital, tax_rate_percent, aggregates=None):
+    """Same output as calculations.calculate_summary, computed from columns"""
+    savings = (columns.cash_flow_income - columns.cash_flow_loan).tolist()
+    # Python's round (correctly rounded) rather than np.round, so values match exactly
+    monthly_savings = [
+        {'month': month, 'savings': round(value, 2)}
+        for month, value in zip(columns.cash_flow_months, savings)
+    ]
+    if aggregates is not None:
+        totals = calculate_totals_from_aggregates(aggregates, total_capital, tax_rate_percent)
+        month_net_totals = totals.pop('month_net_totals')
+        return dict(
+            totals,
+            monthly_savings=monthly_savings,
+            daily_income_by_month=calculate_daily_income_by_month(columns, tax_rate_percent, month_net_totals)
+        )
+    return {
+        'remaining_capital': total_capital - _total(columns.capital_expense_amounts),
+        'monthly_savings': monthly_savings,
+        'total_savings': _total(_floats(item['savings'] for item in monthly_savings)),
+        'total_expenses_from_savings': _total(columns.savings_expense_amounts),
+        'total_net_daily_income': _total(_net_income(columns.daily_gross, tax_rate_percent)),
+        'total_loan_paid': _total(columns.cash_flow_loan),
+        'daily_income_by_month': calculate_daily_income_by_month(columns, tax_rate_percent)
+    }
+
+def compare_engines(financial_data, total_capital=0, tax_rate_percent=30.0, aggregates=None):
+    """Keys whose values differ between the two engines (empty when they agree)"""
+    expected = calculate_summary_python(financial_data, total_capital, tax_rate_percent, aggregates)
+    actual = calculate_summary(build_columns(financial_data), total_capital, tax_rate_percent, aggregates)
+    return [key for key in expected if expected[key] != actual[key]]
+
+if __name__ == '__main__':
+    # Check the engines agree on saved documents: python -m modules.vector_calculations data/user_*.json
+    if not HAS_NUMPY:
+        sys.exit("NumPy is not installed")
+    failed = False
+    for path in sys.argv[1:]:
+        with open(path, 'r') as f:
+            document = json.load(f)
+        tax_rate = document.get('settings', {}).get('tax_rate_percent', 30.0)
+        mismatches = compare_engines(document, 1000.0, tax_rate)
+        if mismatches:
+            failed = True
+            print(f"✗ {path}: {', '.join(mismatches)}")
+        else:
+            print(f"✓ {path}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,63 @@
+"""
+Regenerates calculation_corpus.json, the randomized documents the engine parity
+test (tests/test_vector_calculations.py) runs both calculation engines on.
+
+Documents mix valid and invalid dates, entries with and without a stored
+month_key, empty sections, and amounts chosen to expose summation order
+(tiny and large values, non-terminating decimals). The seed is fixed, so
+running this again reproduces the committed file exactly:
+
+    python tests/data/generate_calculation_corpus.py
+"""
+import json
+import os
+import random
+from datetime import datetime
+
+SEED = 20240612
+DOCUMENTS = 120
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calculation_corpus.json')
+
+def generate(rng):
+    def amount():
+        return rng.choice([round(rng.uniform(0, 5000), 2), rng.uniform(0, 1000), rng.randint(0, 300), 0.1, 1e-7])
+
+    def date():
+        if rng.random() < 0.05:
+            return rng.choice(['', 'not-a-date', '2024-02-30', '2024/03/01'])
+        return f"{rng.choice([2023, 2024, 2025])}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+    documents = []
+    for _ in range(DOCUMENTS):
+        daily = []
+        for _ in range(rng.choice([0, 1, 2, 5, 20, 60])):
+            entry = {'date': date(), 'hours_worked': rng.randint(0, 12), 'gross_income': amount()}
+            # Half the entries carry the month stored at write time ('' for an invalid date)
+            if rng.random() < 0.5:
+                try:
+                    entry['month_key'] = datetime.strptime(entry['date'], '%Y-%m-%d').strftime('%Y-%m')
+                except ValueError:
+                    entry['month_key'] = ''
+            daily.append(entry)
+        months = sorted({
+            f"{rng.choice([2023, 2024])}-{rng.randint(1, 12):02d}" for _ in range(rng.choice([0, 1, 6, 18]))
+        })
+        cash_flow = [{'month': month, 'income': amount(), 'loan_repayment': amount()} for month in months]
+        documents.append({
+            'tax_rate_percent': rng.choice([0, 12.5, 30.0, 33.333]),
+            'total_capital': rng.choice([0, 1000.0, 123456.78]),
+            'document': {
+                'daily_income_tracker': daily,
+                'monthly_cash_flow': cash_flow,
+                'expenses_from_savings': [{'name': f's{k}', 'amount': amount()} for k in range(rng.choice([0, 1, 4]))],
+                'capital': {
+                    'expenses_from_capital': [{'name': f'c{k}', 'amount': amount()} for k in range(rng.choice([0, 2, 7]))]
+                }
+            }
+        })
+    return documents
+
+if __name__ == '__main__':
+    with open(CORPUS_PATH, 'w') as f:
+        json.dump(generate(random.Random(SEED)), f, indent=1)
+    print(f"✓ Wrote {DOCUMENTS} documents to {CORPUS_PATH}")
@@ -0,0 +1,160 @@
+import json
+
+from modules import financial_db
+from modules.aggregates import (
+    TOLERANCE, apply_delta, calculate_aggregates, copy_aggregates, entry_delta, find_drift
+)
+from modules.calculations import build_month_index, calculate_summary
+from modules.financial_db import apply_patch, prepare_patch, verify_aggregates
+
+
+def _document():
+    return {
+        'capital': {'sources': [], 'expenses_from_capital': [{'name': 'Visa', 'amount': 200.0}]},
+        'monthly_cash_flow': [
+            {'month': '2024-01', 'income': 1000.0, 'loan_repayment': 50.0},
+            {'month': '2024-02', 'income': 900.0, 'loan_repayment': 50.0}
+        ],
+        'expenses_from_savings': [{'name': 'Laptop', 'amount': 300.0}],
+        'daily_income_tracker': [
+            {'date': '2024-01-05', 'hours_worked': 8.0, 'gross_income': 100.0},
+            {'date': '2024-02-01', 'hours_worked': 4.0, 'gross_income': 60.0}
+        ]
+    }
+
+
+def test_calculated_aggregates_have_no_drift():
+    document = _document()
+    aggregates = calculate_aggregates(document)
+    assert aggregates['totals']['savings_total'] == 1800.0
+    assert aggregates['totals']['daily_gross_total'] == 160.0
+    assert aggregates['months'] == {
+        '2024-01': {'gross_total': 100.0, 'count': 1},
+        '2024-02': {'gross_total': 60.0, 'count': 1}
+    }
+    assert find_drift(aggregates, calculate_aggregates(document)) == []
+
+
+def test_patched_totals_match_a_rebuild():
+    document = _document()
+    document['aggregates'] = calculate_aggregates(document)
+    apply_patch(document, 'append', 'daily_income_tracker',
+                {'date': '2024-03-02', 'hours_worked': 2.0, 'gross_income': 30.0})
+    apply_patch(document, 'update', 'monthly_cash_flow', 0, {'income': 1100.0})
+    apply_patch(document, 'remove', 'daily_income_tracker', 1)
+    apply_patch(document, 'remove_by_field', 'expenses_from_savings', 'name', 'Laptop')
+    assert find_drift(document['aggregates'], calculate_aggregates(document)) == []
+    assert '2024-02' not in document['aggregates']['months']
+
+
+def test_drift_names_totals_and_months():
+    expected = calculate_aggregates(_document())
+    stored = copy_aggregates(expected)
+    stored['totals']['loan_paid'] += 1
+    stored['months']['2024-01'] = {'gross_total': 100.0, 'count': 2}
+    stored['months']['2023-12'] = {'gross_total': 5.0, 'count': 1}
+    del stored['months']['2024-02']
+    assert sorted(find_drift(stored, expected)) == [
+        'loan_paid', 'month 2023-12', 'month 2024-01', 'month 2024-02'
+    ]
+
+
+def test_rounding_below_tolerance_is_not_drift():
+    expected = calculate_aggregates(_document())
+    stored = copy_aggregates(expected)
+    stored['totals']['daily_gross_total'] += TOLERANCE / 2
+    stored['months']['2024-01'] = {'gross_total': 100.0 + TOLERANCE / 2, 'count': 1}
+    assert find_drift(stored, expected) == []
+
+
+def test_copy_leaves_the_original_unchanged():
+    original = calculate_aggregates(_document())
+    copied = copy_aggregates(original)
+    apply_delta(copied, entry_delta('daily_income_tracker', added=[
+        {'date': '2024-01-09', 'hours_worked': 1.0, 'gross_income': 10.0}
+    ]))
+    assert original['months']['2024-01'] == {'gross_total': 100.0, 'count': 1}
+    assert copied['months']['2024-01'] == {'gross_total': 110.0, 'count': 2}
+
+
+def _write_user_file(directory, user_id, document):
+    (directory / 'data').mkdir(exist_ok=True)
+    (directory / 'data' / f'user_{user_id}.json').write_text(json.dumps(document))
+
+
+def test_verify_skips_files_without_stored_totals(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    _write_user_file(tmp_path, 1, _document())
+    assert verify_aggregates() == []
+    assert 'no stored running totals yet' in capsys.readouterr().out
+
+
+def test_verify_repairs_drift_with_integer_user_ids(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    document = _document()
+    document['aggregates'] = calculate_aggregates(document)
+    document['aggregates']['totals']['loan_paid'] += 5
+    _write_user_file(tmp_path, 7, document)
+    invalidated = []
+    monkeypatch.setattr(financial_db, 'invalidate_user_cache', invalidated.append)
+    assert verify_aggregates(repair=True) == [7]
+    assert invalidated == [7]
+    assert verify_aggregates() == []
+
+
+def _daily(day, gross=10.0):
+    return {'date': day, 'hours_worked': 1.0, 'gross_income': gross}
+
+
+def _assert_index_current(document):
+    expected = build_month_index(document['daily_income_tracker'])
+    index = document['aggregates']['month_index']
+    # Same months, positions and month order as a rebuild
+    assert list(index.items()) == list(expected.items())
+
+
+def test_month_index_follows_every_patch():
+    document = _document()
+    document['aggregates'] = calculate_aggregates(document)
+    patches = [
+        ('append', _daily('2023-12-30')),
+        ('append', _daily('2024-01-20')),
+        ('append', _daily('not a date')),
+        ('update', 0, {'date': '2024-03-01'}),
+        ('update', 1, {'gross_income': 70.0}),
+        ('remove', 0),
+        ('append', _daily('2024-02-14')),
+        ('remove_by_field', 'date', '2024-01-20'),
+        ('update', 0, {'date': '2023-11-11'}),
+    ]
+    for op, *args in patches:
+        if op in ('append', 'update'):
+            args = prepare_patch(op, 'daily_income_tracker', args)
+        assert apply_patch(document, op, 'daily_income_tracker', *args)
+        _assert_index_current(document)
+    assert find_drift(document['aggregates'], calculate_aggregates(document)) == []
+
+
+def test_month_index_patch_leaves_the_original_alone():
+    document = _document()
+    document['aggregates'] = calculate_aggregates(document)
+    before = document['aggregates']['month_index']
+    apply_patch(document, 'remove', 'daily_income_tracker', 0)
+    assert before == {'2024-01': [0], '2024-02': [1]}
+    assert document['aggregates']['month_index'] == {'2024-02': [0]}
+
+
+def test_summary_groups_months_from_the_stored_index():
+    document = _document()
+    aggregates = calculate_aggregates(document)
+    with_index = calculate_summary(document, 0, 10.0, aggregates)
+    without_index = calculate_summary(document, 0, 10.0, dict(aggregates, month_index=None))
+    assert with_index == without_index
+    assert list(with_index['daily_income_by_month']) == ['2024-01', '2024-02']
+
+
+def test_wrong_month_index_is_drift():
+    expected = calculate_aggregates(_document())
+    stored = copy_aggregates(expected)
+    stored['month_index'] = {'2024-01': [1], '2024-02': [0]}
+    assert find_drift(stored, expected) == ['month index']
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from modules import amortization
+
+
+def _cash_flow(*months):
+    return [{'month': month, 'income': 1000.0, 'loan_repayment': 100.0} for month in months]
+
+
+def test_recorded_rows_keep_their_months_across_gaps():
+    settings = {'loan_interest_rate': 6, 'loan_period_months': 24}
+    schedule = amortization.loan_schedule(2000, settings, _cash_flow('2024-01', '2024-02', '2024-06'))
+    recorded = [row.month for row in schedule.rows if row.recorded]
+    assert recorded == ['2024-01', '2024-02', '2024-06']
+    # Projection continues after the last recorded repayment
+    projected = [row for row in schedule.rows if not row.recorded]
+    assert projected[0].month == '2024-07'
+    assert projected[1].month == '2024-08'
+
+
+def test_without_history_projection_starts_this_month():
+    schedule = amortization.loan_schedule(1200, {'loan_interest_rate': 0, 'loan_period_months': 12}, [])
+    assert schedule.rows[0].month == datetime.now().strftime('%Y-%m')
+    assert schedule.months_remaining == 12
+    assert schedule.payoff_month == amortization._add_months(schedule.rows[0].month, 11)
+
+
+def test_first_projected_month_is_part_of_the_memo_key():
+    first = amortization.build_schedule(1200.0, 0.0, 12, '2024-01')
+    later = amortization.build_schedule(1200.0, 0.0, 12, '2025-03')
+    assert first.rows[0].month == '2024-01'
+    assert later.rows[0].month == '2025-03'
+
+
+def test_schedule_pays_off_principal():
+    schedule = amortization.build_schedule(10000.0, 5.0, 36, '2024-01')
+    assert schedule.paid_off
+    assert schedule.months_remaining == 36
+    assert abs(sum(row.principal for row in schedule.rows) - 10000.0) < 1e-6
+    assert schedule.rows[-1].balance == 0.0
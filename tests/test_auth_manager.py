@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+pytest.importorskip('bcrypt')
+pytest.importorskip('flask_login')
+
+from modules import auth_manager
+
+
+@pytest.fixture
+def hash_queue(monkeypatch):
+    """Hash queue of two slots on a private executor; yields a way to fill it with blocked jobs"""
+    monkeypatch.setattr(auth_manager, '_hash_slots', threading.BoundedSemaphore(2))
+    monkeypatch.setattr(auth_manager, '_hash_executor', None)
+    monkeypatch.setattr(auth_manager, 'BCRYPT_ROUNDS', 4)
+    release = threading.Event()
+    futures = []
+
+    def fill(jobs):
+        for _ in range(jobs):
+            futures.append(auth_manager._submit_hash_job('hash_seconds', release.wait, 5))
+
+    yield fill
+    release.set()
+    for future in futures:
+        future.result()
+    auth_manager._hash_executor.shutdown()
+
+
+def test_default_queue_leaves_server_threads_for_page_views():
+    assert 1 <= auth_manager.PASSWORD_HASH_QUEUE_LIMIT < auth_manager.SERVER_THREADS
+
+
+def test_login_is_refused_when_the_queue_is_full(hash_queue):
+    hash_queue(2)
+    with pytest.raises(auth_manager.PasswordHashBusy):
+        auth_manager.check_password('secret', b'$2b$04$' + b'a' * 53)
+    with pytest.raises(auth_manager.PasswordHashBusy):
+        auth_manager.hash_password('secret')
+
+
+def test_jobs_below_the_limit_still_run(hash_queue):
+    hash_queue(1)
+    password_hash = auth_manager.hash_password('secret')
+    assert auth_manager.check_password('secret', password_hash)
+    assert not auth_manager.check_password('wrong', password_hash)
+
+
+def test_create_user_reports_busy(hash_queue):
+    hash_queue(2)
+    success, message = auth_manager.create_user('alice', 'alice@example.com', 'secret')
+    assert not success
+    assert 'try again' in message
@@ -0,0 +1,119 @@
+import copy
+
+import pytest
+
+from modules.change_tracking import FrozenDict, FrozenList, TrackedDocument, freeze, to_plain
+from modules.records import CashFlowRecord, DailyIncomeRecord, ExpenseRecord, Record
+
+
+def _document():
+    return {
+        'profile': {'name': 'Test', 'goal': 'Savings'},
+        'settings': {'tax_rate_percent': 10.0, 'target_currency': 'AUD'},
+        'capital': {
+            'sources': [{'name': 'Parents', 'amount_bdt': 1000}],
+            'expenses_from_capital': [{'name': 'Visa', 'amount': 200.0}]
+        },
+        'monthly_cash_flow': [{'month': '2024-01', 'income': 1000.0, 'loan_repayment': 50.0}],
+        'expenses_from_savings': [],
+        'daily_income_tracker': [{'date': '2024-01-05', 'hours_worked': 8.0, 'gross_income': 100.0}]
+    }
+
+
+def test_freeze_turns_known_entry_shapes_into_records():
+    frozen = freeze(_document())
+    assert isinstance(frozen, FrozenDict)
+    assert isinstance(frozen['monthly_cash_flow'], FrozenList)
+    assert isinstance(frozen['monthly_cash_flow'][0], CashFlowRecord)
+    assert isinstance(frozen['daily_income_tracker'][0], DailyIncomeRecord)
+    assert isinstance(frozen['capital']['expenses_from_capital'][0], ExpenseRecord)
+    # Settings and profile don't match a record shape and stay frozen dicts
+    assert type(frozen['settings']) is FrozenDict
+
+
+def test_freeze_reuses_frozen_values():
+    frozen = freeze(_document())
+    assert freeze(frozen) is frozen
+    assert copy.deepcopy(frozen) is frozen
+
+
+@pytest.mark.parametrize('mutate', [
+    lambda doc: doc.__setitem__('profile', {}),
+    lambda doc: doc.__delitem__('profile'),
+    lambda doc: doc.pop('profile'),
+    lambda doc: doc.update(profile={}),
+    lambda doc: doc.setdefault('new', 1),
+    lambda doc: doc.clear(),
+    lambda doc: doc['settings'].__setitem__('tax_rate_percent', 0),
+])
+def test_frozen_dict_rejects_mutation(mutate):
+    frozen = freeze(_document())
+    with pytest.raises(TypeError):
+        mutate(frozen)
+
+
+def test_frozen_list_and_records_reject_mutation():
+    frozen = freeze(_document())
+    with pytest.raises((TypeError, AttributeError)):
+        frozen['monthly_cash_flow'].append({})
+    with pytest.raises(TypeError):
+        frozen['monthly_cash_flow'][0].income = 0
+
+
+def test_untouched_document_has_no_dirty_sections():
+    document = TrackedDocument(freeze(_document()))
+    assert document['settings']['tax_rate_percent'] == 10.0
+    list(document['daily_income_tracker'])
+    assert document.dirty_sections == set()
+
+
+def test_nested_mutation_marks_only_its_section():
+    document = TrackedDocument(freeze(_document()))
+    document['daily_income_tracker'].append({'date': '2024-01-06', 'hours_worked': 4.0, 'gross_income': 50.0})
+    document['settings']['tax_rate_percent'] = 20.0
+    assert document.dirty_sections == {'daily_income_tracker', 'settings'}
+
+
+def test_entry_edit_through_a_record_copies_it():
+    frozen = freeze(_document())
+    document = TrackedDocument(frozen)
+    document['monthly_cash_flow'][0]['income'] = 2000.0
+    assert document.dirty_sections == {'monthly_cash_flow'}
+    # The frozen (cached) document is unchanged
+    assert frozen['monthly_cash_flow'][0]['income'] == 1000.0
+
+
+def test_nested_capital_expenses_are_their_own_section():
+    document = TrackedDocument(freeze(_document()))
+    document['capital']['expenses_from_capital'].append({'name': 'Rent', 'amount': 500.0})
+    assert document.dirty_sections == {'expenses_from_capital'}
+    document.mark_clean()
+    document['capital']['sources'][0]['amount_bdt'] = 2000
+    assert document.dirty_sections == {'capital'}
+
+
+def test_replacing_a_section_marks_it_and_its_nested_sections():
+    document = TrackedDocument(freeze(_document()))
+    document['capital'] = {'sources': [], 'expenses_from_capital': []}
+    assert document.dirty_sections == {'capital', 'expenses_from_capital'}
+
+
+def test_to_plain_round_trips_to_equal_plain_containers():
+    original = _document()
+    document = TrackedDocument(freeze(original))
+    document['daily_income_tracker'][0]['gross_income'] = 100.0
+    plain = to_plain(document)
+    assert type(plain) is dict
+    assert type(plain['daily_income_tracker']) is list
+    assert type(plain['daily_income_tracker'][0]) is dict
+    # Sections never accessed are shared with the frozen document, not copied
+    assert isinstance(plain['monthly_cash_flow'][0], Record)
+    assert {key: _plain(value) for key, value in plain.items()} == original
+
+
+def _plain(value):
+    if isinstance(value, (dict, Record)):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
@@ -0,0 +1,204 @@
+"""
+Rate client against a local stub HTTP server: retries with backoff, timeouts,
+the circuit breaker and the last-known-good fallback
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from modules import exchange_rate_api
+from modules.cache import create_cache_backend
+from modules.exchange_rate_api import CircuitBreaker, ExchangeRateAPI
+
+RATES = {'AUD': 0.0127, 'USD': 0.0091}
+
+
+class StubRateServer(ThreadingHTTPServer):
+    """Serves /<base> rate tables; responses follow a script of statuses (then 200)"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubRateHandler)
+        self.responses = []  # status codes (or 'slow') for the next requests
+        self.delay = 0.5
+        self.hits = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class StubRateHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.hits += 1
+        status = server.responses.pop(0) if server.responses else 200
+        if status == 'slow':
+            time.sleep(server.delay)
+            status = 200
+        body = json.dumps({'base': self.path.strip('/'), 'rates': RATES}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub():
+    server = StubRateServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(stub, monkeypatch):
+    """ExchangeRateAPI pointed at the stub, with a fresh breaker and rate cache and no real sleeping"""
+    monkeypatch.setattr(ExchangeRateAPI, 'BASE_URL', stub.url)
+    monkeypatch.setattr(ExchangeRateAPI, '_session', None)
+    monkeypatch.setattr(ExchangeRateAPI, '_breaker', CircuitBreaker(threshold=2, cooldown=60))
+    monkeypatch.setattr(exchange_rate_api, '_rate_cache', create_cache_backend('memory', namespace='test_rates'))
+    monkeypatch.setattr(exchange_rate_api, 'EXCHANGE_RATE_RETRIES', 2)
+    monkeypatch.setattr(exchange_rate_api, 'EXCHANGE_RATE_READ_TIMEOUT', 0.2)
+    backoffs = []
+    # The jitter is drawn from [0, cap]; recording the caps shows the exponential backoff
+    monkeypatch.setattr(exchange_rate_api.random, 'uniform', lambda low, high: backoffs.append(high) or 0)
+    ExchangeRateAPI.backoffs = backoffs
+    yield ExchangeRateAPI
+    del ExchangeRateAPI.backoffs
+
+
+def test_fetch_rates(client, stub):
+    result = client.fetch_rates('BDT', ['AUD', 'XYZ'])
+    assert result['success']
+    assert result['rates'] == {'AUD': 0.0127}
+    assert result['missing'] == ['XYZ']
+    assert stub.hits == 1
+
+
+def test_retries_server_errors_with_exponential_backoff(client, stub):
+    stub.responses = [503, 502]
+    result = client.fetch_rates('BDT')
+    assert result['success']
+    assert stub.hits == 3
+    assert client.backoffs == [
+        exchange_rate_api.RETRY_BACKOFF_BASE,
+        exchange_rate_api.RETRY_BACKOFF_BASE * 2
+    ]
+    assert client._breaker.state == 'closed'
+
+
+def test_gives_up_after_the_retries(client, stub):
+    stub.responses = [500, 500, 500, 500]
+    result = client.fetch_rates('BDT')
+    assert not result['success']
+    assert '500' in result['error']
+    assert stub.hits == 3
+
+
+def test_client_errors_are_not_retried(client, stub):
+    stub.responses = [404]
+    result = client.fetch_rates('BDT')
+    assert not result['success']
+    assert stub.hits == 1
+    # The upstream answered, so it doesn't count against the breaker
+    assert client._breaker.failures == 0
+
+
+def test_read_timeout_is_retried_then_reported(client, stub):
+    stub.responses = ['slow', 'slow', 'slow']
+    start = time.monotonic()
+    result = client.fetch_rates('BDT')
+    assert not result['success']
+    assert 'timed out' in result['error']
+    assert stub.hits == 3
+    # Three reads cut off at the read timeout, not three full slow responses
+    assert time.monotonic() - start < 3 * stub.delay
+
+
+def test_breaker_opens_and_fails_fast(client, stub):
+    stub.responses = [500] * 6
+    client.fetch_rates('BDT')
+    assert client._breaker.state == 'closed'
+    client.fetch_rates('BDT')
+    assert client._breaker.state == 'open'
+
+    hits = stub.hits
+    result = client.fetch_rates('BDT')
+    assert not result['success']
+    assert 'circuit open' in result['error']
+    assert stub.hits == hits
+
+
+def test_breaker_half_opens_after_the_cooldown(client, stub):
+    breaker = client._breaker
+    breaker.cooldown = 0.1
+    stub.responses = [500] * 6
+    client.fetch_rates('BDT')
+    client.fetch_rates('BDT')
+    assert breaker.state == 'open'
+
+    time.sleep(0.15)
+    assert breaker.state == 'half-open'
+    # A failed trial reopens the circuit
+    stub.responses = [500] * 3
+    assert not client.fetch_rates('BDT')['success']
+    assert breaker.state == 'open'
+
+    time.sleep(0.15)
+    # A successful trial closes it
+    assert client.fetch_rates('BDT')['success']
+    assert breaker.state == 'closed'
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0)
+    breaker.record_failure()
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_get_rates_serves_last_known_good_when_upstream_fails(client, stub):
+    first = client.get_rates('BDT', ['AUD'])
+    assert first['success'] and not first['stale']
+
+    # Expire the cached table and break the upstream
+    exchange_rate_api._rate_cache.delete('rates:BDT')
+    stub.responses = [500] * 3
+    result = client.get_rates('BDT', ['AUD'])
+    assert result['success']
+    assert result['stale']
+    assert result['rates'] == {'AUD': 0.0127}
+
+
+def test_last_known_good_is_served_without_upstream_calls_while_open(client, stub):
+    client.get_rates('BDT')
+    exchange_rate_api._rate_cache.delete('rates:BDT')
+    stub.responses = [500] * 6
+    client.fetch_rates('BDT')
+    client.fetch_rates('BDT')
+    assert client._breaker.state == 'open'
+
+    hits = stub.hits
+    result = client.refresh_rates('BDT')
+    assert result['success'] and result['stale']
+    assert stub.hits == hits
+
+
+def test_get_rates_without_last_known_good_reports_the_error(client, stub):
+    stub.responses = [500] * 3
+    result = client.get_rates('BDT')
+    assert not result['success']
+    assert '500' in result['error']
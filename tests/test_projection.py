@@ -0,0 +1,133 @@
+import importlib
+import math
+import os
+import random
+
+import pytest
+
+from modules import amortization, projection
+
+
+def _inputs(months=12, **overrides):
+    values = dict(
+        start_month='2024-01',
+        net_savings=5000.0,
+        remaining_capital=2000.0,
+        income_mean=tuple(1000.0 + 10 * step for step in range(months)),
+        income_std=150.0,
+        loan_payments=(200.0,) * months,
+        rate_drift=0.001,
+        rate_volatility=0.02
+    )
+    values.update(overrides)
+    return projection.ProjectionInputs(**values)
+
+
+def test_fit_trend_recovers_a_line():
+    intercept, slope, std = projection.fit_trend([3.0 + 2.0 * x for x in range(6)])
+    assert intercept == pytest.approx(3.0)
+    assert slope == pytest.approx(2.0)
+    assert std == pytest.approx(0.0, abs=1e-9)
+
+
+def test_fit_trend_short_series():
+    assert projection.fit_trend([]) == (0.0, 0.0, 0.0)
+    assert projection.fit_trend([42.0]) == (42.0, 0.0, 0.0)
+    assert projection.fit_trend([1.0, 3.0]) == (pytest.approx(1.0), pytest.approx(2.0), 0.0)
+
+
+def test_fit_trend_residual_spread():
+    values = [10.0, 12.0, 10.0, 12.0]
+    intercept, slope, std = projection.fit_trend(values)
+    residuals = [y - (intercept + slope * x) for x, y in enumerate(values)]
+    assert std == pytest.approx(math.sqrt(sum(r * r for r in residuals) / 2))
+
+
+def test_inputs_follow_the_daily_income_trend():
+    by_month = {
+        '2024-03': {'total_net': 1200.0},
+        '2024-01': {'total_net': 1000.0},
+        '2024-02': {'total_net': 1100.0},
+    }
+    inputs = projection.projection_inputs(by_month, [], 5000, 2000, None, {}, months=3)
+    assert inputs.start_month == '2024-04'
+    assert inputs.income_mean == pytest.approx((1300.0, 1400.0, 1500.0))
+    assert inputs.income_std == 0.0
+    assert inputs.loan_payments == (0.0, 0.0, 0.0)
+    assert inputs.rate_volatility == projection.DEFAULT_RATE_VOLATILITY_PERCENT / 100
+
+
+def test_inputs_fall_back_to_cash_flow_and_use_settings():
+    cash_flow = [{'month': '2024-05', 'income': 800.0, 'loan_repayment': 100.0},
+                 {'month': '2024-06', 'income': 800.0, 'loan_repayment': 100.0}]
+    schedule = amortization.build_schedule(1200.0, 0.0, 12, '2024-07', payment=100.0)
+    settings = {'projection_rate_drift_percent': 1, 'projection_rate_volatility_percent': 5}
+    inputs = projection.projection_inputs({}, cash_flow, 0, 0, schedule, settings, months=15)
+    assert inputs.start_month == '2024-07'
+    assert inputs.income_mean == pytest.approx((800.0,) * 15)
+    # Twelve scheduled payments, then nothing left to repay
+    assert inputs.loan_payments == pytest.approx((100.0,) * 12 + (0.0,) * 3)
+    assert inputs.rate_drift == pytest.approx(0.01)
+    assert inputs.rate_volatility == pytest.approx(0.05)
+
+
+def test_same_seed_gives_the_same_result():
+    inputs = _inputs()
+    assert projection.run_projection(inputs, 3000, seed=7) == projection.run_projection(inputs, 3000, seed=7)
+
+
+def test_python_percentiles_match_numpy():
+    np = pytest.importorskip('numpy')
+    rng = random.Random(3)
+    values = sorted(rng.gauss(0, 1) for _ in range(101))
+    for percent in projection.PERCENTILES:
+        assert projection._percentile(values, percent) == pytest.approx(np.percentile(values, percent))
+
+
+def test_numpy_and_python_batches_agree(monkeypatch):
+    pytest.importorskip('numpy')
+    inputs = _inputs()
+    with_numpy = projection.run_projection(inputs, 4000, seed=1)
+    monkeypatch.setattr(projection, 'HAS_NUMPY', False)
+    monkeypatch.setattr(projection, 'IN_PROCESS_PYTHON_MAX_PATHS', 4000)
+    plain = projection.run_projection(inputs, 4000, seed=1)
+    assert plain['months'] == with_numpy['months']
+    assert plain['paths'] == with_numpy['paths'] == 4000
+    # Different random generators, so the bands agree statistically, not exactly
+    for band in ('p5', 'p50', 'p95'):
+        assert plain['percentiles'][band][-1] == pytest.approx(with_numpy['percentiles'][band][-1], rel=0.03)
+    assert plain['mean'][-1] == pytest.approx(with_numpy['mean'][-1], rel=0.01)
+
+
+def test_in_process_simulation_is_capped(monkeypatch):
+    monkeypatch.setattr(projection, '_executor', None)
+    monkeypatch.setattr(projection, 'IN_PROCESS_MAX_PATHS', 300)
+    monkeypatch.setattr(projection, 'IN_PROCESS_PYTHON_MAX_PATHS', 100)
+    inputs = _inputs(months=3)
+    expected = 300 if projection.HAS_NUMPY else 100
+    assert projection.run_projection(inputs, projection.MAX_PATHS)['paths'] == expected
+    monkeypatch.setattr(projection, 'HAS_NUMPY', False)
+    assert projection.run_projection(inputs, projection.MAX_PATHS)['paths'] == 100
+
+
+@pytest.fixture
+def app_client(tmp_path, monkeypatch):
+    pytest.importorskip('flask')
+    pytest.importorskip('flask_login')
+    pytest.importorskip('waitress')
+    # The app creates its SQLite database and user files under the working directory
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data', exist_ok=True)
+    main = importlib.import_module('main')
+    main.app.config['TESTING'] = True
+    return main.app.test_client()
+
+
+def test_guest_projection_is_capped(app_client):
+    app_client.get('/guest')
+    response = app_client.get('/api/projection?months=120&paths=50000')
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['success']
+    assert result['paths'] <= projection.GUEST_MAX_PATHS
+    assert len(result['months']) == projection.GUEST_MAX_MONTHS
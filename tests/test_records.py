@@ -0,0 +1,83 @@
+import copy
+import json
+import pickle
+
+import pytest
+
+from modules.change_tracking import freeze
+from modules.records import (
+    CashFlowRecord, DailyIncomeRecord, ExpenseRecord, SourceRecord, json_default, to_record
+)
+
+
+@pytest.mark.parametrize('entry, record_type', [
+    ({'date': '2024-01-05', 'hours_worked': 8.0, 'gross_income': 100.0}, DailyIncomeRecord),
+    ({'date': '2024-01-05', 'hours_worked': 8.0, 'gross_income': 100.0, 'month_key': '2024-01'}, DailyIncomeRecord),
+    ({'date': '2024-01-05', 'hours_worked': 8.0, 'gross_income': 100.0, 'currency': 'AUD'}, DailyIncomeRecord),
+    ({'month': '2024-01', 'income': 1000.0, 'loan_repayment': 50.0}, CashFlowRecord),
+    ({'month': '2024-01', 'income': 1000.0, 'loan_repayment': 50.0, 'currency': 'USD'}, CashFlowRecord),
+    ({'name': 'Visa', 'amount': 200.0}, ExpenseRecord),
+    ({'name': 'Parents', 'amount_bdt': 1000}, SourceRecord),
+])
+def test_known_shapes_become_records(entry, record_type):
+    record = to_record(entry)
+    assert type(record) is record_type
+    assert dict(record) == entry
+    assert len(record) == len(entry)
+
+
+@pytest.mark.parametrize('entry', [
+    {'month': '2024-01', 'income': 1000.0},                       # missing a required field
+    {'name': 'Visa', 'amount': 200.0, 'note': 'extra'},           # unknown field
+    {'name': 'Visa', 'amount': [200.0]},                          # nested value
+    {},
+])
+def test_other_shapes_stay_dicts(entry):
+    assert to_record(entry) is None
+
+
+def test_record_reads_like_a_dict():
+    record = to_record({'date': '2024-01-05', 'hours_worked': 8.0, 'gross_income': 100.0})
+    assert record['gross_income'] == 100.0
+    assert record.gross_income == 100.0
+    assert record.get('month_key') is None
+    assert 'month_key' not in record
+    assert list(record) == ['date', 'hours_worked', 'gross_income']
+    with pytest.raises(KeyError):
+        record['month_key']
+    with pytest.raises(KeyError):
+        record['not_a_field']
+
+
+def test_record_is_read_only():
+    record = to_record({'name': 'Visa', 'amount': 200.0})
+    with pytest.raises(TypeError):
+        record.amount = 0
+    with pytest.raises(TypeError):
+        del record.amount
+    with pytest.raises(TypeError):
+        record['amount'] = 0
+    assert copy.copy(record) is record
+    assert copy.deepcopy(record) is record
+
+
+def test_record_pickles():
+    record = to_record({'month': '2024-01', 'income': 1000.0, 'loan_repayment': 50.0, 'currency': 'AUD'})
+    restored = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+    assert type(restored) is CashFlowRecord
+    assert restored == record
+
+
+def test_frozen_document_round_trips_through_json():
+    document = {
+        'settings': {'tax_rate_percent': 10.0},
+        'monthly_cash_flow': [{'month': '2024-01', 'income': 1000.0, 'loan_repayment': 50.0}],
+        'daily_income_tracker': [{'date': '2024-01-05', 'hours_worked': 8.0, 'gross_income': 100.0}],
+        'capital': {'sources': [{'name': 'Parents', 'amount_bdt': 1000}], 'expenses_from_capital': []}
+    }
+    assert json.loads(json.dumps(freeze(document), default=json_default)) == document
+
+
+def test_json_default_rejects_other_objects():
+    with pytest.raises(TypeError):
+        json.dumps({'value': object()}, default=json_default)
@@ -0,0 +1,67 @@
+"""
+The NumPy engine must give exactly the results of the pure Python engine.
+tests/data/calculation_corpus.json holds randomized documents (invalid dates,
+stored and missing month keys, empty sections, amounts with long fractions),
+regenerated from a fixed seed by tests/data/generate_calculation_corpus.py
+"""
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from modules import calculations
+from modules import vector_calculations
+from modules.aggregates import calculate_aggregates
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'calculation_corpus.json')
+
+with open(CORPUS_PATH, 'r') as f:
+    CORPUS = json.load(f)
+
+CASES = [pytest.param(case, id=f"doc{index}") for index, case in enumerate(CORPUS)]
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_summary_matches_python_engine(case):
+    document = case['document']
+    expected = calculations.calculate_summary(document, case['total_capital'], case['tax_rate_percent'])
+    actual = vector_calculations.calculate_summary(
+        vector_calculations.build_columns(document), case['total_capital'], case['tax_rate_percent']
+    )
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        assert actual[key] == expected[key], key
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_summary_from_aggregates_matches_python_engine(case):
+    document = case['document']
+    aggregates = calculate_aggregates(document)
+    expected = calculations.calculate_summary(
+        document, case['total_capital'], case['tax_rate_percent'], aggregates
+    )
+    actual = vector_calculations.calculate_summary(
+        vector_calculations.build_columns(document), case['total_capital'], case['tax_rate_percent'], aggregates
+    )
+    assert actual == expected
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_daily_income_by_month_matches_python_engine(case):
+    daily_entries = case['document']['daily_income_tracker']
+    expected = calculations.calculate_daily_income_by_month(daily_entries, case['tax_rate_percent'])
+    actual = vector_calculations.calculate_daily_income_by_month(
+        vector_calculations.build_columns(case['document']), case['tax_rate_percent']
+    )
+    # Same months in the same order, with the same entries and totals
+    assert list(actual) == list(expected)
+    assert actual == expected
+
+
+@pytest.mark.parametrize('case', CASES[:10])
+def test_compare_engines_reports_no_mismatches(case):
+    assert vector_calculations.compare_engines(
+        case['document'], case['total_capital'], case['tax_rate_percent']
+    ) == []